@@ -9,4 +9,13 @@ tasks_collection = db.tasks
 users_collection = db.users
 notifications_collection = db.notifications
 backups_collection = db.backups
-logs_collection = db.logs  
\ No newline at end of file
+logs_collection = db.logs
+task_stats_collection = db.task_stats
+counters_collection = db.counters
+task_tombstones_collection = db.task_tombstones
+task_slots_collection = db.task_slots
+dead_letter_tasks_collection = db.dead_letter_tasks
+task_partitions_collection = db.task_partitions
+task_workers_collection = db.task_workers
+user_jobs_collection = db.user_jobs
+task_change_writers_collection = db.task_change_writers
\ No newline at end of file
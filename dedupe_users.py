@@ -0,0 +1,54 @@
+import argparse
+import asyncio
+from datetime import datetime, timezone
+from typing import List
+from bson import ObjectId
+from database import users_collection, user_jobs_collection
+from user_store import INTERNAL_USER_FIELDS, backfill_user_keys, ensure_user_indexes, user_deletion_job
+
+# Grupe korisnika s istim normaliziranim ključem (email_key ili username_key), najstariji prvi
+async def find_duplicates(field: str) -> List[List[ObjectId]]:
+    pipeline = [
+        {"$group": {"_id": f"${field}", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ]
+    return [sorted(group["ids"]) async for group in users_collection.aggregate(pipeline, allowDiskUse=True)]
+
+# Razrješavanje duplikata koji sprječavaju izgradnju jedinstvenih indeksa: zadržava se najstariji
+# korisnik, a ostali se brišu uz posao koji njihove zadatke prebacuje na zadržanog korisnika i briše
+# obavijesti. Poslove izvodi user_service kao prekinute poslove (resume_user_jobs). Bez --apply
+# samo se ispisuje što bi se promijenilo. Vraća broj (za brisanje) pronađenih duplikata.
+async def dedupe_users(apply: bool) -> int:
+    await backfill_user_keys()
+    duplicates = 0
+    for field in INTERNAL_USER_FIELDS:
+        for ids in await find_duplicates(field):
+            kept, removed = ids[0], ids[1:]
+            duplicates += len(removed)
+            print(f"{field}: keeping {kept}, removing {', '.join(str(user_id) for user_id in removed)}", flush=True)
+            if not apply:
+                continue
+            jobs = [user_deletion_job(str(user_id), str(kept), None) for user_id in removed]
+            # Posao bez vlasnika odmah se smatra prekinutim pa ga preuzima prva provjera prekinutih poslova
+            for job in jobs:
+                job["updated_at"] = datetime.fromtimestamp(0, timezone.utc)
+            # Poslovi se upisuju prije brisanja korisnika (posao i sam dovršava brisanje korisnika)
+            await user_jobs_collection.insert_many(jobs)
+            await users_collection.delete_many({"_id": {"$in": removed}})
+    if apply:
+        missing = await ensure_user_indexes()
+        if missing:
+            print(f"Unique indexes still missing on {', '.join(missing)}", flush=True)
+        else:
+            print("Unique user indexes created; restart user_service to stop duplicate pre-checks", flush=True)
+    print(f"{duplicates} duplicate users {'removed' if apply else 'found'}", flush=True)
+    return duplicates
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Resolve duplicate users that block the unique email/username indexes")
+    parser.add_argument("--apply", action="store_true", help="Delete duplicates and reassign their tasks (default: dry run)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(dedupe_users(args.apply))
@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+from typing import Dict, Iterator, List, Optional
+from models import TaskStatus
+
+# Udio statusa u generiranim zadacima (svi statusi iz TaskStatus). Kod upisa u bazu task_store
+# zadatke sa statusom scheduled bez budućeg run_at i blocked bez ovisnosti upisuje kao pending.
+STATUS_WEIGHTS = {
+    TaskStatus.pending: 40,
+    TaskStatus.completed: 35,
+    TaskStatus.in_progress: 10,
+    TaskStatus.failed: 5,
+    TaskStatus.scheduled: 5,
+    TaskStatus.blocked: 5
+}
+
+# Zadani početak za run_at zakazanih zadataka; fiksan kako bi isti seed uvijek dao isti skup podataka
+DEFAULT_START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+# Broj obavijesti po zadatku i njihove težine
+NOTIFICATION_COUNT_WEIGHTS = {0: 30, 1: 45, 2: 20, 3: 5}
+
+def load_templates(path: str) -> List[dict]:
+    with open(path, encoding="utf-8") as template_file:
+        return json.load(template_file)
+
+# Zipfova razdioba skraćena na 1..max_value, uzorkovana preko kumulativnih težina
+class ZipfSampler:
+    def __init__(self, exponent: float, max_value: int):
+        self.cumulative = list(accumulate(1 / rank ** exponent for rank in range(1, max_value + 1)))
+
+    def sample(self, rng: random.Random) -> int:
+        return bisect_left(self.cumulative, rng.random() * self.cumulative[-1]) + 1
+
+# Generator skupa podataka; svaki tok (korisnici, zadaci, obavijesti) ima vlastiti RNG izveden iz seeda,
+# pa je izlaz isti za isti seed i početni trenutak (run_at zakazanih zadataka) bez obzira na redoslijed tokova
+class DatasetGenerator:
+    def __init__(
+        self, users: int, seed: int, zipf_exponent: float, max_tasks_per_user: int,
+        user_templates: List[dict], task_templates: List[dict], start: datetime
+    ):
+        self.users = users
+        self.seed = seed
+        self.sampler = ZipfSampler(zipf_exponent, max_tasks_per_user)
+        self.user_templates = user_templates
+        self.task_templates = task_templates
+        self.start = start
+
+    def rng(self, stream: str) -> random.Random:
+        return random.Random(f"{self.seed}:{stream}")
+
+    def username(self, index: int) -> str:
+        template = self.user_templates[index % len(self.user_templates)]
+        return f"{template['username']}_{index}"
+
+    def generate_users(self) -> Iterator[dict]:
+        for index in range(self.users):
+            template = self.user_templates[index % len(self.user_templates)]
+            local, _, domain = template["email"].partition("@")
+            yield {"username": self.username(index), "email": f"{local}.{index}@{domain}"}
+
+    # Zadaci se korisniku pridjeljuju preko username (import_data ga razrješava u user_id)
+    def generate_tasks(self) -> Iterator[dict]:
+        rng = self.rng("tasks")
+        counts_rng = self.rng("counts")
+        statuses = list(STATUS_WEIGHTS)
+        cumulative = list(accumulate(STATUS_WEIGHTS.values()))
+        for index in range(self.users):
+            username = self.username(index)
+            for number in range(self.sampler.sample(counts_rng)):
+                template = rng.choice(self.task_templates)
+                status = rng.choices(statuses, cum_weights=cumulative)[0]
+                task = {
+                    "title": f"{template['title']} #{number + 1}",
+                    "description": template["description"],
+                    "status": status.value,
+                    "username": username,
+                    "priority": rng.choices([0, 1, 2, 3], weights=[70, 20, 8, 2])[0]
+                }
+                if status == TaskStatus.scheduled:
+                    task["run_at"] = (self.start + timedelta(minutes=rng.randint(1, 60 * 24 * 30))).isoformat()
+                yield task
+
+    def generate_notifications(self) -> Iterator[dict]:
+        rng = self.rng("notifications")
+        counts = list(NOTIFICATION_COUNT_WEIGHTS)
+        cumulative = list(accumulate(NOTIFICATION_COUNT_WEIGHTS.values()))
+        for task in self.generate_tasks():
+            for number in range(rng.choices(counts, cum_weights=cumulative)[0]):
+                message = f"Novi zadatak kreiran: {task['title']}" if number == 0 else f"Zadatak ažuriran: {task['title']}"
+                yield {
+                    "username": task["username"],
+                    "message": message,
+                    "read": task["status"] == TaskStatus.completed.value or rng.random() < 0.3
+                }
+
+    def streams(self) -> Dict[str, Iterator[dict]]:
+        return {
+            "users": self.generate_users(),
+            "tasks": self.generate_tasks(),
+            "notifications": self.generate_notifications()
+        }
+
+def write_ndjson(generator: DatasetGenerator, output_dir: str):
+    os.makedirs(output_dir, exist_ok=True)
+    for name, records in generator.streams().items():
+        path = os.path.join(output_dir, f"{name}.ndjson")
+        count = 0
+        with open(path, "w", encoding="utf-8") as output:
+            for record in records:
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+        print(f"Wrote {count} {name} to {path}", flush=True)
+
+# Izravni upis u MongoDB iz database.py preko import_data (korisnici prvi, zbog razrješavanja username)
+async def load_into_mongo(generator: DatasetGenerator, batch_size: int, concurrency: int):
+    from import_data import import_records
+    from task_store import change_seq_writer
+    try:
+        for name, records in generator.streams().items():
+            print(f"Loading {name}...", flush=True)
+            await import_records(name, records, batch_size, concurrency)
+    finally:
+        await change_seq_writer.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a synthetic users/tasks/notifications dataset for scale testing")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--zipf-exponent", type=float, default=1.2)
+    parser.add_argument("--max-tasks-per-user", type=int, default=5000)
+    parser.add_argument("--user-templates", default="users.json")
+    parser.add_argument("--task-templates", default="tasks.json")
+    parser.add_argument("--start", help="ISO time that run_at of scheduled tasks is offset from (default: 2025-01-01 00:00 UTC)")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--output-dir", help="Write users/tasks/notifications as NDJSON files")
+    target.add_argument("--load", action="store_true", help="Load directly into MongoDB via import_data")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    return parser.parse_args()
+
+def start_time(value: Optional[str]) -> datetime:
+    if value is None:
+        return DEFAULT_START
+    start = datetime.fromisoformat(value)
+    return start if start.tzinfo is not None else start.replace(tzinfo=timezone.utc)
+
+if __name__ == "__main__":
+    args = parse_args()
+    dataset = DatasetGenerator(
+        args.users, args.seed, args.zipf_exponent, args.max_tasks_per_user,
+        load_templates(args.user_templates), load_templates(args.task_templates), start_time(args.start)
+    )
+    if args.load:
+        asyncio.run(load_into_mongo(dataset, args.batch_size, args.concurrency))
+    else:
+        write_ndjson(dataset, args.output_dir)
@@ -6,12 +6,13 @@ import logging
 from database import logs_collection  # Uvjerite se da je pravilno postavljen
 from datetime import datetime, timezone
 import json
+from logging_config import setup_logging
 
 with open("config.json") as config_file:
     config = json.load(config_file)
 
-# Postavljanje logiranja
-logging.basicConfig(level=logging.INFO)
+# Postavljanje logiranja (JSON zapisi kroz red, pisanje u pozadinskoj dretvi)
+setup_logging("health_check_service", config["log_level"], config["log_sampling"])
 logger = logging.getLogger(__name__)
 
 app = FastAPI()
@@ -52,11 +53,11 @@ async def check_service(service_name: str, service_url: str):
     except (httpx.RequestError, httpx.HTTPStatusError) as exc:
         service_status[service_name] = {"status": "DOWN"}
         await log_event(f"Service {service_name} is DOWN. Error: {exc}", "ERROR")
-        logger.error(f"Service {service_name} is DOWN. Error: {exc}")
+        logger.error("Service %s is DOWN. Error: %s", service_name, exc)
     except Exception as exc:
         service_status[service_name] = {"status": "ERROR", "details": str(exc)}
         await log_event(f"Service {service_name} encountered an unexpected error: {exc}", "ERROR")
-        logger.error(f"Unexpected error for service {service_name}: {exc}")
+        logger.error("Unexpected error for service %s: %s", service_name, exc)
 
 # Funkcija koja se izvršava u pozadini
 async def periodic_health_check():
@@ -86,4 +87,5 @@ async def startup_event():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host=health_check_service_host, port=health_check_service_port)
+    # log_config=None: uvicorn ne postavlja vlastite handlere, zapisi idu kroz setup_logging
+    uvicorn.run(app, host=health_check_service_host, port=health_check_service_port, log_config=None)
@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import json
+import time
+from itertools import cycle
+from typing import Iterable, Iterator, List, Optional, TextIO
+from bson import ObjectId
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+from database import users_collection, notifications_collection
+from task_store import insert_task, insert_tasks, change_seq_writer
+from models import Task, User, Notification, user_keys
+from user_store import ensure_user_indexes
+
+# Veličina bloka koji se čita iz datoteke
+READ_CHUNK_SIZE = 1 << 16
+
+# Najveći element JSON niza (znakova); element koji se ni s toliko podataka ne može parsirati je
+# neispravan, pa se uvoz prekida umjesto da se ostatak datoteke gomila u međuspremniku
+MAX_ELEMENT_SIZE = 16 << 20
+
+# Inkrementalno čitanje JSON niza objekata: raw_decode parsira jedan po jedan element iz
+# međuspremnika, pa u memoriji nikad nije cijela datoteka
+def iter_json_array(stream: TextIO) -> Iterator[dict]:
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    # Broj znakova datoteke ispred početka međuspremnika (za položaj greške)
+    offset = 0
+    started = False
+    finished = False
+    error: Optional[json.JSONDecodeError] = None
+    for chunk in iter(lambda: stream.read(READ_CHUNK_SIZE), ""):
+        offset += position
+        buffer = buffer[position:] + chunk
+        position = 0
+        while not finished:
+            while position < len(buffer) and (buffer[position].isspace() or (started and buffer[position] == ",")):
+                position += 1
+            if position >= len(buffer):
+                break
+            if not started:
+                if buffer[position] != "[":
+                    raise ValueError("Expected a JSON array")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                finished = True
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                if len(buffer) - position > MAX_ELEMENT_SIZE:
+                    raise ValueError(f"Malformed JSON element at offset {offset + position}: {e.msg}")
+                # Element se nastavlja u sljedećem bloku
+                error = e
+                break
+            error = None
+            yield item
+        if finished:
+            return
+    if error is not None:
+        raise ValueError(f"Malformed JSON element at offset {offset + position}: {error.msg}")
+    raise ValueError("Unexpected end of JSON array")
+
+def iter_ndjson(stream: TextIO) -> Iterator[dict]:
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+# Format se prepoznaje prema prvom znaku datoteke ('[' za JSON niz, inače NDJSON)
+def iter_records(stream: TextIO, file_format: str) -> Iterator[dict]:
+    if file_format == "auto":
+        first = ""
+        while not first.strip():
+            first = stream.read(1)
+            if not first:
+                return iter([])
+        stream.seek(0)
+        file_format = "json" if first == "[" else "ndjson"
+    return iter_json_array(stream) if file_format == "json" else iter_ndjson(stream)
+
+class ImportStats:
+    def __init__(self):
+        self.read = 0
+        self.inserted = 0
+        self.invalid = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+
+    def skip_invalid(self, reason):
+        self.invalid += 1
+        if self.invalid <= 10:
+            print(f"Invalid record skipped: {reason}", flush=True)
+
+    def report(self, final: bool = False):
+        elapsed = time.monotonic() - self.started_at
+        rate = self.inserted / elapsed if elapsed else 0.0
+        label = "Imported" if final else "Progress:"
+        print(
+            f"{label} read={self.read} inserted={self.inserted} invalid={self.invalid} "
+            f"failed={self.failed} elapsed={elapsed:.1f}s rate={rate:.0f} records/s",
+            flush=True
+        )
+
+# Pridjeljivanje korisnika zadacima i obavijestima: postojeći user_id, username iz zapisa,
+# fiksni --user-id ili kružna raspodjela po postojećim korisnicima (--assign-users)
+class UserResolver:
+    def __init__(self, user_id: Optional[str], assign_users: bool):
+        self.user_id = user_id
+        self.assign_users = assign_users
+        self.by_username = {}
+        self.known_users = set()
+        self.assigned = None
+
+    async def prepare(self):
+        if self.assign_users:
+            user_ids = [str(user["_id"]) async for user in users_collection.find({}, {"_id": 1}).sort("_id", 1)]
+            if not user_ids:
+                raise SystemExit("No users to assign tasks to")
+            self.known_users.update(user_ids)
+            self.assigned = cycle(user_ids)
+
+    # Korisnička imena i ID-evi korisnika iz serije provjeravaju se s po jednim $in upitom, a
+    # pronađeni se pamte. Vraća zapise kojima je pridijeljen postojeći korisnik; zapis bez korisnika,
+    # s neispravnim user_id ili s nepostojećim korisnikom broji se kao neispravan.
+    async def resolve(self, records: List[dict], stats: ImportStats) -> List[dict]:
+        usernames = {
+            record["username"].strip().lower() for record in records
+            if not record.get("user_id") and record.get("username")
+        } - set(self.by_username)
+        if usernames:
+            async for user in users_collection.find({"username_key": {"$in": list(usernames)}}, {"username_key": 1}):
+                self.by_username[user["username_key"]] = str(user["_id"])
+                self.known_users.add(str(user["_id"]))
+        assigned = []
+        for record in records:
+            username = record.pop("username", None)
+            if record.get("user_id"):
+                pass
+            elif username:
+                record["user_id"] = self.by_username.get(username.strip().lower())
+                if record["user_id"] is None:
+                    stats.skip_invalid(f"unknown username {username!r}")
+                    continue
+            elif self.user_id:
+                record["user_id"] = self.user_id
+            elif self.assigned is not None:
+                record["user_id"] = next(self.assigned)
+            else:
+                stats.skip_invalid("missing user_id")
+                continue
+            if not isinstance(record["user_id"], str) or not ObjectId.is_valid(record["user_id"]):
+                stats.skip_invalid(f"invalid user_id {record['user_id']!r}")
+                continue
+            record["user_id"] = str(ObjectId(record["user_id"]))
+            assigned.append(record)
+        user_ids = {record["user_id"] for record in assigned} - self.known_users
+        if user_ids:
+            async for user in users_collection.find({"_id": {"$in": [ObjectId(user_id) for user_id in user_ids]}}, {"_id": 1}):
+                self.known_users.add(str(user["_id"]))
+        resolved = []
+        for record in assigned:
+            if record["user_id"] not in self.known_users:
+                stats.skip_invalid(f"unknown user_id {record['user_id']!r}")
+                continue
+            resolved.append(record)
+        return resolved
+
+def validate_batch(kind: str, records: List[dict], stats: ImportStats) -> List[dict]:
+    model = {"tasks": Task, "users": User, "notifications": Notification}[kind]
+    documents = []
+    for record in records:
+        try:
+            document = model(**record).dict()
+        except (ValidationError, TypeError) as e:
+            stats.skip_invalid(e)
+            continue
+        if kind == "users":
+            document.update(user_keys(document["username"], document["email"]))
+        documents.append(document)
+    return documents
+
+async def insert_many_unordered(collection, documents: List[dict]) -> int:
+    try:
+        result = await collection.insert_many(documents, ordered=False)
+        return len(result.inserted_ids)
+    except BulkWriteError as e:
+        return e.details.get("nInserted", 0)
+
+async def write_batch(kind: str, records: List[dict], resolver: UserResolver, stats: ImportStats):
+    if kind in ("tasks", "notifications"):
+        records = await resolver.resolve(records, stats)
+    documents = validate_batch(kind, records, stats)
+    if kind == "tasks":
+        # Zadaci s ovisnostima trebaju provjeru ovisnosti pa se upisuju pojedinačno
+        dependent = [document for document in documents if document.get("depends_on")]
+        inserted = await insert_tasks([document for document in documents if not document.get("depends_on")])
+        for document in dependent:
+            try:
+                await insert_task(document)
+                inserted += 1
+            except ValueError as e:
+                print(f"Task with invalid dependencies skipped: {e}", flush=True)
+    elif kind == "users":
+        inserted = await insert_many_unordered(users_collection, documents) if documents else 0
+    else:
+        inserted = await insert_many_unordered(notifications_collection, documents) if documents else 0
+    stats.inserted += inserted
+    stats.failed += len(documents) - inserted
+
+# Serije se upisuju paralelno (najviše concurrency istodobno) dok se zapisi dalje čitaju
+async def import_records(
+    kind: str, records: Iterable[dict], batch_size: int, concurrency: int,
+    user_id: Optional[str] = None, assign_users: bool = False, report_interval: float = 5.0
+) -> ImportStats:
+    stats = ImportStats()
+    resolver = UserResolver(user_id, assign_users)
+    if kind in ("tasks", "notifications"):
+        await resolver.prepare()
+    else:
+        # Jedinstveni indeksi odbacuju duplikate već kod upisa (broje se kao failed); bez njih bi
+        # uvoz upisao duplikate pa se prekida
+        missing = await ensure_user_indexes()
+        if missing:
+            raise RuntimeError(f"Unique user indexes missing on {', '.join(missing)}; run dedupe_users.py first")
+    running = set()
+    next_report = time.monotonic() + report_interval
+    batch = []
+    for record in records:
+        stats.read += 1
+        batch.append(record)
+        if len(batch) < batch_size:
+            continue
+        running.add(asyncio.create_task(write_batch(kind, batch, resolver, stats)))
+        batch = []
+        if len(running) >= concurrency:
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for job in done:
+                job.result()
+        if time.monotonic() >= next_report:
+            stats.report()
+            next_report = time.monotonic() + report_interval
+    if batch:
+        running.add(asyncio.create_task(write_batch(kind, batch, resolver, stats)))
+    for job in await asyncio.gather(*running, return_exceptions=True):
+        if isinstance(job, Exception):
+            raise job
+    stats.report(final=True)
+    return stats
+
+async def import_file(kind: str, path: str, file_format: str, batch_size: int, concurrency: int, **options) -> ImportStats:
+    try:
+        with open(path, encoding="utf-8") as stream:
+            return await import_records(kind, iter_records(stream, file_format), batch_size, concurrency, **options)
+    finally:
+        await change_seq_writer.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bulk import of users, tasks or notifications from JSON array or NDJSON files")
+    parser.add_argument("kind", choices=["users", "tasks", "notifications"])
+    parser.add_argument("path")
+    parser.add_argument("--format", dest="file_format", choices=["auto", "json", "ndjson"], default="auto")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--user-id", help="Assign records without user_id/username to this user")
+    parser.add_argument("--assign-users", action="store_true", help="Spread records without user_id/username over existing users")
+    args = parser.parse_args()
+    if args.user_id is not None and not ObjectId.is_valid(args.user_id):
+        parser.error("--user-id must be a valid ObjectId")
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        asyncio.run(import_file(
+            args.kind, args.path, args.file_format, args.batch_size, args.concurrency,
+            user_id=args.user_id, assign_users=args.assign_users
+        ))
+    except ValueError as e:
+        raise SystemExit(f"Import failed: {e}")
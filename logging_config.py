@@ -0,0 +1,110 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+# Standardni atributi LogRecord-a; sve ostalo (extra={...}) ide u JSON zapis kao dodatna polja
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+# Loggeri koje uvicorn konfigurira vlastitim handlerima i bez propagacije do root loggera
+UVICORN_LOGGERS = ["uvicorn", "uvicorn.error", "uvicorn.access"]
+
+# Pozadinska dretva koja zapisuje na stdout (jedna po procesu)
+listener: Optional[QueueListener] = None
+
+# Argumenti setup_logging; prosljeđuju se procesima koje servis pokreće (setup_process_logging)
+settings: Optional[tuple] = None
+
+# Jedan JSON objekt po retku
+class JsonFormatter(logging.Formatter):
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+# Uzorkovanje zapisa za pojedine loggere ({"task_executor": 0.1} propušta 10% zapisa);
+# vrijedi najdulji odgovarajući prefiks imena loggera, a upozorenja i greške uvijek prolaze
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def rate(self, name: str) -> float:
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition(".")[0]
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+def replace_root_handler(handler: logging.Handler, level: str):
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    # Zapisi uvicorna (i pristupni zapisi) idu kroz root handler, u istom JSON formatu
+    for name in UVICORN_LOGGERS:
+        logger = logging.getLogger(name)
+        for existing in list(logger.handlers):
+            logger.removeHandler(existing)
+        logger.propagate = True
+
+# Zapisi se formatiraju u pozivajućoj dretvi i predaju u red; pisanje na stdout (koji supervisord
+# preusmjerava) obavlja pozadinska dretva pa logiranje ne blokira event loop
+def setup_logging(service: str, level: str, sampling: Optional[Dict[str, float]] = None):
+    global listener, settings
+    if listener is not None:
+        return
+    settings = (service, level, sampling)
+    records = queue.SimpleQueue()
+    queue_handler = QueueHandler(records)
+    queue_handler.setFormatter(JsonFormatter(service))
+    queue_handler.addFilter(SamplingFilter(sampling or {}))
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("%(message)s"))
+    replace_root_handler(queue_handler, level)
+    listener = QueueListener(records, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    # Proces nastao forkom nasljeđuje QueueHandler, ali ne i dretvu koja prazni red
+    os.register_at_fork(after_in_child=reset_after_fork)
+
+# Logiranje u procesu bez event loopa (npr. worker ProcessPoolExecutor-a): zapisi se pišu izravno
+# na stdout, pa se ne gube kad proces završi bez atexit poziva
+def setup_process_logging(service: str, level: str, sampling: Optional[Dict[str, float]] = None):
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter(service))
+    handler.addFilter(SamplingFilter(sampling or {}))
+    replace_root_handler(handler, level)
+
+def reset_after_fork():
+    global listener
+    if listener is not None and settings is not None:
+        listener = None
+        setup_process_logging(*settings)
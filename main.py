@@ -1,4 +1,5 @@
 import json
+import logging
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, EmailStr
 import httpx
@@ -6,11 +7,15 @@ import asyncio
 import subprocess
 import os
 from typing import Optional
+from logging_config import setup_logging
 
 # Loading the configuration from config.json
 with open("config.json") as config_file:
     config = json.load(config_file)
 
+setup_logging("main", config["log_level"], config["log_sampling"])
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
 # Configurable parameters from config.json
@@ -82,9 +87,30 @@ async def get_users():
             response.raise_for_status()  # Ova linija će podići grešku ako status nije 2xx
             return response.json()
     except httpx.HTTPStatusError as exc:
-        print(f"Error response {exc.response.status_code} while requesting {exc.request.url!r}.")
+        logger.error("Error response %s while requesting %r", exc.response.status_code, str(exc.request.url))
         raise HTTPException(status_code=exc.response.status_code, detail="User service not available")
 
+@app.get("/users/batch")
+async def get_users_batch(ids: str, fields: Optional[str] = None):
+    params = {"ids": ids}
+    if fields is not None:
+        params["fields"] = fields
+    async with httpx.AsyncClient() as client:
+        response = await client.get(f"{services['user_service']}/users/batch", params=params)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise HTTPException(status_code=response.status_code, detail=response.text)
+
+@app.post("/users/batch")
+async def post_users_batch(payload: dict):
+    async with httpx.AsyncClient() as client:
+        response = await client.post(f"{services['user_service']}/users/batch", json=payload)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise HTTPException(status_code=response.status_code, detail=response.text)
+
 @app.get("/users/{user_id}", response_model=User)
 async def get_user(user_id: str):
     async with httpx.AsyncClient() as client:
@@ -103,10 +129,20 @@ async def update_user(user_id: str, user: User):
         else:
             raise HTTPException(status_code=response.status_code, detail=response.text)
 
+@app.get("/users/jobs/{job_id}", response_model=dict)
+async def get_user_job(job_id: str):
+    async with httpx.AsyncClient() as client:
+        response = await client.get(f"{services['user_service']}/users/jobs/{job_id}")
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise HTTPException(status_code=response.status_code, detail=response.text)
+
 @app.delete("/users/{user_id}", response_model=dict)
-async def delete_user(user_id: str):
+async def delete_user(user_id: str, reassign_to: Optional[str] = None):
+    params = {"reassign_to": reassign_to} if reassign_to is not None else None
     async with httpx.AsyncClient() as client:
-        response = await client.delete(f"{services['user_service']}/users/{user_id}")
+        response = await client.delete(f"{services['user_service']}/users/{user_id}", params=params)
         if response.status_code == 200:
             return response.json()
         else:
@@ -138,9 +174,27 @@ async def get_tasks():
             response.raise_for_status()  # Ova linija će podići grešku ako status nije 2xx
             return response.json()
     except httpx.HTTPStatusError as exc:
-        print(f"Error response {exc.response.status_code} while requesting {exc.request.url!r}.")
+        logger.error("Error response %s while requesting %r", exc.response.status_code, str(exc.request.url))
         raise HTTPException(status_code=exc.response.status_code, detail="Task worker service not available")
 
+@app.patch("/tasks/bulk", response_model=dict)
+async def bulk_update_tasks(payload: dict):
+    async with httpx.AsyncClient() as client:
+        response = await client.patch(f"{services['task_worker']}/tasks/bulk", json=payload)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise HTTPException(status_code=response.status_code, detail=response.text)
+
+@app.delete("/tasks/bulk", response_model=dict)
+async def bulk_delete_tasks(payload: dict):
+    async with httpx.AsyncClient() as client:
+        response = await client.request("DELETE", f"{services['task_worker']}/tasks/bulk", json=payload)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise HTTPException(status_code=response.status_code, detail=response.text)
+
 @app.get("/tasks/{task_id}", response_model=Task)
 async def get_task(task_id: str):
     async with httpx.AsyncClient() as client:
@@ -183,10 +237,10 @@ async def get_notifications():
             response.raise_for_status()  # Ova linija će podići grešku ako status nije 2xx
             return response.json()
     except httpx.HTTPStatusError as exc:
-        print(f"Error response {exc.response.status_code} while requesting {exc.request.url!r}.")
+        logger.error("Error response %s while requesting %r", exc.response.status_code, str(exc.request.url))
         raise HTTPException(status_code=exc.response.status_code, detail="Notification service not available")
     except httpx.RequestError as exc:
-        print(f"An error occurred: {exc}")
+        logger.error("Request to notification service failed: %s", exc)
         raise HTTPException(status_code=500, detail="Internal server error")
     
 
@@ -215,4 +269,5 @@ if __name__ == "__main__":
     import uvicorn
     # Pokretanje svih servisa prije pokretanja main aplikacije
     start_services()
-    uvicorn.run(app, host=main_host, port=main_port)
+    # log_config=None: uvicorn ne postavlja vlastite handlere, zapisi idu kroz setup_logging
+    uvicorn.run(app, host=main_host, port=main_port, log_config=None)
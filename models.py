@@ -1,6 +1,7 @@
-from pydantic import BaseModel, Field
+from datetime import datetime
+from pydantic import BaseModel, EmailStr, Field
 from bson import ObjectId
-from typing import Optional
+from typing import Any, List, Optional
 from enum import Enum
 
 class PyObjectId(ObjectId):
@@ -23,6 +24,9 @@ class TaskStatus(str, Enum):
     pending = "pending"
     completed = "completed"
     in_progress = "in-progress"
+    failed = "failed"
+    scheduled = "scheduled"
+    blocked = "blocked"
 
 # Model za zadatke
 class TaskModel(BaseModel):
@@ -76,3 +80,42 @@ class UserModel(BaseModel):
                 "email": "johndoe@example.com"
             }
         }
+
+# Modeli API-ja i uvoza podataka; modul nema nuspojava kod importa (bez konfiguracije, logiranja i aplikacije)
+
+# Model za Task
+class Task(BaseModel):
+    title: str
+    description: str
+    status: TaskStatus = TaskStatus.pending  # scheduled i blocked izvodi task_store iz run_at/not_before i depends_on
+    user_id: Optional[str] = None  
+    handler: Optional[str] = None  # Ime handlera koji izvršava zadatak (task_executor)
+    payload: Optional[dict] = None
+    priority: int = 0  # Veći broj znači raniji početak izvršavanja
+    queue: str = "default"  # Imenovani red s vlastitim ograničenjem istodobnog izvršavanja
+    max_attempts: Optional[int] = None  # Bez vrijednosti vrijedi task_max_attempts iz config.json
+    run_at: Optional[datetime] = None  # Zadatak s budućim run_at/not_before čeka u statusu "scheduled"
+    not_before: Optional[datetime] = None
+    # ID-evi zadataka koji moraju završiti prije ovog; ako neki od njih propadne ili bude obrisan,
+    # zadatak prelazi u failed (kao i zadaci koji ovise o njemu)
+    depends_on: Optional[List[str]] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    progress: Optional[float] = None  # Napredak izvršavanja koji javlja handler (report_progress)
+
+    class Config:
+        use_enum_values = True
+
+# Osnovni model za korisnika
+class User(BaseModel):
+    username: str
+    email: EmailStr
+
+class Notification(BaseModel):
+    user_id: str
+    message: str
+    read: bool = False
+
+# Email i korisničko ime uspoređuju se bez obzira na velika/mala slova i okolne razmake
+def user_keys(username: str, email: str) -> dict:
+    return {"email_key": email.strip().lower(), "username_key": username.strip().lower()}
@@ -1,8 +1,10 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List
+from fastapi import FastAPI, HTTPException, Query
+from typing import List, Optional
 from bson import ObjectId
+from pymongo import ReturnDocument
 from database import notifications_collection
+from models import Notification
+from query_utils import build_projection, projected_response, export_response, export_columns
 from motor.motor_asyncio import AsyncIOMotorClient
 import json
 
@@ -14,11 +16,7 @@ app = FastAPI()
 #Configurable parameters from config.jso
 notification_service_host = config["notification_service_host"]
 notification_service_port = config["notification_service_port"]
-
-class Notification(BaseModel):
-    user_id: str
-    message: str
-    read: bool = False
+export_batch_size = config["export_batch_size"]
 
 @app.post("/notifications/", response_model=dict)
 async def create_notification(notification: Notification):
@@ -27,28 +25,56 @@ async def create_notification(notification: Notification):
     return {"id": str(result.inserted_id)}
 
 @app.get("/notifications/", response_model=List[Notification])
-async def get_notifications():
-    notifications = await notifications_collection.find().to_list(100)
+async def get_notifications(fields: Optional[str] = None):
+    projection = build_projection(fields, Notification.__fields__)
+    notifications = await notifications_collection.find({}, projection).to_list(100)
+    if projection is not None:
+        return projected_response(notifications)
     return notifications
 
+# Izvoz svih obavijesti kao NDJSON ili CSV stream
+@app.get("/notifications/export")
+async def export_notifications(
+    export_format: str = Query("ndjson", alias="format"),
+    user_id: Optional[str] = None,
+    read: Optional[bool] = None,
+    fields: Optional[str] = None,
+    gzip: bool = False
+):
+    projection = build_projection(fields, Notification.__fields__)
+    query = {}
+    if user_id is not None:
+        query["user_id"] = user_id
+    if read is not None:
+        query["read"] = read
+    cursor = notifications_collection.find(query, projection).batch_size(export_batch_size)
+    return export_response(cursor, export_format, export_columns(fields, Notification.__fields__), gzip, "notifications")
+
 @app.get("/notifications/{user_id}", response_model=List[Notification])
-async def get_user_notifications(user_id: str):
-    notifications = await notifications_collection.find({"user_id": user_id}).to_list(100)
+async def get_user_notifications(user_id: str, fields: Optional[str] = None):
+    projection = build_projection(fields, Notification.__fields__)
+    notifications = await notifications_collection.find({"user_id": user_id}, projection).to_list(100)
+    if projection is not None:
+        return projected_response(notifications)
     return notifications
 
 @app.put("/notifications/{notification_id}", response_model=Notification)
 async def mark_notification_as_read(notification_id: str):
-    result = await notifications_collection.update_one(
+    notification = await notifications_collection.find_one_and_update(
         {"_id": ObjectId(notification_id)},
-        {"$set": {"read": True}}
+        {"$set": {"read": True}},
+        return_document=ReturnDocument.AFTER
     )
-    if result.modified_count == 0:
-        raise HTTPException(status_code=404, detail="Notification not found or already marked as read")
-    return await notifications_collection.find_one({"_id": ObjectId(notification_id)})
+    if notification is None:
+        raise HTTPException(status_code=404, detail="Notification not found")
+    return notification
 
 @app.get("/notifications/unread/{user_id}", response_model=List[Notification])
-async def get_unread_notifications(user_id: str):
-    notifications = await notifications_collection.find({"user_id": user_id, "read": False}).to_list(100)
+async def get_unread_notifications(user_id: str, fields: Optional[str] = None):
+    projection = build_projection(fields, Notification.__fields__)
+    notifications = await notifications_collection.find({"user_id": user_id, "read": False}, projection).to_list(100)
+    if projection is not None:
+        return projected_response(notifications)
     return notifications
 
 @app.get("/health")
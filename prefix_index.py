@@ -0,0 +1,63 @@
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Tuple
+
+# Sortirani niz (ključ, user_id, polje) za pretragu po prefiksu korisničkog imena i emaila.
+# Svi ključevi s istim prefiksom leže jedan do drugog pa upit traži početak binarnim pretraživanjem.
+class PrefixIndex:
+    FIELDS = ("username", "email")
+
+    def __init__(self):
+        self._entries: List[Tuple[str, str, str]] = []
+        self._users: Dict[str, dict] = {}
+        self.loaded = False
+
+    @staticmethod
+    def _keys(user: dict) -> List[Tuple[str, str]]:
+        return [(user[field].strip().lower(), field) for field in PrefixIndex.FIELDS if user.get(field)]
+
+    # Izgradnja cijelog indeksa jednim sortiranjem (kod pokretanja i periodičnog osvježavanja)
+    def load(self, users: Iterable[dict]):
+        entries = []
+        index_users = {}
+        for user in users:
+            user_id = str(user["_id"])
+            index_users[user_id] = {field: user.get(field) for field in self.FIELDS}
+            entries.extend((key, user_id, field) for key, field in self._keys(user))
+        entries.sort()
+        self._entries = entries
+        self._users = index_users
+        self.loaded = True
+
+    def add(self, user_id: str, user: dict):
+        self.remove(user_id)
+        self._users[user_id] = {field: user.get(field) for field in self.FIELDS}
+        for key, field in self._keys(user):
+            insort(self._entries, (key, user_id, field))
+
+    def remove(self, user_id: str):
+        user = self._users.pop(user_id, None)
+        if user is None:
+            return
+        for key, field in self._keys(user):
+            position = bisect_left(self._entries, (key, user_id, field))
+            if position < len(self._entries) and self._entries[position] == (key, user_id, field):
+                del self._entries[position]
+
+    # Najviše limit korisnika čije korisničko ime ili email počinje prefiksom, abecednim redom ključa
+    def search(self, prefix: str, limit: int) -> List[dict]:
+        prefix = prefix.strip().lower()
+        results = []
+        seen = set()
+        position = bisect_left(self._entries, (prefix,))
+        while position < len(self._entries) and len(results) < limit:
+            key, user_id, field = self._entries[position]
+            if not key.startswith(prefix):
+                break
+            if user_id not in seen:
+                seen.add(user_id)
+                results.append(dict(self._users[user_id], id=user_id, match=field))
+            position += 1
+        return results
+
+    def __len__(self) -> int:
+        return len(self._users)
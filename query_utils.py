@@ -0,0 +1,120 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Iterable, List, Optional
+from bson import ObjectId
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Veličina bloka koji se šalje klijentu tijekom izvoza
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Pretvaranje parametra fields=title,status u Mongo projekciju
+def build_projection(fields: Optional[str], allowed: Iterable[str]) -> Optional[dict]:
+    if fields is None:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    allowed_names = set(allowed) | {"id"}
+    unknown = [name for name in names if name not in allowed_names]
+    if not names or unknown:
+        raise HTTPException(status_code=400, detail=f"Invalid fields: {fields}")
+    projection = {("_id" if name == "id" else name): 1 for name in names}
+    projection.setdefault("_id", 0)
+    return projection
+
+# Primjena projekcije (iz build_projection) na dokument koji je već u memoriji
+def project_document(document: dict, projection: Optional[dict]) -> dict:
+    if projection is None:
+        return document
+    included = [name for name, value in projection.items() if value and name in document]
+    if projection.get("_id", 1) and "_id" in document and "_id" not in included:
+        included.append("_id")
+    return {name: document[name] for name in included}
+
+def serialize_value(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, list):
+        return [serialize_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: serialize_value(item) for key, item in value.items()}
+    return value
+
+# Dokument iz baze u JSON-serijalizabilan dict (_id postaje id)
+def serialize_document(document: dict) -> dict:
+    result = {}
+    for key, value in document.items():
+        result["id" if key == "_id" else key] = serialize_value(value)
+    return result
+
+# Odgovor s projekcijom zaobilazi response_model jer dokumenti nisu potpuni
+def projected_response(documents: List[dict]) -> JSONResponse:
+    return JSONResponse(content=[serialize_document(document) for document in documents])
+
+async def ndjson_rows(cursor) -> AsyncIterator[str]:
+    async for document in cursor:
+        yield json.dumps(serialize_document(document), ensure_ascii=False) + "\n"
+
+async def csv_rows(cursor, columns: List[str]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    async for document in cursor:
+        row = serialize_document(document)
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(["" if row.get(column) is None else row.get(column) for column in columns])
+        yield buffer.getvalue()
+
+# Spajanje redaka u veće blokove kako se ne bi slao svaki redak posebno
+async def chunked(rows: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    parts = []
+    size = 0
+    async for row in rows:
+        data = row.encode("utf-8")
+        parts.append(data)
+        size += len(data)
+        if size >= EXPORT_CHUNK_SIZE:
+            yield b"".join(parts)
+            parts = []
+            size = 0
+    if parts:
+        yield b"".join(parts)
+
+async def gzipped(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+# Izvoz kursora kao NDJSON ili CSV stream u konstantnoj memoriji
+def export_response(cursor, export_format: str, columns: List[str], compress: bool, name: str) -> StreamingResponse:
+    if export_format == "ndjson":
+        rows = ndjson_rows(cursor)
+        media_type = "application/x-ndjson"
+    elif export_format == "csv":
+        rows = csv_rows(cursor, columns)
+        media_type = "text/csv"
+    else:
+        raise HTTPException(status_code=400, detail="Unsupported export format")
+    body = chunked(rows)
+    filename = f"{name}.{export_format}"
+    if compress:
+        body = gzipped(body)
+        media_type = "application/gzip"
+        filename += ".gz"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+# Stupci za CSV izvoz: traženi fields ili id + sva polja modela
+def export_columns(fields: Optional[str], model_fields: Iterable[str]) -> List[str]:
+    if fields is None:
+        return ["id"] + list(model_fields)
+    return [name.strip() for name in fields.split(",") if name.strip()]
@@ -0,0 +1,20 @@
+import asyncio
+import signal
+import task_executor
+from logging_config import setup_logging
+
+# supervisord zaustavlja proces SIGTERM-om; otkazivanje main() izvršava executor.stop(),
+# pa se zadaci i particije odmah vraćaju umjesto da čekaju istek najma
+async def run_worker():
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    await task_executor.main()
+
+# Pokretanje samostalnog workera (bez HTTP API-ja). Ne pokreće se kao python task_executor.py jer bi
+# se modul tada učitao dvaput (__main__ i task_executor): handler moduli registriraju handlere u
+# task_executor, a worker iz __main__ ne bi vidio nijedan handler i ne bi preuzeo nijedan zadatak.
+if __name__ == "__main__":
+    setup_logging("task_executor", task_executor.config["log_level"], task_executor.config["log_sampling"])
+    try:
+        asyncio.run(run_worker())
+    except asyncio.CancelledError:
+        pass
@@ -0,0 +1,811 @@
+import asyncio
+import heapq
+import importlib
+import json
+import logging
+import os
+import random
+import socket
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from uuid import uuid4
+import logging_config
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from database import (
+    tasks_collection, task_stats_collection, task_slots_collection, dead_letter_tasks_collection, task_partitions_collection,
+    task_workers_collection
+)
+from task_store import (
+    LEASE_FIELDS, FINISHED_STATUSES, PARTITION_COUNT, CLAIMABLE, as_utc, stable_change_seq, allocate_change_seq,
+    apply_stats_delta, transition_delta, transition_tasks, release_dependents, backfill_partitions, backfill_claim_fields,
+    backfill_task_stats, write_buffer, change_seq_writer
+)
+
+with open("config.json") as config_file:
+    config = json.load(config_file)
+
+logger = logging.getLogger(__name__)
+
+# Registrirani handleri: ime -> async funkcija koja prima dokument zadatka
+handlers: Dict[str, Callable[[dict], Awaitable[Any]]] = {}
+
+# Handleri koji se izvršavaju u procesnom poolu (sinkrone funkcije koje primaju payload)
+cpu_bound_handlers = set()
+
+# CPU-bound handler mora biti funkcija na razini modula kako bi se mogla poslati u drugi proces
+def register_handler(name: str, cpu_bound: bool = False):
+    def decorator(function: Callable):
+        handlers[name] = function
+        if cpu_bound:
+            cpu_bound_handlers.add(name)
+        return function
+    return decorator
+
+# Handler javlja napredak izvršavanja; uzastopne dojave istog zadatka spajaju se u jedan upis.
+# Spremnik je lokalan za proces, pa drugi procesi (task_worker uz samostalni worker) napredak
+# vide tek nakon upisa, najviše WRITE_BUFFER_WINDOW kasnije.
+async def report_progress(task: dict, progress: float, **fields):
+    await write_buffer.update(task["_id"], dict(fields, progress=progress))
+
+# Referenca na blok dijeljene memorije koja se procesu šalje umjesto velikog niza bajtova
+class SharedBuffer:
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+
+# Veliki bajtovi iz payloada kopiraju se jednom u dijeljenu memoriju umjesto serijalizacije kroz pipe
+def share_large_buffers(value: Any, threshold: int, blocks: List[SharedMemory]) -> Any:
+    if isinstance(value, (bytes, bytearray)) and len(value) >= threshold:
+        block = SharedMemory(create=True, size=len(value))
+        block.buf[:len(value)] = value
+        blocks.append(block)
+        return SharedBuffer(block.name, len(value))
+    if isinstance(value, dict):
+        return {key: share_large_buffers(item, threshold, blocks) for key, item in value.items()}
+    if isinstance(value, list):
+        return [share_large_buffers(item, threshold, blocks) for item in value]
+    return value
+
+def attach_shared_buffers(value: Any, blocks: List[SharedMemory]) -> Any:
+    if isinstance(value, SharedBuffer):
+        block = SharedMemory(name=value.name)
+        blocks.append(block)
+        return block.buf[:value.size]
+    if isinstance(value, dict):
+        return {key: attach_shared_buffers(item, blocks) for key, item in value.items()}
+    if isinstance(value, list):
+        return [attach_shared_buffers(item, blocks) for item in value]
+    return value
+
+# Inicijalizator procesa iz poola: zapisi handlera u istom JSON formatu kao u servisu koji ga pokreće
+def init_pool_process(log_settings: Optional[tuple]):
+    if log_settings is not None:
+        logging_config.setup_process_logging(*log_settings)
+
+# Izvršava se u procesu iz poola; handler dobiva memoryview umjesto bajtova iz dijeljene memorije
+def run_cpu_handler(function: Callable[[Any], Any], payload: Any) -> Any:
+    blocks = []
+    try:
+        return function(attach_shared_buffers(payload, blocks))
+    finally:
+        for block in blocks:
+            try:
+                block.close()
+            except BufferError:
+                logger.warning("Handler kept a reference to shared buffer %s", block.name)
+
+# Učitavanje modula s handlerima navedenih u config.json
+def load_handler_modules():
+    for module_name in config["task_handler_modules"]:
+        importlib.import_module(module_name)
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def unset_lease() -> dict:
+    return {field: "" for field in LEASE_FIELDS}
+
+# Broj pokušaja upisa ishoda zadatka kod grešaka baze (između pokušaja najam i dalje traje)
+OUTCOME_ATTEMPTS = 3
+
+# Redoslijed preuzimanja: viši prioritet prvi, zatim stariji zadaci (FIFO)
+CLAIM_SORT = [("priority", DESCENDING), ("enqueued_at", ASCENDING)]
+
+# Polja kandidata potrebna za pravednost i ograničenja istodobnog izvršavanja
+CANDIDATE_FIELDS = {"_id": 1, "user_id": 1, "queue": 1}
+
+async def ensure_executor_indexes():
+    # user_id je na kraju indeksa kako bi se $nin filter odgođenih korisnika provjeravao nad ključevima
+    # indeksa; partition je ispred sortiranja pa se preuzimanje spaja iz raspona vlastitih particija
+    await tasks_collection.create_index([
+        ("status", ASCENDING), ("partition", ASCENDING), ("handler", ASCENDING), ("priority", DESCENDING),
+        ("enqueued_at", ASCENDING), ("user_id", ASCENDING), ("queue", ASCENDING)
+    ])
+    # Početak reda pojedinog korisnika (upit po jednakosti user_id) za round-robin pravednost
+    await tasks_collection.create_index([
+        ("status", ASCENDING), ("user_id", ASCENDING), ("partition", ASCENDING), ("handler", ASCENDING),
+        ("priority", DESCENDING), ("enqueued_at", ASCENDING)
+    ])
+    # Korisnici s barem jednim zadatkom koji se može preuzeti, redom po user_id (round-robin)
+    await task_stats_collection.create_index(
+        [("user_id", ASCENDING)], name="claimable_users", partialFilterExpression={CLAIMABLE: {"$gt": 0}}
+    )
+    await tasks_collection.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+    await tasks_collection.create_index([("status", ASCENDING), ("scheduled_for", ASCENDING), ("_id", ASCENDING)])
+    await task_workers_collection.create_index("expires_at", expireAfterSeconds=0)
+
+async def ensure_partitions():
+    await task_partitions_collection.bulk_write([
+        UpdateOne({"_id": partition}, {"$setOnInsert": {"owner": None, "expires_at": None}}, upsert=True)
+        for partition in range(PARTITION_COUNT)
+    ], ordered=False)
+
+# Ključevi ograničenja istodobnog izvršavanja kojima zadatak podliježe
+def slot_keys(task: dict) -> List[str]:
+    return [f"user:{task.get('user_id')}", f"queue:{task.get('queue') or 'default'}"]
+
+# Izvršni sustav: preuzima pending zadatke s handlerom, izvršava ih i bilježi ishod
+class TaskExecutor:
+    def __init__(
+        self, concurrency: int, batch_size: int, lease_seconds: float, poll_interval: float,
+        fair_share: int, fairness_rounds: int, process_pool_size: Optional[int], shared_memory_threshold: int,
+        timer_horizon: float, timer_load_interval: float, timer_load_limit: int, timer_rescan_interval: float,
+        user_limit: int, queue_limits: Dict[str, int], cap_backoff: float,
+        max_attempts: int, retry_base: float, retry_max: float, partition_lease_seconds: float
+    ):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.fair_share = fair_share
+        self.fairness_rounds = fairness_rounds
+        # Zadnji korisnik čiji su zadaci uzeti u round-robin krugu pravednosti
+        self.fair_cursor: Optional[str] = None
+        self.process_pool_size = process_pool_size
+        self.shared_memory_threshold = shared_memory_threshold
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self.running: Dict[Any, asyncio.Task] = {}
+        self.wakeup = asyncio.Event()
+        self.stopping = False
+        self.process_pool: Optional[ProcessPoolExecutor] = None
+        self.timer_horizon = timer_horizon
+        self.timer_load_interval = timer_load_interval
+        self.timer_load_limit = timer_load_limit
+        # Min-heap (scheduled_for, _id) zadataka koji dospijevaju unutar horizonta
+        self.timers: List[tuple] = []
+        self.timer_entries: Dict[Any, tuple] = {}
+        # Učitano je sve do (loaded_until, loaded_after_id); _id je postavljen samo kad je limit
+        # prekinuo učitavanje usred zadataka zakazanih za isti trenutak
+        self.loaded_until: Optional[datetime] = None
+        self.loaded_after_id: Any = None
+        self.loaded_seq = 0
+        self.timer_rescan_interval = timer_rescan_interval
+        self.next_timer_rescan = 0.0
+        self.user_limit = user_limit
+        self.queue_limits = queue_limits
+        self.cap_backoff = cap_backoff
+        # Lokalno pokrenuti zadaci po ključu ograničenja i ključevi odgođeni do trenutka (monotonic)
+        self.local_slots = Counter()
+        self.deferred_slots: Dict[str, float] = {}
+        # Razlike brojača i stvarnog stanja iz prošlog usklađivanja: ključ -> (running, stvarni broj)
+        self.slot_drift: Dict[str, tuple] = {}
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        # Particije u najmu ovog workera; preuzimanje, povrat isteklih najmova i timeri ograničeni su na njih
+        self.partition_lease_seconds = partition_lease_seconds
+        self.partitions: List[int] = []
+
+    async def run(self):
+        await ensure_executor_indexes()
+        await ensure_partitions()
+        # Samostalni worker može krenuti prije task_workera, a zadaci bez particije ili polja
+        # redoslijeda nikad se ne bi preuzeli
+        await backfill_partitions()
+        await backfill_claim_fields()
+        try:
+            await backfill_task_stats()
+        except RuntimeError as exc:
+            # Brojače upravo izračunava drugi proces
+            logger.warning("Task stats backfill skipped: %s", exc)
+        await self.rebalance_partitions()
+        reclaimer = asyncio.create_task(self.reclaim_loop())
+        timer = asyncio.create_task(self.timer_loop())
+        balancer = asyncio.create_task(self.partition_loop())
+        logger.info("Task executor %s started", self.owner)
+        try:
+            while not self.stopping:
+                free_slots = self.concurrency - len(self.running)
+                claimed = []
+                if free_slots > 0 and handlers:
+                    try:
+                        claimed = await self.claim(min(free_slots, self.batch_size))
+                        # Bez posla u vlastitim particijama worker preuzima zadatke iz tuđih
+                        if not claimed and len(self.partitions) < PARTITION_COUNT:
+                            claimed = await self.claim(min(free_slots, self.batch_size), steal=True)
+                    except Exception as exc:
+                        logger.error("Claiming tasks failed: %s", exc)
+                    for task in claimed:
+                        self.start(task)
+                # Puna serija znači da vjerojatno čeka još zadataka pa se odmah ponovno preuzima
+                if claimed and len(claimed) == min(free_slots, self.batch_size):
+                    continue
+                self.wakeup.clear()
+                # asyncio.wait umjesto wait_for: wait_for proguta otkazivanje koje stigne istodobno
+                # s buđenjem, pa se worker ne bi zaustavio
+                waiter = asyncio.create_task(self.wakeup.wait())
+                try:
+                    await asyncio.wait([waiter], timeout=self.poll_interval)
+                finally:
+                    waiter.cancel()
+        finally:
+            reclaimer.cancel()
+            timer.cancel()
+            balancer.cancel()
+
+    async def stop(self):
+        self.stopping = True
+        self.wakeup.set()
+        jobs = list(self.running.values())
+        for job in jobs:
+            job.cancel()
+        await asyncio.gather(*jobs, return_exceptions=True)
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=False, cancel_futures=True)
+        await write_buffer.close()
+        # Particije se odmah oslobađaju kako ih ostali workeri ne bi čekali do isteka najma
+        await task_partitions_collection.update_many({"owner": self.owner}, {"$set": {"owner": None, "expires_at": None}})
+        await task_workers_collection.delete_one({"_id": self.owner})
+        self.partitions = []
+
+    # Broj particija koji pripada ovom workeru: ravnomjerna podjela među živim workerima poredanim po imenu
+    async def partition_target(self, now: datetime) -> int:
+        workers = [
+            worker["_id"] async for worker in
+            task_workers_collection.find({"expires_at": {"$gt": now}}, {"_id": 1}).sort("_id", ASCENDING)
+        ]
+        if self.owner not in workers:
+            return 0
+        share, extra = divmod(PARTITION_COUNT, len(workers))
+        return share + (1 if workers.index(self.owner) < extra else 0)
+
+    # Obnova najma workera i njegovih particija; višak particija se otpušta, a manjak uzima
+    # iz slobodnih ili isteklih. Particije samo smanjuju natjecanje za iste zadatke, preuzimanje
+    # zadatka i dalje je atomarno pa kratko preklapanje vlasništva ne uzrokuje dvostruko izvršavanje.
+    async def rebalance_partitions(self):
+        now = utc_now()
+        expires_at = now + timedelta(seconds=self.partition_lease_seconds)
+        await task_workers_collection.update_one({"_id": self.owner}, {"$set": {"expires_at": expires_at}}, upsert=True)
+        target = await self.partition_target(now)
+        await task_partitions_collection.update_many({"owner": self.owner}, {"$set": {"expires_at": expires_at}})
+        owned = sorted([
+            partition["_id"] async for partition in task_partitions_collection.find({"owner": self.owner}, {"_id": 1})
+        ])
+        if len(owned) > target:
+            await task_partitions_collection.update_many(
+                {"_id": {"$in": owned[target:]}, "owner": self.owner},
+                {"$set": {"owner": None, "expires_at": None}}
+            )
+            owned = owned[:target]
+        elif len(owned) < target:
+            available = {"$or": [{"owner": None}, {"expires_at": {"$lt": now}}]}
+            free = await task_partitions_collection.find(available, {"_id": 1}).to_list(None)
+            # Nasumičan redoslijed smanjuje sudare workera koji se pokreću istodobno
+            random.shuffle(free)
+            for partition in free:
+                if len(owned) >= target:
+                    break
+                acquired = await task_partitions_collection.find_one_and_update(
+                    dict(available, _id=partition["_id"]),
+                    {"$set": {"owner": self.owner, "expires_at": expires_at}}
+                )
+                if acquired is not None:
+                    owned.append(partition["_id"])
+            owned.sort()
+        if owned != self.partitions:
+            logger.info("Task executor %s owns %d partitions", self.owner, len(owned))
+            self.partitions = owned
+            # Timeri se ponovno učitavaju za novi skup particija
+            self.timers = []
+            self.timer_entries = {}
+            self.loaded_until = None
+            self.wakeup.set()
+
+    async def partition_loop(self):
+        while True:
+            await asyncio.sleep(self.partition_lease_seconds / 3)
+            try:
+                await self.rebalance_partitions()
+            except Exception as exc:
+                logger.error("Rebalancing task partitions failed: %s", exc)
+
+    # Zadaci korisnika i redova koji su na svom ograničenju ne dohvaćaju se dok se mjesto ne oslobodi
+    def claim_query(self, steal: bool = False) -> dict:
+        partitions = self.partitions
+        if steal:
+            # Tuđe particije zadaju se kao $in komplementa: $nin bi čitao cijeli raspon indeksa
+            partitions = [partition for partition in range(PARTITION_COUNT) if partition not in self.partitions]
+        query = {"status": "pending", "partition": {"$in": partitions}, "handler": {"$in": list(handlers)}}
+        now = time.monotonic()
+        self.deferred_slots = {key: until for key, until in self.deferred_slots.items() if until > now}
+        users = [key[len("user:"):] for key in self.deferred_slots if key.startswith("user:")]
+        queues = [key[len("queue:"):] for key in self.deferred_slots if key.startswith("queue:")]
+        if users:
+            query["user_id"] = {"$nin": users}
+        if queues:
+            query["queue"] = {"$nin": queues}
+        return query
+
+    def slot_limit(self, key: str) -> Optional[int]:
+        if key.startswith("user:"):
+            return self.user_limit or None
+        return self.queue_limits.get(key[len("queue:"):])
+
+    # Zauzimanje do wanted mjesta u Mongo brojaču (optimistički compare-and-set), vraća broj dobivenih
+    async def acquire_slot(self, key: str, wanted: int, limit: int) -> int:
+        for attempt in range(3):
+            slot = await task_slots_collection.find_one({"_id": key})
+            running = slot["running"] if slot else 0
+            granted = min(wanted, limit - running)
+            if granted <= 0:
+                return 0
+            if slot is None:
+                try:
+                    await task_slots_collection.insert_one({"_id": key, "running": granted})
+                    return granted
+                except DuplicateKeyError:
+                    continue
+            result = await task_slots_collection.update_one({"_id": key, "running": running}, {"$inc": {"running": granted}})
+            if result.modified_count:
+                return granted
+        return 0
+
+    async def release_slot_counts(self, released: Counter):
+        operations = [
+            UpdateOne({"_id": key, "running": {"$gte": count}}, {"$inc": {"running": -count}})
+            for key, count in released.items() if count > 0 and self.slot_limit(key) is not None
+        ]
+        if operations:
+            await task_slots_collection.bulk_write(operations, ordered=False)
+
+    async def release_slots(self, tasks: List[dict]):
+        await self.release_slot_counts(Counter(key for task in tasks for key in slot_keys(task)))
+
+    # Propuštaju se samo kandidati za koje ima mjesta i kod korisnika i u redu; lokalni brojač
+    # odbija očito pune ključeve bez odlaska u bazu, a Mongo brojač vrijedi za sve workere
+    async def admit(self, candidates: List[dict]) -> List[dict]:
+        wanted = Counter(key for task in candidates for key in slot_keys(task))
+        granted = {}
+        for key, count in wanted.items():
+            limit = self.slot_limit(key)
+            if limit is None:
+                granted[key] = count
+            elif self.local_slots[key] >= limit:
+                granted[key] = 0
+            else:
+                granted[key] = await self.acquire_slot(key, count, limit)
+        admitted = []
+        used = Counter()
+        for task in candidates:
+            keys = slot_keys(task)
+            if all(used[key] < granted[key] for key in keys):
+                admitted.append(task)
+                used.update(keys)
+        await self.release_slot_counts(Counter({key: granted[key] - used[key] for key in granted}))
+        deferred_until = time.monotonic() + self.cap_backoff
+        for key in wanted:
+            if granted[key] < wanted[key]:
+                self.deferred_slots[key] = deferred_until
+        return admitted
+
+    # Korisnici sa zadacima koje izvršni sustav može preuzeti (brojač claimable: pending zadaci s
+    # handlerom, ne svi pending zadaci) redom po user_id, nastavno od zadnjeg posluženog korisnika;
+    # kad se dođe do kraja, nastavlja se od početka (round-robin)
+    async def next_users(self, count: int) -> List[str]:
+        if self.fair_cursor is None:
+            ranges = [{"$gt": ""}]
+        else:
+            ranges = [{"$gt": self.fair_cursor}, {"$gt": "", "$lte": self.fair_cursor}]
+        users = []
+        for user_range in ranges:
+            cursor = task_stats_collection.find(
+                {CLAIMABLE: {"$gt": 0}, "user_id": user_range}, {"user_id": 1}
+            ).sort("user_id", ASCENDING).limit(count - len(users))
+            users += [document["user_id"] async for document in cursor]
+            if len(users) >= count:
+                break
+        return users
+
+    # Do fair_share najstarijih zadataka s najvišim prioritetom svakog od danih korisnika;
+    # upit po jednakosti user_id čita samo početak reda tog korisnika u indeksu
+    async def user_heads(self, query: dict, users: List[str], limit: int) -> List[List[dict]]:
+        return await asyncio.gather(*[
+            tasks_collection.find(dict(query, user_id=user_id), CANDIDATE_FIELDS).sort(CLAIM_SORT).limit(limit).to_list(limit)
+            for user_id in users
+        ])
+
+    # Odabir kandidata po prioritetu i starosti, uz najviše fair_share zadataka po korisniku u seriji.
+    # Ako korisnici koji su popunili svoj udio ostave slobodna mjesta, ona se dijele round-robin
+    # početcima redova ostalih korisnika, pa veliki uvoz jednog korisnika ne može zauzeti cijelu
+    # seriju. Trošak ne ovisi o veličini reda: svaki upit čita najviše limit zadataka iz indeksa.
+    async def select_candidates(self, limit: int, steal: bool = False) -> List[dict]:
+        query = self.claim_query(steal)
+        batch = await tasks_collection.find(query, CANDIDATE_FIELDS).sort(CLAIM_SORT).limit(limit).to_list(limit)
+        selected = []
+        overflow = []
+        per_user = Counter()
+        for task in batch:
+            if per_user[task.get("user_id")] < self.fair_share:
+                selected.append(task)
+                per_user[task.get("user_id")] += 1
+            else:
+                overflow.append(task)
+        if not overflow:
+            return selected
+        # Korisnici s odgođenim (punim) mjestima isključeni su i iz upita po jednakosti
+        skipped = set(per_user) | set(query.get("user_id", {}).get("$nin", []))
+        for fairness_round in range(self.fairness_rounds):
+            remaining = limit - len(selected)
+            if remaining <= 0:
+                break
+            users = await self.next_users(remaining)
+            if not users:
+                break
+            self.fair_cursor = users[-1]
+            users = [user_id for user_id in users if user_id not in skipped]
+            skipped.update(users)
+            heads = await self.user_heads(query, users, min(self.fair_share, remaining))
+            # Svaki korisnik redom dobiva po jedan zadatak dok se serija ne popuni
+            for position in range(self.fair_share):
+                for head in heads:
+                    if position < len(head) and len(selected) < limit:
+                        selected.append(head[position])
+        # Preostala mjesta popunjavaju se bez ograničenja udjela
+        return selected + overflow[:limit - len(selected)]
+
+    # Preuzimanje serije zadataka: update_many ponovno provjerava status pa je preuzimanje atomarno po zadatku
+    async def claim(self, limit: int, steal: bool = False) -> List[dict]:
+        candidates = await self.admit(await self.select_candidates(limit, steal))
+        if not candidates:
+            return []
+        lease_id = uuid4().hex
+        now = utc_now()
+        async with allocate_change_seq() as change_seq:
+            await tasks_collection.update_many(
+                {"_id": {"$in": [task["_id"] for task in candidates]}, "status": "pending"},
+                {"$set": {
+                    "status": "in-progress",
+                    "lease_owner": self.owner,
+                    "lease_id": lease_id,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                    "claimed_at": now,
+                    "change_seq": change_seq
+                }}
+            )
+            claimed = await tasks_collection.find({"lease_id": lease_id}).to_list(limit)
+            await apply_stats_delta(transition_delta(claimed, "pending", "in-progress"))
+        claimed_ids = {task["_id"] for task in claimed}
+        await self.release_slots([task for task in candidates if task["_id"] not in claimed_ids])
+        return claimed
+
+    def start(self, task: dict):
+        self.local_slots.update(slot_keys(task))
+        job = asyncio.create_task(self.execute(task))
+        self.running[task["_id"]] = job
+
+    async def execute(self, task: dict):
+        heartbeat = asyncio.create_task(self.keep_lease(task, asyncio.current_task()))
+        try:
+            if task["handler"] in cpu_bound_handlers:
+                result = await self.run_in_process(handlers[task["handler"]], task.get("payload"))
+            else:
+                result = await handlers[task["handler"]](task)
+        except asyncio.CancelledError:
+            if self.stopping:
+                await self.release(task)
+            else:
+                logger.warning("Lease lost for task %s, execution cancelled", task["_id"])
+        except Exception as exc:
+            await self.fail(task, exc)
+        else:
+            await self.finish(task, "completed", {"result": result, "error": None, "finished_at": utc_now()})
+        finally:
+            heartbeat.cancel()
+            self.running.pop(task["_id"], None)
+            # Oslobođeno mjesto odmah vraća odgođene zadatke istog korisnika/reda u preuzimanje
+            for key in slot_keys(task):
+                self.local_slots[key] -= 1
+                self.deferred_slots.pop(key, None)
+            self.wakeup.set()
+
+    # Otkazivanje (gubitak najma) ukida posao koji još čeka u poolu; posao koji je već
+    # pokrenut završava u svom procesu, ali se njegov rezultat odbacuje. Proces nastao forkom
+    # nasljeđuje red zapisa bez dretve koja ga prazni, a proces pokrenut metodom spawn (Windows,
+    # macOS) nema logiranje servisa, pa ga inicijalizator u oba slučaja postavlja iznova.
+    async def run_in_process(self, function: Callable[[Any], Any], payload: Any) -> Any:
+        if self.process_pool is None:
+            self.process_pool = ProcessPoolExecutor(
+                max_workers=self.process_pool_size, initializer=init_pool_process, initargs=(logging_config.settings,)
+            )
+        blocks = []
+        try:
+            shared_payload = share_large_buffers(payload, self.shared_memory_threshold, blocks)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.process_pool, run_cpu_handler, function, shared_payload)
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    # Produljivanje najma dok handler radi; ako najam više nije naš, izvršavanje se prekida.
+    # Greška baze ne prekida produljivanje, ali ako najam istekne prije uspješnog produljenja,
+    # zadatak je mogao preuzeti drugi worker pa se izvršavanje također prekida.
+    async def keep_lease(self, task: dict, job: asyncio.Task):
+        expires_at = time.monotonic() + self.lease_seconds
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                result = await tasks_collection.update_one(
+                    {"_id": task["_id"], "lease_id": task["lease_id"]},
+                    {"$set": {"lease_expires_at": utc_now() + timedelta(seconds=self.lease_seconds)}}
+                )
+            except Exception as exc:
+                logger.warning("Renewing lease for task %s failed: %s", task["_id"], exc)
+                if time.monotonic() >= expires_at:
+                    job.cancel()
+                    return
+                continue
+            if result.matched_count == 0:
+                job.cancel()
+                return
+            expires_at = time.monotonic() + self.lease_seconds
+
+    # Greška brojača nakon upisa ishoda samo se bilježi: ponovljeni upis ne bi ništa promijenio
+    async def set_outcome(self, task: dict, status: str, fields: dict):
+        async with allocate_change_seq() as change_seq:
+            result = await tasks_collection.update_one(
+                {"_id": task["_id"], "lease_id": task["lease_id"]},
+                {"$set": dict(fields, status=status, change_seq=change_seq), "$unset": unset_lease()}
+            )
+            if result.modified_count:
+                try:
+                    await apply_stats_delta(transition_delta([task], "in-progress", status))
+                except Exception as exc:
+                    logger.error("Updating stats after task %s finished as %s failed: %s", task["_id"], status, exc)
+            return result
+
+    # Upis ishoda zadatka ako je najam još naš; vraća True ako je upis uspio. Kod greške baze upis se
+    # ponavlja (heartbeat i dalje produljuje najam); ako ni zadnji pokušaj ne uspije, zadatak nakon
+    # isteka najma vraća reclaim_expired. Greška u knjiženju nakon upisa samo se bilježi u log.
+    async def finish(self, task: dict, status: str, fields: dict) -> bool:
+        # Neupisani napredak iz spremnika upisuje se zajedno s ishodom
+        fields = dict(write_buffer.take(task["_id"]), **fields)
+        for attempt in range(1, OUTCOME_ATTEMPTS + 1):
+            try:
+                result = await self.set_outcome(task, status, fields)
+                break
+            except Exception as exc:
+                logger.error("Recording outcome of task %s failed (attempt %d/%d): %s",
+                             task["_id"], attempt, OUTCOME_ATTEMPTS, exc)
+                if attempt == OUTCOME_ATTEMPTS:
+                    return False
+                await asyncio.sleep(min(self.lease_seconds / 3, 2 ** (attempt - 1)))
+        if not result.modified_count:
+            return False
+        try:
+            await self.release_slots([task])
+            if status in FINISHED_STATUSES and await release_dependents([str(task["_id"])]):
+                self.wakeup.set()
+        except Exception as exc:
+            logger.error("Bookkeeping after task %s finished as %s failed: %s", task["_id"], status, exc)
+        return True
+
+    # Eksponencijalni odmak s jitterom: pola odmaka je fiksno, druga polovica nasumična
+    def retry_delay(self, attempts: int) -> float:
+        delay = min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    # Neuspjeli pokušaj se ponovno zakazuje (preko scheduled_for i timera), a nakon zadnjeg
+    # dopuštenog pokušaja zadatak ostaje failed i kopira se u dead-letter kolekciju
+    async def fail(self, task: dict, exc: Exception):
+        attempts = task.get("attempts", 0) + 1
+        max_attempts = task.get("max_attempts") or self.max_attempts
+        fields = {"attempts": attempts, "error": str(exc)}
+        if attempts < max_attempts:
+            next_attempt_at = utc_now() + timedelta(seconds=self.retry_delay(attempts))
+            logger.warning("Task %s failed (attempt %d/%d), retrying at %s: %s",
+                           task["_id"], attempts, max_attempts, next_attempt_at, exc)
+            await self.finish(task, "scheduled", dict(fields, next_attempt_at=next_attempt_at, scheduled_for=next_attempt_at))
+            return
+        logger.error("Task %s failed after %d attempts: %s", task["_id"], attempts, exc)
+        finished_at = utc_now()
+        if await self.finish(task, "failed", dict(fields, finished_at=finished_at)):
+            dead_letter = {key: value for key, value in task.items() if key not in LEASE_FIELDS}
+            dead_letter.update(fields, status="failed", dead_at=finished_at)
+            try:
+                await dead_letter_tasks_collection.replace_one({"_id": task["_id"]}, dead_letter, upsert=True)
+            except Exception as exc:
+                logger.error("Copying task %s to the dead-letter queue failed: %s", task["_id"], exc)
+
+    # Vraćanje zadatka u pending kod gašenja kako bi ga drugi worker odmah mogao preuzeti
+    async def release(self, task: dict):
+        async with allocate_change_seq() as change_seq:
+            result = await tasks_collection.update_one(
+                {"_id": task["_id"], "lease_id": task["lease_id"]},
+                {"$set": {"status": "pending", "change_seq": change_seq}, "$unset": unset_lease()}
+            )
+            if result.modified_count:
+                await apply_stats_delta(transition_delta([task], "in-progress", "pending"))
+        if result.modified_count:
+            await self.release_slots([task])
+
+    async def reclaim_loop(self):
+        while True:
+            try:
+                reclaimed = await self.reclaim_expired()
+                await self.reconcile_slots()
+                if reclaimed:
+                    logger.info("Reclaimed %d tasks with expired leases", reclaimed)
+                    self.wakeup.set()
+            except Exception as exc:
+                logger.error("Reclaiming expired leases failed: %s", exc)
+            await asyncio.sleep(self.lease_seconds)
+
+    # Zadaci čiji je najam istekao (npr. worker se srušio) vraćaju se u pending
+    async def reclaim_expired(self) -> int:
+        now = utc_now()
+        expired = await tasks_collection.find(
+            {"status": "in-progress", "partition": {"$in": self.partitions}, "lease_expires_at": {"$lt": now}},
+            {"_id": 1, "user_id": 1, "lease_id": 1}
+        ).limit(self.batch_size).to_list(self.batch_size)
+        reclaimed = []
+        async with allocate_change_seq() as change_seq:
+            for task in expired:
+                before = await tasks_collection.find_one_and_update(
+                    {"_id": task["_id"], "lease_id": task["lease_id"], "lease_expires_at": {"$lt": now}},
+                    {"$set": {"status": "pending", "change_seq": change_seq}, "$unset": unset_lease()},
+                    projection={"user_id": 1, "queue": 1, "handler": 1},
+                    return_document=ReturnDocument.BEFORE
+                )
+                if before is not None:
+                    reclaimed.append(before)
+            await apply_stats_delta(transition_delta(reclaimed, "in-progress", "pending"))
+        await self.release_slots(reclaimed)
+        return len(reclaimed)
+
+    # Usklađivanje Mongo brojača sa stvarnim brojem zadataka u najmu (npr. nakon pada workera
+    # između zauzimanja mjesta i preuzimanja zadatka). Brojač se čita prije brojanja zadataka i
+    # ispravlja uvjetno na pročitanu vrijednost (compare-and-set), pa istodobno zauzimanje ili
+    # oslobađanje mjesta nije prebrisano. Mjesto zauzeto za zadatak koji još nije preuzet ne vidi se
+    # u brojanju, pa se brojač ispravlja tek kad je ista razlika viđena i u prošlom prolazu.
+    async def reconcile_slots(self):
+        if not self.user_limit and not self.queue_limits:
+            return
+        slots = {slot["_id"]: slot["running"] async for slot in task_slots_collection.find({})}
+        actual = Counter()
+        pipeline = [
+            {"$match": {"status": "in-progress", "lease_id": {"$exists": True}}},
+            {"$group": {"_id": {"user_id": "$user_id", "queue": "$queue"}, "count": {"$sum": 1}}}
+        ]
+        async for group in tasks_collection.aggregate(pipeline):
+            for key in slot_keys(group["_id"]):
+                actual[key] += group["count"]
+        drift = {key: (running, actual[key]) for key, running in slots.items() if running != actual[key]}
+        operations = [
+            UpdateOne({"_id": key, "running": running}, {"$set": {"running": count}})
+            for key, (running, count) in drift.items() if self.slot_drift.get(key) == (running, count)
+        ]
+        self.slot_drift = drift
+        if operations:
+            await task_slots_collection.bulk_write(operations, ordered=False)
+
+    # Učitavanje zakazanih zadataka u heap indeksiranim upitom po rasponu: novi dio horizonta
+    # i zadaci zakazani/pomaknuti nakon prošlog učitavanja (change_seq), bez ponovnog čitanja poznatih.
+    # Povremeno se cijeli horizont čita ispočetka, pa promjena koju upit po change_seq nije vidio
+    # (npr. upis pisača koji se nije javio dulje od CHANGE_SEQ_TIMEOUT_SECONDS) kasni najviše timer_rescan_interval.
+    async def load_timers(self):
+        horizon_end = utc_now() + timedelta(seconds=self.timer_horizon)
+        seq = await stable_change_seq()
+        partitions = self.partitions
+        if time.monotonic() >= self.next_timer_rescan:
+            self.loaded_until = None
+            self.next_timer_rescan = time.monotonic() + self.timer_rescan_interval
+        query = {"status": "scheduled", "partition": {"$in": partitions}, "scheduled_for": {"$lte": horizon_end}}
+        if self.loaded_until is not None:
+            query["$or"] = [
+                {"scheduled_for": {"$gt": self.loaded_until}},
+                {"change_seq": {"$gt": self.loaded_seq}}
+            ]
+            if self.loaded_after_id is not None:
+                query["$or"].append({"scheduled_for": self.loaded_until, "_id": {"$gt": self.loaded_after_id}})
+        tasks = await tasks_collection.find(
+            query, {"_id": 1, "user_id": 1, "scheduled_for": 1}
+        ).sort([("scheduled_for", ASCENDING), ("_id", ASCENDING)]).limit(self.timer_load_limit).to_list(self.timer_load_limit)
+        # Particije su se promijenile tijekom učitavanja; novi skup učitava se od početka
+        if partitions is not self.partitions:
+            return
+        for task in tasks:
+            entry = (as_utc(task["scheduled_for"]), task["_id"], task.get("user_id"))
+            if self.timer_entries.get(task["_id"]) != entry:
+                self.timer_entries[task["_id"]] = entry
+                heapq.heappush(self.timers, entry)
+        # Kod dosegnutog limita horizont se pomiče samo do zadnjeg učitanog zadatka (uključujući _id,
+        # kako se ne bi preskočili preostali zadaci zakazani za isti trenutak)
+        if len(tasks) == self.timer_load_limit:
+            self.loaded_until = as_utc(tasks[-1]["scheduled_for"])
+            self.loaded_after_id = tasks[-1]["_id"]
+        else:
+            self.loaded_until = horizon_end
+            self.loaded_after_id = None
+        self.loaded_seq = seq
+
+    def pop_due_timers(self) -> List[tuple]:
+        now = utc_now()
+        due = []
+        while self.timers and self.timers[0][0] <= now:
+            entry = heapq.heappop(self.timers)
+            # Zastarjeli unosi (zadatak je u međuvremenu pomaknut) se preskaču
+            if self.timer_entries.get(entry[1]) == entry:
+                del self.timer_entries[entry[1]]
+                due.append(entry)
+        return due
+
+    # Dospjeli zadaci prelaze iz scheduled u pending jednim update_many pozivom
+    async def activate(self, due: List[tuple]):
+        if await transition_tasks([entry[1] for entry in due], "scheduled", "pending"):
+            self.wakeup.set()
+
+    async def timer_loop(self):
+        next_load = utc_now()
+        while True:
+            try:
+                if utc_now() >= next_load:
+                    await self.load_timers()
+                    next_load = utc_now() + timedelta(seconds=self.timer_load_interval)
+                due = self.pop_due_timers()
+                if due:
+                    await self.activate(due)
+            except Exception as exc:
+                logger.error("Scheduled task activation failed: %s", exc)
+            wake_at = next_load
+            if self.timers and self.timers[0][0] < wake_at:
+                wake_at = self.timers[0][0]
+            await asyncio.sleep(max(0.0, (wake_at - utc_now()).total_seconds()))
+
+def create_executor() -> TaskExecutor:
+    return TaskExecutor(
+        concurrency=config["task_executor_concurrency"],
+        batch_size=config["task_executor_batch_size"],
+        lease_seconds=config["task_lease_seconds"],
+        poll_interval=config["task_executor_poll_interval"],
+        fair_share=config["task_fair_share"],
+        fairness_rounds=config["task_fairness_rounds"],
+        process_pool_size=config["task_process_pool_size"],
+        shared_memory_threshold=config["task_shared_memory_threshold"],
+        timer_horizon=config["task_timer_horizon_seconds"],
+        timer_load_interval=config["task_timer_load_interval"],
+        timer_load_limit=config["task_timer_load_limit"],
+        timer_rescan_interval=config["task_timer_rescan_interval"],
+        user_limit=config["task_user_limit"],
+        queue_limits=config["task_queue_limits"],
+        cap_backoff=config["task_cap_backoff_seconds"],
+        max_attempts=config["task_max_attempts"],
+        retry_base=config["task_retry_base_seconds"],
+        retry_max=config["task_retry_max_seconds"],
+        partition_lease_seconds=config["task_partition_lease_seconds"]
+    )
+
+# Samostalni worker (bez HTTP API-ja) pokreće se preko run_task_executor.py
+async def main():
+    load_handler_modules()
+    executor = create_executor()
+    try:
+        await executor.run()
+    finally:
+        await executor.stop()
+        await change_seq_writer.close()
@@ -0,0 +1,1002 @@
+import asyncio
+import logging
+import random
+import time
+import unicodedata
+import zlib
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from uuid import uuid4
+from bson import ObjectId
+from pymongo import ASCENDING, TEXT, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.results import UpdateResult
+from database import (
+    tasks_collection, task_stats_collection, counters_collection, task_tombstones_collection, task_change_writers_collection
+)
+from models import TaskStatus
+
+logger = logging.getLogger(__name__)
+
+# Polja koja izvršni sustav (task_executor) postavlja dok zadatak drži u najmu
+LEASE_FIELDS = ["lease_owner", "lease_id", "lease_expires_at", "claimed_at"]
+
+# Interna polja zadatka koja se ne vraćaju klijentima
+INTERNAL_TASK_FIELDS = ["search_title", "search_description", "activation_id", "partition"] + LEASE_FIELDS
+
+# Broj dokumenata po bulk_write pozivu kod naknadnog popunjavanja polja
+BACKFILL_BATCH_SIZE = 1000
+
+# Broj hash particija zadataka; promjena zahtijeva ponovni izračun polja partition
+PARTITION_COUNT = 64
+
+# ID dokumenta s globalnim brojačima statusa
+GLOBAL_STATS_ID = "global"
+
+# Inačica brojača; starije brojače (bez claimable) backfill_task_stats ponovno izračunava
+STATS_VERSION = 2
+
+# Ključ u promjenama brojača (umjesto statusa) za broj zadataka koje izvršni sustav može preuzeti
+# (pending s handlerom); upisuje se u polje claimable, a ne među brojače statusa
+CLAIMABLE = "claimable"
+
+# ID brojača s najvišim change_seq obrisanih tombstone zapisa
+TOMBSTONES_PURGED_ID = "task_tombstones_purged"
+
+# change_seq = (milisekunde << CHANGE_SEQ_NODE_BITS) | oznaka pisača: vrijednosti se ne ponavljaju
+# među pisačima i ostaju ispod 2^53 (JSON klijenti ih čitaju kao brojeve bez gubitka preciznosti)
+CHANGE_SEQ_NODE_BITS = 10
+
+# Razmak (sekunde) između objava donje granice slijeda pisača
+CHANGE_WRITER_HEARTBEAT_SECONDS = 1.0
+
+# Pisač koji se ne javi toliko sekundi smatra se ugašenim (proces se srušio)
+CHANGE_SEQ_TIMEOUT_SECONDS = 15
+
+# ID dokumenta među pisačima kojim ponovni izračun brojača traži pauzu upisa
+STATS_REBUILD_ID = "stats_rebuild"
+
+# Zahtjev za pauzom koji se ne obnovi toliko sekundi više ne vrijedi (ponovni izračun se srušio)
+STATS_REBUILD_TIMEOUT_SECONDS = 60
+
+# Postavljeno unutar bloka upisa (allocate_change_seq); ugniježđeni upis ne čeka pauzu jer bi
+# vanjski upis tada zauvijek držao pauzu nepotvrđenom
+change_seq_held: ContextVar[bool] = ContextVar("change_seq_held", default=False)
+
+# Statusi u kojima se ovisnosti zadatka još smiju mijenjati
+NOT_STARTED_STATUSES = ["pending", "blocked", "scheduled"]
+
+# Konačni statusi; prijelaz u njih otpušta ili (kod neuspjeha) obara sljedbenike
+FINISHED_STATUSES = ["completed", "failed"]
+
+# Statusi koje određuje samo task_store (iz run_at/not_before i depends_on); zadatak kojem ih
+# postavi klijent bez budućeg vremena ili ovisnosti nikad se ne bi otpustio
+DERIVED_STATUSES = ["scheduled", "blocked"]
+
+# Polja čije se česte promjene (status, napredak) spajaju u memoriji prije upisa
+BUFFERED_FIELDS = {"status", "progress"}
+
+# Vremenski prozor (sekunde) u kojem se spajaju promjene istog zadatka
+WRITE_BUFFER_WINDOW = 0.25
+
+# Najdulji razmak (sekunde) između ponovnih pokušaja neuspjelog upisa spremnika
+WRITE_BUFFER_MAX_RETRY_DELAY = 10.0
+
+# Neispravne ovisnosti (nepostojeći zadatak, ciklus, zadatak je već pokrenut)
+class DependencyError(ValueError):
+    pass
+
+# Položaj u slijedu promjena je stariji od čuvanih tombstone zapisa; klijent mora ponovno
+# sinkronizirati sve zadatke (since=0)
+class ChangeFeedExpired(Exception):
+    pass
+
+# Mala slova bez dijakritika (č/ć -> c, š -> s, ž -> z, đ -> dj)
+def fold_text(text: str) -> str:
+    text = text.lower().replace("đ", "dj")
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+# Normalizirana polja nad kojima je postavljen tekstualni indeks
+def search_fields(title: Optional[str] = None, description: Optional[str] = None) -> dict:
+    fields = {}
+    if title is not None:
+        fields["search_title"] = fold_text(title)
+    if description is not None:
+        fields["search_description"] = fold_text(description)
+    return fields
+
+# MongoDB vraća naivna UTC vremena; sva vremena se uspoređuju kao UTC-aware
+def as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+# Trenutak od kojeg se zadatak smije izvršiti (kasniji od run_at i not_before)
+def scheduled_time(task_dict: dict) -> Optional[datetime]:
+    times = [as_utc(task_dict[field]) for field in ("run_at", "not_before") if task_dict.get(field) is not None]
+    return max(times) if times else None
+
+# Particija se računa iz _id (nepromjenjiv) pa zadatak nikad ne mijenja particiju
+def task_partition(task_id: ObjectId) -> int:
+    return zlib.crc32(task_id.binary) % PARTITION_COUNT
+
+# Slijed promjena zadataka bez zajedničkog brojača: svaki proces (pisač) dodjeljuje change_seq
+# lokalno iz vremena i svoje oznake, pa upis ostaje jedan poziv baze. Slijed dodijeljen prije upisa
+# može postati vidljiv nakon upisa s višim slijedom, zato pisač svake sekunde objavljuje donju
+# granicu (najniži slijed koji još može upisati), a čitači ne prelaze najnižu granicu živih pisača
+# (stable_change_seq). Pisač preuzima najvišu objavljenu granicu ostalih pisača (kod prijave i u
+# svakoj objavi), pa pomak sata jednog stroja samo kratko zadržava čitače.
+# Upis i promjena brojača statusa koju izaziva izvode se unutar istog bloka, pa pisač može
+# zaustaviti upise tako da brojači i zadaci budu usklađeni (pause_task_writes).
+class ChangeSeqWriter:
+    def __init__(self):
+        self.token = uuid4().hex
+        self.node: Optional[int] = None
+        # Zadnji dodijeljeni trenutak (milisekunde); nikad ne ide unatrag, ni kad sat ide unatrag
+        self.ticks = 0
+        self.in_flight = set()
+        self.heartbeat: Optional[asyncio.Task] = None
+        self.started: Optional[asyncio.Future] = None
+        # Nedovršen dok traje zatražena pauza upisa; novi upisi ga čekaju
+        self.resumed: Optional[asyncio.Future] = None
+
+    def next_seq(self) -> int:
+        self.ticks = max(self.ticks + 1, int(time.time() * 1000))
+        return self.ticks << CHANGE_SEQ_NODE_BITS | self.node
+
+    # Najniži change_seq koji ovaj pisač još može upisati
+    def floor(self) -> int:
+        self.ticks = max(self.ticks, int(time.time() * 1000) - 1)
+        return min([(self.ticks + 1) << CHANGE_SEQ_NODE_BITS] + list(self.in_flight))
+
+    def adopt(self, writers: List[dict]):
+        self.ticks = max([self.ticks] + [writer["floor"] >> CHANGE_SEQ_NODE_BITS for writer in writers])
+
+    # Živi pisači (osim ovog) i ID zatražene pauze upisa, jednim upitom
+    async def read_writers(self) -> Tuple[List[dict], Optional[str]]:
+        now = datetime.now(timezone.utc)
+        writers = []
+        rebuild_id = None
+        async for document in task_change_writers_collection.find({}):
+            if as_utc(document["expires_at"]) <= now:
+                continue
+            if document["_id"] == STATS_REBUILD_ID:
+                rebuild_id = document["rebuild_id"]
+            elif document["_id"] != self.node:
+                writers.append(document)
+        return writers, rebuild_id
+
+    # Kod zatražene pauze novi upisi čekaju; pauza se potvrđuje (vraća se njezin ID) tek kad
+    # završe upisi u tijeku
+    async def pause(self, rebuild_id: Optional[str]) -> Optional[str]:
+        if rebuild_id is None:
+            if self.resumed is not None and not self.resumed.done():
+                self.resumed.set_result(None)
+            return None
+        if self.resumed is None or self.resumed.done():
+            self.resumed = asyncio.get_running_loop().create_future()
+        deadline = time.monotonic() + CHANGE_WRITER_HEARTBEAT_SECONDS
+        while self.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        return None if self.in_flight else rebuild_id
+
+    # Zauzimanje slobodne oznake pisača (nepostojeće ili istekle)
+    async def register(self):
+        writers, rebuild_id = await self.read_writers()
+        self.adopt(writers)
+        paused_for = await self.pause(rebuild_id)
+        taken = {writer["_id"] for writer in writers}
+        free = [node for node in range(1 << CHANGE_SEQ_NODE_BITS) if node not in taken]
+        random.shuffle(free)
+        for node in free:
+            now = datetime.now(timezone.utc)
+            try:
+                await task_change_writers_collection.update_one(
+                    {"_id": node, "expires_at": {"$lt": now}},
+                    {"$set": {
+                        "owner": self.token,
+                        "floor": self.floor(),
+                        "paused_for": paused_for,
+                        "expires_at": now + timedelta(seconds=CHANGE_SEQ_TIMEOUT_SECONDS)
+                    }},
+                    upsert=True
+                )
+            except DuplicateKeyError:
+                continue
+            self.node = node
+            return
+        raise RuntimeError("No free change_seq writer node")
+
+    # Objava donje granice; ako je oznaku u međuvremenu preuzeo drugi pisač (ovaj se nije javio
+    # do isteka), zauzima se nova
+    async def beat(self):
+        writers, rebuild_id = await self.read_writers()
+        self.adopt(writers)
+        paused_for = await self.pause(rebuild_id)
+        result = await task_change_writers_collection.update_one(
+            {"_id": self.node, "owner": self.token},
+            {"$set": {
+                "floor": self.floor(),
+                "paused_for": paused_for,
+                "expires_at": datetime.now(timezone.utc) + timedelta(seconds=CHANGE_SEQ_TIMEOUT_SECONDS)
+            }}
+        )
+        if result.matched_count == 0:
+            await self.register()
+
+    async def keep_alive(self, started: asyncio.Future):
+        try:
+            await self.register()
+        except asyncio.CancelledError:
+            started.cancel()
+            raise
+        except Exception as exc:
+            started.set_exception(exc)
+            return
+        started.set_result(None)
+        while True:
+            await asyncio.sleep(CHANGE_WRITER_HEARTBEAT_SECONDS)
+            try:
+                await self.beat()
+            except Exception as exc:
+                logger.warning("Publishing change_seq floor failed: %s", exc)
+
+    # Prijava pisača kod prvog upisa ili čitanja u procesu (i nakon prekida objavljivanja)
+    async def start(self):
+        if self.heartbeat is None or self.heartbeat.done():
+            self.started = asyncio.get_running_loop().create_future()
+            self.resumed = None
+            self.heartbeat = asyncio.create_task(self.keep_alive(self.started))
+        await asyncio.shield(self.started)
+
+    @asynccontextmanager
+    async def allocate(self) -> AsyncIterator[int]:
+        await self.start()
+        if not change_seq_held.get():
+            while self.resumed is not None and not self.resumed.done():
+                await asyncio.shield(self.resumed)
+        change_seq = self.next_seq()
+        self.in_flight.add(change_seq)
+        held = change_seq_held.set(True)
+        try:
+            yield change_seq
+        finally:
+            change_seq_held.reset(held)
+            self.in_flight.discard(change_seq)
+
+    # Gašenje: oznaka se odmah oslobađa kako čitači ne bi čekali njezin istek
+    async def close(self):
+        if self.heartbeat is not None:
+            self.heartbeat.cancel()
+            self.heartbeat = None
+        if self.node is not None:
+            await task_change_writers_collection.delete_one({"_id": self.node, "owner": self.token})
+            self.node = None
+
+change_seq_writer = ChangeSeqWriter()
+
+# Dodjela sljedeće vrijednosti monotono rastućeg slijeda promjena zadataka za upis unutar bloka;
+# bez poziva baze (osim prijave pisača kod prvog upisa u procesu)
+def allocate_change_seq():
+    return change_seq_writer.allocate()
+
+# Najviši change_seq do kojeg su svi upisi završeni; promjene iznad njega čitači još ne vraćaju.
+# Pisači koji se nisu javili do isteka (srušeni procesi) se zanemaruju.
+async def stable_change_seq() -> int:
+    await change_seq_writer.start()
+    writers, _ = await change_seq_writer.read_writers()
+    return min([writer["floor"] for writer in writers] + [change_seq_writer.floor()]) - 1
+
+# Obnavljanje zahtjeva za pauzom dok traje ponovni izračun
+async def keep_stats_rebuild(rebuild_id: str):
+    while True:
+        await asyncio.sleep(STATS_REBUILD_TIMEOUT_SECONDS / 3)
+        await task_change_writers_collection.update_one(
+            {"_id": STATS_REBUILD_ID, "rebuild_id": rebuild_id},
+            {"$set": {"expires_at": datetime.now(timezone.utc) + timedelta(seconds=STATS_REBUILD_TIMEOUT_SECONDS)}}
+        )
+
+# Zaustavljanje upisa zadataka u svim procesima dok traje blok: čeka se da svaki živi pisač
+# potvrdi pauzu (završio je upise u tijeku i ne započinje nove); upisi se nastavljaju kad
+# zahtjev nestane ili istekne
+@asynccontextmanager
+async def pause_task_writes():
+    rebuild_id = uuid4().hex
+    now = datetime.now(timezone.utc)
+    try:
+        await task_change_writers_collection.update_one(
+            {"_id": STATS_REBUILD_ID, "expires_at": {"$lt": now}},
+            {"$set": {"rebuild_id": rebuild_id, "expires_at": now + timedelta(seconds=STATS_REBUILD_TIMEOUT_SECONDS)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        raise RuntimeError("Task statistics rebuild already running")
+    renewal = asyncio.create_task(keep_stats_rebuild(rebuild_id))
+    try:
+        # Pisač ovog procesa potvrđuje pauzu odmah, ostali u sljedećoj objavi
+        if change_seq_writer.heartbeat is not None and not change_seq_writer.heartbeat.done():
+            await change_seq_writer.beat()
+        deadline = time.monotonic() + CHANGE_SEQ_TIMEOUT_SECONDS
+        while True:
+            now = datetime.now(timezone.utc)
+            writers = await task_change_writers_collection.find(
+                {"floor": {"$exists": True}, "expires_at": {"$gt": now}}, {"paused_for": 1}
+            ).to_list(None)
+            if all(writer.get("paused_for") == rebuild_id for writer in writers):
+                break
+            if time.monotonic() >= deadline:
+                raise RuntimeError("Task writers did not pause for the statistics rebuild")
+            await asyncio.sleep(CHANGE_WRITER_HEARTBEAT_SECONDS / 4)
+        yield
+    finally:
+        renewal.cancel()
+        await task_change_writers_collection.delete_one({"_id": STATS_REBUILD_ID, "rebuild_id": rebuild_id})
+        if change_seq_writer.heartbeat is not None and not change_seq_writer.heartbeat.done():
+            await change_seq_writer.pause(None)
+
+def tombstone(task: dict, change_seq: int) -> dict:
+    return {
+        "task_id": task["_id"],
+        "user_id": task.get("user_id"),
+        "change_seq": change_seq,
+        "deleted_at": datetime.now(timezone.utc)
+    }
+
+def user_stats_id(user_id: str) -> str:
+    return f"user:{user_id}"
+
+# Primjena promjena brojača oblika {(user_id, status): delta} jednim bulk_write pozivom
+async def apply_stats_delta(delta: Counter):
+    global_inc = Counter()
+    user_inc = defaultdict(Counter)
+    for (user_id, status), count in delta.items():
+        if count == 0 or status is None:
+            continue
+        field = CLAIMABLE if status == CLAIMABLE else f"counts.{status}"
+        global_inc[field] += count
+        if user_id is not None:
+            user_inc[user_id][field] += count
+    if not global_inc:
+        return
+    operations = [UpdateOne({"_id": GLOBAL_STATS_ID}, {"$inc": dict(global_inc)}, upsert=True)]
+    for user_id, inc in user_inc.items():
+        operations.append(UpdateOne(
+            {"_id": user_stats_id(user_id)},
+            {"$inc": dict(inc), "$set": {"user_id": user_id}},
+            upsert=True
+        ))
+    await task_stats_collection.bulk_write(operations, ordered=False)
+
+def is_claimable(task: dict) -> bool:
+    return task.get("status") == "pending" and task.get("handler") is not None
+
+# Promjena brojača kad zadatak prijeđe iz stanja before u after (None: zadatak ne postoji);
+# dovoljna su polja user_id, status i handler
+def stats_change(before: Optional[dict], after: Optional[dict]) -> Counter:
+    delta = Counter()
+    for task, sign in ((before, -1), (after, 1)):
+        if task is not None:
+            delta[(task.get("user_id"), task.get("status"))] += sign
+            if is_claimable(task):
+                delta[(task.get("user_id"), CLAIMABLE)] += sign
+    return delta
+
+# Promjena brojača kad zadaci prijeđu iz jednog statusa u drugi
+def transition_delta(tasks: List[dict], from_status: str, to_status: str) -> Counter:
+    delta = Counter()
+    for task in tasks:
+        delta.update(stats_change(dict(task, status=from_status), dict(task, status=to_status)))
+    return delta
+
+# Broj zadataka po (user_id, status, handler) za dani upit, jednim agregacijskim upitom
+async def grouped_status_counts(query: dict) -> Counter:
+    pipeline = [
+        {"$match": query},
+        {"$group": {"_id": {"user_id": "$user_id", "status": "$status", "handler": "$handler"}, "count": {"$sum": 1}}}
+    ]
+    counts = Counter()
+    async for group in tasks_collection.aggregate(pipeline):
+        key = group["_id"]
+        counts[(key.get("user_id"), key.get("status"), key.get("handler"))] = group["count"]
+    return counts
+
+# Ponovni izračun svih brojača iz zadataka; brojači se grade u privremenoj kolekciji koja zatim
+# jednim rename-om zamjenjuje postojeću, pa čitači nikad ne vide prazne ili djelomične brojače.
+# Upisi zadataka su za to vrijeme zaustavljeni, inače bi promjena brojača upisana u staru kolekciju
+# između agregacije i rename-a bila izgubljena.
+async def rebuild_task_stats():
+    async with pause_task_writes():
+        counts = await grouped_status_counts({})
+        documents = {GLOBAL_STATS_ID: {"_id": GLOBAL_STATS_ID, "version": STATS_VERSION, "counts": Counter(), CLAIMABLE: 0}}
+        for (user_id, status, handler), count in counts.items():
+            if status is None:
+                continue
+            claimable = count if is_claimable({"status": status, "handler": handler}) else 0
+            documents[GLOBAL_STATS_ID]["counts"][status] += count
+            documents[GLOBAL_STATS_ID][CLAIMABLE] += claimable
+            if user_id is not None:
+                document = documents.setdefault(
+                    user_stats_id(user_id),
+                    {"_id": user_stats_id(user_id), "user_id": user_id, "counts": Counter(), CLAIMABLE: 0}
+                )
+                document["counts"][status] += count
+                document[CLAIMABLE] += claimable
+        rebuilt_collection = task_stats_collection.database[f"{task_stats_collection.name}_rebuild"]
+        await rebuilt_collection.drop()
+        await rebuilt_collection.insert_many(
+            [dict(document, counts=dict(document["counts"])) for document in documents.values()]
+        )
+        await rebuilt_collection.rename(task_stats_collection.name, dropTarget=True)
+
+# Prijelaz skupine zadataka iz jednog statusa u drugi; oznaka prijelaza omogućuje točne brojače
+# i kad drugi worker istodobno mijenja iste zadatke. Vraća zadatke koji su stvarno prešli.
+async def transition_tasks(task_ids: list, from_status: str, to_status: str, fields: Optional[dict] = None) -> List[dict]:
+    if not task_ids:
+        return []
+    activation_id = uuid4().hex
+    async with allocate_change_seq() as change_seq:
+        result = await tasks_collection.update_many(
+            {"_id": {"$in": task_ids}, "status": from_status},
+            {"$set": dict(fields or {}, status=to_status, activation_id=activation_id, change_seq=change_seq)}
+        )
+        if result.modified_count == 0:
+            return []
+        moved = await tasks_collection.find({"activation_id": activation_id}, {"user_id": 1, "handler": 1}).to_list(None)
+        await apply_stats_delta(transition_delta(moved, from_status, to_status))
+    return moved
+
+# Status u koji prelazi zadatak kad mu se ispune sve ovisnosti
+def released_status(task: dict) -> str:
+    scheduled_for = task.get("scheduled_for")
+    if scheduled_for is not None and as_utc(scheduled_for) > datetime.now(timezone.utc):
+        return "scheduled"
+    return "pending"
+
+# Provjera da task_id nije (posredno) preduvjet vlastitih ovisnosti, obilaskom grafa po razinama
+async def ensure_acyclic(task_id: str, dependencies: List[dict]):
+    visited = set()
+    frontier = {dependency_id for dependency in dependencies for dependency_id in dependency.get("depends_on") or []}
+    while frontier:
+        if task_id in frontier:
+            raise DependencyError("Dependency cycle detected")
+        visited |= frontier
+        parents = await tasks_collection.find(
+            {"_id": {"$in": [ObjectId(dependency_id) for dependency_id in frontier]}},
+            {"depends_on": 1}
+        ).to_list(None)
+        frontier = {
+            dependency_id for parent in parents for dependency_id in parent.get("depends_on") or []
+        } - visited
+
+# Provjera ovisnosti; vraća ID-eve ovisnosti koje još nisu završene
+async def check_dependencies(task_id: ObjectId, depends_on: List[str]) -> List[str]:
+    dependency_ids = set(depends_on)
+    if not all(ObjectId.is_valid(dependency_id) for dependency_id in dependency_ids):
+        raise DependencyError("Invalid dependency id format")
+    if str(task_id) in dependency_ids:
+        raise DependencyError("Dependency cycle detected")
+    dependencies = await tasks_collection.find(
+        {"_id": {"$in": [ObjectId(dependency_id) for dependency_id in dependency_ids]}},
+        {"status": 1, "depends_on": 1}
+    ).to_list(None)
+    if len(dependencies) != len(dependency_ids):
+        raise DependencyError("Dependency task not found")
+    if any(dependency.get("status") == "failed" for dependency in dependencies):
+        raise DependencyError("Dependency task has failed")
+    await ensure_acyclic(str(task_id), dependencies)
+    return sorted(str(dependency["_id"]) for dependency in dependencies if dependency.get("status") != "completed")
+
+# Polja za promjenu ovisnosti postojećeg zadatka; None ako zadatak ne postoji
+async def dependency_update(task_id: ObjectId, depends_on: List[str]) -> Optional[dict]:
+    task = await tasks_collection.find_one({"_id": task_id}, {"status": 1, "scheduled_for": 1})
+    if task is None:
+        return None
+    if task.get("status") not in NOT_STARTED_STATUSES:
+        raise DependencyError("Dependencies can only be changed before the task starts")
+    remaining_dependencies = await check_dependencies(task_id, depends_on)
+    return {
+        "depends_on": depends_on,
+        "remaining_dependencies": remaining_dependencies,
+        "status": "blocked" if remaining_dependencies else released_status(task)
+    }
+
+# Otpuštanje blokiranih zadataka kojima su ispunjene sve ovisnosti
+async def unblock_ready(query: dict) -> int:
+    ready = await tasks_collection.find(
+        dict(query, status="blocked", remaining_dependencies={"$size": 0}),
+        {"scheduled_for": 1}
+    ).to_list(None)
+    released = 0
+    for status in ("pending", "scheduled"):
+        task_ids = [task["_id"] for task in ready if released_status(task) == status]
+        released += len(await transition_tasks(task_ids, "blocked", status))
+    return released
+
+# Obrada blokiranih zadataka (uz query) koji čekaju neku od danih ovisnosti. Blokirani zadatak u
+# remaining_dependencies drži ID-eve nezavršenih ovisnosti: završena ovisnost se uklanja s $pull
+# (ponovljena obrada ništa ne mijenja), a zadatak s praznim popisom se otpušta. Zadatak koji čeka
+# propalu ili obrisanu ovisnost i sam propada. Posao je razmjeran broju sljedbenika danih ovisnosti.
+# Vraća broj otpuštenih zadataka i ID-eve zadataka koji su propali.
+async def settle_dependents(dependency_ids: List[str], query: Optional[dict] = None) -> Tuple[int, List[str]]:
+    statuses = {
+        str(dependency["_id"]): dependency.get("status") async for dependency in tasks_collection.find(
+            {"_id": {"$in": [ObjectId(dependency_id) for dependency_id in dependency_ids]}}, {"status": 1}
+        )
+    }
+    completed = [dependency_id for dependency_id in dependency_ids if statuses.get(dependency_id) == "completed"]
+    missing = sorted(dependency_id for dependency_id in dependency_ids if dependency_id not in statuses)
+    failed = sorted(dependency_id for dependency_id in dependency_ids if statuses.get(dependency_id) == "failed")
+    released = 0
+    if completed:
+        waiting = dict(query or {}, status="blocked", remaining_dependencies={"$in": completed})
+        task_ids = [task["_id"] async for task in tasks_collection.find(waiting, {"_id": 1})]
+        if task_ids:
+            await tasks_collection.update_many(
+                {"_id": {"$in": task_ids}, "status": "blocked"},
+                {"$pull": {"remaining_dependencies": {"$in": completed}}}
+            )
+            released = await unblock_ready({"_id": {"$in": task_ids}})
+    failed_ids = []
+    if missing or failed:
+        broken = defaultdict(list)
+        waiting = dict(query or {}, status="blocked", remaining_dependencies={"$in": missing + failed})
+        async for task in tasks_collection.find(waiting, {"remaining_dependencies": 1}):
+            remaining = set(task["remaining_dependencies"])
+            errors = [f"Dependency {dependency_id} was deleted" for dependency_id in missing if dependency_id in remaining]
+            errors += [f"Dependency {dependency_id} failed" for dependency_id in failed if dependency_id in remaining]
+            broken[errors[0]].append(task["_id"])
+        for error, task_ids in broken.items():
+            moved = await transition_tasks(task_ids, "blocked", "failed", {"error": error, "finished_at": datetime.now(timezone.utc)})
+            failed_ids += [str(task["_id"]) for task in moved]
+    return released, failed_ids
+
+# Sljedbenici zadataka koji su završili, propali ili su obrisani. Zadatak koji čeka propalu ili
+# obrisanu ovisnost ne može se više izvršiti pa propada, a s njim i njegovi sljedbenici.
+# Vraća broj otpuštenih zadataka.
+async def release_dependents(task_ids: List[str]) -> int:
+    released = 0
+    while task_ids:
+        count, task_ids = await settle_dependents(task_ids)
+        released += count
+    return released
+
+# Ovisnost je mogla završiti, propasti ili biti obrisana između provjere ovisnosti i upisa zadatka
+async def settle_blocked_task(task_id: ObjectId, remaining_dependencies: List[str]):
+    _, failed_ids = await settle_dependents(remaining_dependencies, {"_id": task_id})
+    await release_dependents(failed_ids)
+
+# Interna polja novog zadatka (pretraga, particija, vrijeme ulaska u red, zakazani status).
+# Status se svodi na TaskStatus (nepoznat status je ValueError), a scheduled i blocked koje je
+# poslao klijent postaju pending i ponovno se izvode iz vremena i ovisnosti.
+def prepare_task_document(task_dict: dict):
+    status = TaskStatus(task_dict.get("status") or TaskStatus.pending).value
+    task_dict["status"] = TaskStatus.pending.value if status in DERIVED_STATUSES else status
+    task_dict.update(search_fields(task_dict.get("title"), task_dict.get("description")))
+    task_dict.setdefault("_id", ObjectId())
+    task_dict["partition"] = task_partition(task_dict["_id"])
+    task_dict.setdefault("priority", 0)
+    task_dict.setdefault("enqueued_at", datetime.now(timezone.utc))
+    scheduled_for = scheduled_time(task_dict)
+    if scheduled_for is not None and scheduled_for > task_dict["enqueued_at"]:
+        task_dict["status"] = "scheduled"
+        task_dict["scheduled_for"] = scheduled_for
+
+async def insert_task(task_dict: dict):
+    prepare_task_document(task_dict)
+    if task_dict.get("depends_on"):
+        task_dict["remaining_dependencies"] = await check_dependencies(task_dict["_id"], task_dict["depends_on"])
+        if task_dict["remaining_dependencies"]:
+            task_dict["status"] = "blocked"
+    async with allocate_change_seq() as change_seq:
+        task_dict["change_seq"] = change_seq
+        result = await tasks_collection.insert_one(task_dict)
+        await apply_stats_delta(stats_change(None, task_dict))
+    if task_dict.get("status") == "blocked":
+        await settle_blocked_task(task_dict["_id"], task_dict["remaining_dependencies"])
+    return result
+
+# Skupni upis novih zadataka bez ovisnosti (uvoz podataka) jednim insert_many pozivom; svi dijele
+# jedan change_seq, a brojači se ažuriraju samo za stvarno upisane. Vraća broj upisanih.
+async def insert_tasks(task_dicts: List[dict]) -> int:
+    if not task_dicts:
+        return 0
+    if any(task_dict.get("depends_on") for task_dict in task_dicts):
+        raise DependencyError("Tasks with dependencies must be inserted with insert_task")
+    failed = set()
+    async with allocate_change_seq() as change_seq:
+        for task_dict in task_dicts:
+            prepare_task_document(task_dict)
+            task_dict["change_seq"] = change_seq
+        try:
+            await tasks_collection.insert_many(task_dicts, ordered=False)
+        except BulkWriteError as e:
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+        delta = Counter()
+        for index, task_dict in enumerate(task_dicts):
+            if index not in failed:
+                delta.update(stats_change(None, task_dict))
+        await apply_stats_delta(delta)
+    return len(task_dicts) - len(failed)
+
+# Ažuriranje jednog zadatka; vraća novo stanje ili None ako zadatak ne postoji
+async def update_task_document(task_id, update_data: dict) -> Optional[dict]:
+    update_data = dict(update_data, **search_fields(update_data.get("title"), update_data.get("description")))
+    async with allocate_change_seq() as change_seq:
+        update_data["change_seq"] = change_seq
+        before = await tasks_collection.find_one_and_update(
+            {"_id": task_id},
+            {"$set": update_data},
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is None:
+            return None
+        after = dict(before, **update_data)
+        await apply_stats_delta(stats_change(before, after))
+    if after.get("status") in FINISHED_STATUSES and before.get("status") != after.get("status"):
+        await release_dependents([str(task_id)])
+    if after.get("status") == "blocked" and "remaining_dependencies" in update_data:
+        await settle_blocked_task(task_id, update_data["remaining_dependencies"])
+    return after
+
+# Svi zadaci izmijenjeni istim skupnim ažuriranjem dijele isti change_seq; uz limit se mijenja
+# najviše limit zadataka (obrada u blokovima). Kod promjene statusa ili korisnika update_many se
+# izvodi po skupini (user_id, status, handler) s tim stanjem u filteru, pa je modified_count skupine točan
+# broj prijelaza i kad drugi worker istodobno mijenja iste zadatke. Zadaci koji su između
+# grupiranja i upisa prešli u drugu skupinu obrađuju se u sljedećem prolazu; zadaci s novijim
+# change_seq (izmijenjeni nakon početka ažuriranja) se ne diraju.
+async def update_tasks(query: dict, update_data: dict, limit: Optional[int] = None) -> UpdateResult:
+    if limit is not None:
+        task_ids = [task["_id"] async for task in tasks_collection.find(query, {"_id": 1}).limit(limit)]
+        query = {"$and": [query, {"_id": {"$in": task_ids}}]}
+    update_data = dict(update_data, **search_fields(update_data.get("title"), update_data.get("description")))
+    if "status" not in update_data and "user_id" not in update_data:
+        async with allocate_change_seq() as change_seq:
+            return await tasks_collection.update_many(query, {"$set": dict(update_data, change_seq=change_seq)})
+    modified_count = 0
+    delta = Counter()
+    finished_ids = []
+    async with allocate_change_seq() as change_seq:
+        update_data["change_seq"] = change_seq
+        remaining = {"$and": [query, {"change_seq": {"$not": {"$gte": change_seq}}}]}
+        groups = await grouped_status_counts(remaining)
+        while groups:
+            for user_id, status, handler in groups:
+                activation_id = uuid4().hex
+                group = {"user_id": user_id, "status": status, "handler": handler}
+                result = await tasks_collection.update_many(
+                    {"$and": [remaining, group]},
+                    {"$set": dict(update_data, activation_id=activation_id)}
+                )
+                modified_count += result.modified_count
+                after = dict(group, **{field: update_data[field] for field in ("user_id", "status") if field in update_data})
+                for key, count in stats_change(group, after).items():
+                    delta[key] += count * result.modified_count
+                if result.modified_count and update_data.get("status") in FINISHED_STATUSES and status != update_data["status"]:
+                    finished_ids += [
+                        str(task["_id"]) async for task in tasks_collection.find({"activation_id": activation_id}, {"_id": 1})
+                    ]
+            groups = await grouped_status_counts(remaining)
+        await apply_stats_delta(delta)
+    await release_dependents(finished_ids)
+    return UpdateResult({"n": modified_count, "nModified": modified_count}, acknowledged=True)
+
+async def delete_task_document(task_id) -> Optional[dict]:
+    async with allocate_change_seq() as change_seq:
+        task = await tasks_collection.find_one_and_delete({"_id": task_id})
+        if task is None:
+            return None
+        await task_tombstones_collection.insert_one(tombstone(task, change_seq))
+        await apply_stats_delta(stats_change(task, None))
+    await release_dependents([str(task_id)])
+    return task
+
+# Skupno brisanje u blokovima; za svaki obrisani zadatak ostaje tombstone. Uz limit se briše
+# najviše limit zadataka. Vraća broj obrisanih.
+async def delete_tasks(query: dict, limit: Optional[int] = None) -> int:
+    deleted_count = 0
+    while limit is None or deleted_count < limit:
+        batch_size = BACKFILL_BATCH_SIZE if limit is None else min(BACKFILL_BATCH_SIZE, limit - deleted_count)
+        tasks = await tasks_collection.find(
+            query, {"_id": 1, "user_id": 1, "status": 1, "handler": 1}
+        ).limit(batch_size).to_list(batch_size)
+        if not tasks:
+            return deleted_count
+        async with allocate_change_seq() as change_seq:
+            result = await tasks_collection.delete_many({"_id": {"$in": [task["_id"] for task in tasks]}})
+            await task_tombstones_collection.insert_many([tombstone(task, change_seq) for task in tasks])
+            delta = Counter()
+            for task in tasks:
+                delta.update(stats_change(task, None))
+            await apply_stats_delta(delta)
+        await release_dependents([str(task["_id"]) for task in tasks])
+        deleted_count += result.deleted_count
+    return deleted_count
+
+# Write-behind spajanje čestih promjena: unutar prozora se za svaki zadatak pamti stanje iz baze
+# (base) i zadnje vrijednosti polja, a flush ih upisuje jednim bulk_write pozivom s jednim change_seq.
+# Upis je uvjetovan change_seq-om iz base stanja; ako je zadatak u međuvremenu izmijenjen drugim
+# putem, promjena se upisuje preko update_task_document kako bi brojači statusa ostali točni.
+# Spremnik je lokalan za proces: overlay vidi samo promjene zabilježene u istom procesu, pa napredak
+# koji javljaju handleri samostalnog workera (run_task_executor.py) task_worker vidi tek nakon upisa.
+class TaskWriteBuffer:
+    def __init__(self, window: float):
+        self.window = window
+        self.pending: Dict[ObjectId, dict] = {}
+        self.lock = asyncio.Lock()
+        self.flusher: Optional[asyncio.Task] = None
+        # Broj uzastopnih neuspjelih upisa; određuje odgodu sljedećeg pokušaja
+        self.failures = 0
+
+    # Bilježenje promjene; vraća stanje zadatka s neupisanim promjenama ili None ako zadatak ne postoji
+    async def update(self, task_id: ObjectId, fields: dict) -> Optional[dict]:
+        entry = self.pending.get(task_id)
+        if entry is None:
+            base = await tasks_collection.find_one({"_id": task_id})
+            if base is None:
+                return None
+            entry = self.pending.setdefault(task_id, {"base": base, "fields": {}})
+        entry["fields"].update(fields)
+        self.schedule(self.window)
+        return dict(entry["base"], **entry["fields"])
+
+    def schedule(self, delay: float):
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.create_task(self.flush_later(delay))
+
+    # Neupisane vrijednosti preko dokumenta iz baze (read-your-writes); kod projekcije samo dohvaćena polja
+    def overlay(self, task_id: ObjectId, document: dict, projected: bool = False) -> dict:
+        entry = self.pending.get(task_id)
+        if entry is None:
+            return document
+        fields = entry["fields"]
+        if projected:
+            fields = {key: value for key, value in fields.items() if key in document}
+        return dict(document, **fields)
+
+    # Uklanjanje neupisanih promjena zadatka kako bi ih pozivatelj upisao zajedno sa svojom promjenom
+    def take(self, task_id: ObjectId) -> dict:
+        entry = self.pending.pop(task_id, None)
+        return entry["fields"] if entry else {}
+
+    async def flush_later(self, delay: float):
+        await asyncio.sleep(delay)
+        await self.flush()
+
+    # Upis spremnika; kod greške baze neupisane promjene vraćaju se u spremnik (novije promjene
+    # istog zadatka imaju prednost) i upis se ponavlja s rastućom odgodom
+    async def flush(self):
+        async with self.lock:
+            entries, self.pending = self.pending, {}
+            if not entries:
+                return
+            try:
+                await self.write(entries)
+            except Exception as exc:
+                self.failures += 1
+                delay = min(WRITE_BUFFER_MAX_RETRY_DELAY, self.window * 2 ** self.failures)
+                logger.error("Writing %d buffered task updates failed, retrying in %.2fs: %s", len(entries), delay, exc)
+                for task_id, entry in entries.items():
+                    newer = self.pending.get(task_id)
+                    if newer is not None:
+                        entry["fields"].update(newer["fields"])
+                    self.pending[task_id] = entry
+                if self.flusher is asyncio.current_task():
+                    self.flusher = None
+                self.schedule(delay)
+                return
+            self.failures = 0
+
+    # Upisane promjene uklanjaju se iz entries, pa nakon greške u njemu ostaju samo neupisane.
+    # Greška nakon upisa (brojači, sljedbenici) se ne ponavlja, nego samo bilježi u log.
+    async def write(self, entries: Dict[ObjectId, dict]):
+        async with allocate_change_seq() as change_seq:
+            await tasks_collection.bulk_write([
+                UpdateOne(
+                    {"_id": task_id, "change_seq": entry["base"].get("change_seq")},
+                    {"$set": dict(entry["fields"], change_seq=change_seq)}
+                )
+                for task_id, entry in entries.items()
+            ], ordered=False)
+            applied = {task["_id"] async for task in tasks_collection.find(
+                {"_id": {"$in": list(entries)}, "change_seq": change_seq}, {"_id": 1}
+            )}
+            delta = Counter()
+            finished_ids = []
+            for task_id in applied:
+                entry = entries.pop(task_id)
+                after = dict(entry["base"], **entry["fields"])
+                delta.update(stats_change(entry["base"], after))
+                if after.get("status") in FINISHED_STATUSES and entry["base"].get("status") != after.get("status"):
+                    finished_ids.append(str(task_id))
+            try:
+                await apply_stats_delta(delta)
+            except Exception as exc:
+                logger.error("Updating task stats after writing buffered task updates failed: %s", exc)
+        try:
+            await release_dependents(finished_ids)
+        except Exception as exc:
+            logger.error("Bookkeeping after writing buffered task updates failed: %s", exc)
+        for task_id, entry in list(entries.items()):
+            await update_task_document(task_id, entry["fields"])
+            del entries[task_id]
+
+    # Gašenje: upisuje sve što je ostalo u spremniku (flush koji je u tijeku završava prije)
+    async def close(self):
+        await self.flush()
+        if self.pending:
+            logger.error("%d buffered task updates were not written before shutdown", len(self.pending))
+
+write_buffer = TaskWriteBuffer(WRITE_BUFFER_WINDOW)
+
+def change_event(document: dict, deleted: bool) -> dict:
+    if deleted:
+        return {"id": str(document["task_id"]), "change_seq": document["change_seq"], "deleted": True}
+    task = {key: value for key, value in document.items() if key not in INTERNAL_TASK_FIELDS}
+    return dict(task, deleted=False)
+
+# Položaj u slijedu promjena: "change_seq" ili "change_seq:id" (zadnja isporučena promjena)
+def parse_change_cursor(cursor: str) -> Tuple[int, Optional[ObjectId]]:
+    change_seq, _, task_id = cursor.partition(":")
+    if not change_seq.isdigit() or (task_id and not ObjectId.is_valid(task_id)):
+        raise ValueError("Invalid change cursor")
+    return int(change_seq), ObjectId(task_id) if task_id else None
+
+def change_cursor(change_seq: int, task_id: Optional[ObjectId]) -> str:
+    return str(change_seq) if task_id is None else f"{change_seq}:{task_id}"
+
+def event_cursor(event: dict) -> str:
+    return change_cursor(event["change_seq"], event["id"] if event["deleted"] else event["_id"])
+
+# Promjene nakon položaja (since, since_id), a najviše do stabilnog slijeda; id_field je ključ
+# drugog dijela položaja (_id zadatka, odnosno task_id tombstone zapisa)
+def changes_query(since: int, since_id: Optional[ObjectId], until: int, id_field: str, user_id: Optional[str]) -> dict:
+    query = {"change_seq": {"$gt": since, "$lte": until}}
+    if since_id is not None:
+        query = {"$or": [query, {"change_seq": since, id_field: {"$gt": since_id}}]}
+    if user_id is not None:
+        query = {"$and": [{"user_id": user_id}, query]}
+    return query
+
+# Klijent čiji je položaj ispod najvišeg obrisanog tombstone zapisa možda je propustio brisanja
+async def check_change_position(since: int, since_id: Optional[ObjectId]):
+    if since == 0 and since_id is None:
+        return
+    purged = await counters_collection.find_one({"_id": TOMBSTONES_PURGED_ID})
+    purged_seq = purged["seq"] if purged else 0
+    if since < purged_seq or (since == purged_seq and since_id is not None):
+        raise ChangeFeedExpired("Change feed position is older than retained tombstones, resync required")
+
+# Promjene zadataka nakon danog položaja (izmijenjeni zadaci i tombstone zapisi), poredane po
+# (change_seq, id). Stranica se reže po složenom ključu pa i velika skupina s istim change_seq
+# (skupno ažuriranje) ide u više stranica, a next_since je položaj zadnje vraćene promjene.
+async def fetch_task_changes(since: int, since_id: Optional[ObjectId], user_id: Optional[str], limit: int) -> dict:
+    await check_change_position(since, since_id)
+    until = await stable_change_seq()
+    tasks = await tasks_collection.find(
+        changes_query(since, since_id, until, "_id", user_id)
+    ).sort([("change_seq", ASCENDING), ("_id", ASCENDING)]).limit(limit + 1).to_list(limit + 1)
+    tombstones = await task_tombstones_collection.find(
+        changes_query(since, since_id, until, "task_id", user_id)
+    ).sort([("change_seq", ASCENDING), ("task_id", ASCENDING)]).limit(limit + 1).to_list(limit + 1)
+    changes = sorted(
+        [(task["change_seq"], task["_id"], change_event(task, False)) for task in tasks]
+        + [(item["change_seq"], item["task_id"], change_event(item, True)) for item in tombstones],
+        key=lambda change: change[:2]
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    next_since = change_cursor(*changes[-1][:2]) if changes else change_cursor(since, since_id)
+    return {"changes": [event for _, _, event in changes], "next_since": next_since, "has_more": has_more}
+
+# Brisanje tombstone zapisa starijih od roka čuvanja. Najviši obrisani change_seq bilježi se prije
+# brisanja, pa klijent s ranijim položajem dobiva ChangeFeedExpired umjesto nepotpunih promjena.
+async def purge_tombstones(retention_seconds: int) -> int:
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=retention_seconds)
+    purged_count = 0
+    while True:
+        expired = await task_tombstones_collection.find(
+            {"deleted_at": {"$lt": cutoff}}, {"change_seq": 1}
+        ).sort("change_seq", ASCENDING).limit(BACKFILL_BATCH_SIZE).to_list(BACKFILL_BATCH_SIZE)
+        if not expired:
+            return purged_count
+        await counters_collection.update_one(
+            {"_id": TOMBSTONES_PURGED_ID}, {"$max": {"seq": expired[-1]["change_seq"]}}, upsert=True
+        )
+        result = await task_tombstones_collection.delete_many({"_id": {"$in": [item["_id"] for item in expired]}})
+        purged_count += result.deleted_count
+
+async def ensure_indexes():
+    await tasks_collection.create_index([("change_seq", ASCENDING), ("_id", ASCENDING)])
+    await tasks_collection.create_index([("user_id", ASCENDING), ("change_seq", ASCENDING), ("_id", ASCENDING)])
+    await tasks_collection.create_index([("remaining_dependencies", ASCENDING), ("status", ASCENDING)])
+    await task_tombstones_collection.create_index([("change_seq", ASCENDING), ("task_id", ASCENDING)])
+    await task_tombstones_collection.create_index([("user_id", ASCENDING), ("change_seq", ASCENDING), ("task_id", ASCENDING)])
+    # Tombstone zapise briše purge_tombstones (bilježi obrisani slijed), a ne TTL indeks
+    deleted_at_index = (await task_tombstones_collection.index_information()).get("deleted_at_1", {})
+    if "expireAfterSeconds" in deleted_at_index:
+        await task_tombstones_collection.drop_index("deleted_at_1")
+    await task_tombstones_collection.create_index("deleted_at")
+    await tasks_collection.create_index(
+        [("search_title", TEXT), ("search_description", TEXT)],
+        weights={"search_title": 3, "search_description": 1},
+        default_language="none",
+        name="task_text_search"
+    )
+
+# Particija je interno polje pa se popunjava bez novog change_seq
+async def backfill_partitions():
+    cursor = tasks_collection.find({"partition": {"$exists": False}}, {"_id": 1}).batch_size(BACKFILL_BATCH_SIZE)
+    operations = []
+    async for task in cursor:
+        operations.append(UpdateOne({"_id": task["_id"]}, {"$set": {"partition": task_partition(task["_id"])}}))
+        if len(operations) >= BACKFILL_BATCH_SIZE:
+            await tasks_collection.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        await tasks_collection.bulk_write(operations, ordered=False)
+
+# Zadaci spremljeni prije uvođenja prioriteta dobivaju prioritet 0 i vrijeme ulaska u red iz _id-a;
+# bez tih polja sortiranje preuzimanja stavlja ih iza svih ostalih zadataka
+async def backfill_claim_fields():
+    query = {"$or": [{"priority": {"$exists": False}}, {"enqueued_at": {"$exists": False}}]}
+    cursor = tasks_collection.find(query, {"priority": 1, "enqueued_at": 1}).batch_size(BACKFILL_BATCH_SIZE)
+    operations = []
+    async for task in cursor:
+        fields = {"priority": task.get("priority", 0), "enqueued_at": task.get("enqueued_at", task["_id"].generation_time)}
+        operations.append(UpdateOne({"_id": task["_id"]}, {"$set": fields}))
+        if len(operations) >= BACKFILL_BATCH_SIZE:
+            await tasks_collection.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        await tasks_collection.bulk_write(operations, ordered=False)
+
+# Popunjavanje pretraživih polja i change_seq za zadatke spremljene prije njihovog uvođenja
+async def backfill_task_fields():
+    query = {"$or": [{"search_title": {"$exists": False}}, {"change_seq": {"$exists": False}}]}
+    if await tasks_collection.find_one(query, {"_id": 1}) is not None:
+        async with allocate_change_seq() as change_seq:
+            cursor = tasks_collection.find(query, {"title": 1, "description": 1}).batch_size(BACKFILL_BATCH_SIZE)
+            operations = []
+            async for task in cursor:
+                fields = search_fields(task.get("title", ""), task.get("description", ""))
+                fields["change_seq"] = change_seq
+                operations.append(UpdateOne({"_id": task["_id"]}, {"$set": fields}))
+                if len(operations) >= BACKFILL_BATCH_SIZE:
+                    await tasks_collection.bulk_write(operations, ordered=False)
+                    operations = []
+            if operations:
+                await tasks_collection.bulk_write(operations, ordered=False)
+    await backfill_partitions()
+    await backfill_claim_fields()
+    await backfill_remaining_dependencies()
+    await backfill_task_stats()
+
+# Blokirani zadaci iz vremena brojača pending_dependencies dobivaju popis svih ovisnosti koji se
+# zatim usklađuje sa stanjem ovisnosti (završene se uklanjaju, propale obaraju zadatak)
+async def backfill_remaining_dependencies():
+    query = {"status": "blocked", "remaining_dependencies": {"$exists": False}}
+    while True:
+        tasks = await tasks_collection.find(query, {"depends_on": 1}).limit(BACKFILL_BATCH_SIZE).to_list(BACKFILL_BATCH_SIZE)
+        if not tasks:
+            return
+        await tasks_collection.bulk_write([
+            UpdateOne(
+                {"_id": task["_id"]},
+                {"$set": {"remaining_dependencies": sorted(set(task.get("depends_on") or []))}, "$unset": {"pending_dependencies": ""}}
+            )
+            for task in tasks
+        ], ordered=False)
+        dependency_ids = sorted({dependency_id for task in tasks for dependency_id in task.get("depends_on") or []})
+        _, failed_ids = await settle_dependents(dependency_ids, {"_id": {"$in": [task["_id"] for task in tasks]}})
+        await release_dependents(failed_ids)
+        # Zadatak bez ovisnosti (ili s već završenim) otpušta se odmah
+        await unblock_ready({"_id": {"$in": [task["_id"] for task in tasks]}})
+
+# Brojači se izračunavaju ispočetka ako ne postoje ili su starije inačice
+async def backfill_task_stats():
+    if await task_stats_collection.find_one({"_id": GLOBAL_STATS_ID, "version": {"$gte": STATS_VERSION}}, {"_id": 1}) is None:
+        await rebuild_task_stats()
@@ -1,34 +1,129 @@
 import json
-from fastapi import FastAPI, HTTPException
+import asyncio
+import logging
+from fastapi import FastAPI, HTTPException, Query, Request, Header
 import httpx
 from pydantic import BaseModel
 from typing import List, Optional
 from bson import ObjectId
-from database import tasks_collection, users_collection
+from database import tasks_collection, users_collection, task_stats_collection, dead_letter_tasks_collection
+from cache import TTLCache
+from query_utils import build_projection, projected_response, serialize_document, export_response, export_columns
+from fastapi.responses import JSONResponse, StreamingResponse
+from task_store import (
+    INTERNAL_TASK_FIELDS, GLOBAL_STATS_ID, fold_text, user_stats_id, ensure_indexes, backfill_task_fields,
+    insert_task, update_task_document, update_tasks, delete_task_document, delete_tasks, rebuild_task_stats,
+    fetch_task_changes, dependency_update, DependencyError, transition_tasks, BACKFILL_BATCH_SIZE,
+    BUFFERED_FIELDS, write_buffer, ChangeFeedExpired, parse_change_cursor, check_change_position, event_cursor,
+    purge_tombstones, change_seq_writer, DERIVED_STATUSES
+)
+from models import Task, TaskStatus
+from task_executor import create_executor, load_handler_modules
+from logging_config import setup_logging
 
 with open("config.json") as config_file:
     config = json.load(config_file)
 
+setup_logging("task_worker", config["log_level"], config["log_sampling"])
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
 #Configurable parameters from config.jso
 task_worker_host = config["task_worker_host"]
 task_worker_port = config["task_worker_port"]
+notification_service_host = config["notification_service_host"]
+notification_service_port = config["notification_service_port"]
+export_batch_size = config["export_batch_size"]
+tombstone_retention_seconds = config["tombstone_retention_seconds"]
+tombstone_purge_interval = config["tombstone_purge_interval"]
+change_feed_poll_interval = config["change_feed_poll_interval"]
+task_executor_enabled = config["task_executor_enabled"]
+
+# Izvršni sustav zadataka (pokreće se samo ako je uključen u config.json)
+executor = None
+
+# Pozadinski poslovi pokrenuti kod startupa (referenca sprječava da ih skupi garbage collector)
+background_jobs = set()
 
+# Cache poznatih korisnika kako create_task ne bi svaki put išao u bazu
+known_users = TTLCache(config["user_cache_size"], config["user_cache_ttl"])
 
-# Model za Task
-class Task(BaseModel):
-    title: str
-    description: str
-    status: str = "pending"
-    user_id: Optional[str] = None  
 
 # Model za ažuriranje Task-a
 class UpdateTaskModel(BaseModel):
     title: Optional[str]
     description: Optional[str]
-    status: Optional[str]
+    status: Optional[TaskStatus]
     user_id: Optional[str]  
+    depends_on: Optional[List[str]]
+    progress: Optional[float]
+
+    class Config:
+        use_enum_values = True
+
+# Status scheduled/blocked ne postavlja klijent (task_store ga izvodi iz vremena i ovisnosti)
+def check_update_status(update_data: dict):
+    if update_data.get("status") in DERIVED_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Status {update_data['status']} cannot be set directly")
+
+# Provjera postojanja korisnika (dohvaća se samo _id, pozitivni rezultati se cacheiraju)
+async def user_exists(user_id: str) -> bool:
+    if known_users.get(user_id):
+        return True
+    user = await users_collection.find_one({"_id": ObjectId(user_id)}, {"_id": 1})
+    if user is None:
+        return False
+    known_users.set(user_id, True)
+    return True
+
+# Rezultat pretrage zadataka s ocjenom relevantnosti
+class TaskSearchResult(Task):
+    id: str
+    score: float
+
+# Filter za skupne operacije (barem jedan kriterij je obavezan)
+class TaskFilter(BaseModel):
+    ids: Optional[List[str]] = None
+    user_id: Optional[str] = None
+    status: Optional[str] = None
+
+# Model za skupno ažuriranje zadataka
+class BulkUpdateTasks(BaseModel):
+    filter: TaskFilter
+    update: UpdateTaskModel
+
+# Filter za zapise u dead-letter kolekciji
+class DeadLetterFilter(BaseModel):
+    ids: Optional[List[str]] = None
+    user_id: Optional[str] = None
+    handler: Optional[str] = None
+
+def build_dead_letter_filter(dead_letter_filter: DeadLetterFilter) -> dict:
+    query = {}
+    if dead_letter_filter.ids is not None:
+        if not all(ObjectId.is_valid(task_id) for task_id in dead_letter_filter.ids):
+            raise HTTPException(status_code=400, detail="Invalid task id format")
+        query["_id"] = {"$in": [ObjectId(task_id) for task_id in dead_letter_filter.ids]}
+    if dead_letter_filter.user_id is not None:
+        query["user_id"] = dead_letter_filter.user_id
+    if dead_letter_filter.handler is not None:
+        query["handler"] = dead_letter_filter.handler
+    return query
+
+def build_task_filter(task_filter: TaskFilter) -> dict:
+    query = {}
+    if task_filter.ids is not None:
+        if not all(ObjectId.is_valid(task_id) for task_id in task_filter.ids):
+            raise HTTPException(status_code=400, detail="Invalid task id format")
+        query["_id"] = {"$in": [ObjectId(task_id) for task_id in task_filter.ids]}
+    if task_filter.user_id is not None:
+        query["user_id"] = task_filter.user_id
+    if task_filter.status is not None:
+        query["status"] = task_filter.status
+    if not query:
+        raise HTTPException(status_code=400, detail="At least one filter field is required")
+    return query
 
 @app.post("/tasks/", response_model=dict)
 async def create_task(task: Task):
@@ -37,13 +132,15 @@ async def create_task(task: Task):
         raise HTTPException(status_code=400, detail="Invalid user_id format")
     
     # Provjera postojanja korisnika s danim user_id
-    user = await users_collection.find_one({"_id": ObjectId(task.user_id)})
-    if user is None:
+    if not await user_exists(task.user_id):
         raise HTTPException(status_code=404, detail="User with given ID does not exist")
 
     # Ako je user_id validan, kreiraj zadatak
     task_dict = task.dict()
-    result = await tasks_collection.insert_one(task_dict)
+    try:
+        result = await insert_task(task_dict)
+    except DependencyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     # Slanje obavijesti korisniku putem notification_service
     notification_data = {
@@ -54,10 +151,10 @@ async def create_task(task: Task):
 
     try:
         async with httpx.AsyncClient(timeout=10.0) as client:
-            notification_response = await client.post(f"http://127.0.0.1:8003/notifications/", json=notification_data)
+            notification_response = await client.post(f"http://{notification_service_host}:{notification_service_port}/notifications/", json=notification_data)
             notification_response.raise_for_status()  # Provjeri je li obavijest uspješno poslana
     except httpx.HTTPStatusError as e:
-        print(f"Failed to send notification: {e}")
+        logger.warning("Failed to send notification for task %s: %s", result.inserted_id, e)
         # Ovdje možete odlučiti kako dalje, npr. obrisati kreirani zadatak ili samo nastaviti
 
     return {"id": str(result.inserted_id)}
@@ -65,41 +162,269 @@ async def create_task(task: Task):
 
 # Dohvaćanje svih zadataka
 @app.get("/tasks/", response_model=List[Task])
-async def get_tasks():
-    tasks = await tasks_collection.find().to_list(100)
+async def get_tasks(fields: Optional[str] = None):
+    projection = build_projection(fields, Task.__fields__)
+    tasks = await tasks_collection.find({}, projection).to_list(100)
+    if projection is not None:
+        return projected_response(tasks)
     return tasks
 
+# Skupno ažuriranje zadataka jednim update_many pozivom
+@app.patch("/tasks/bulk", response_model=dict)
+async def bulk_update_tasks(request: BulkUpdateTasks):
+    query = build_task_filter(request.filter)
+    update_data = {k: v for k, v in request.update.dict().items() if v is not None}
+    if not update_data:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    if "depends_on" in update_data:
+        raise HTTPException(status_code=400, detail="Dependencies cannot be changed in bulk")
+    check_update_status(update_data)
+    await write_buffer.flush()
+    result = await update_tasks(query, update_data)
+    return {"matched_count": result.matched_count, "modified_count": result.modified_count}
+
+# Skupno brisanje zadataka jednim delete_many pozivom
+@app.delete("/tasks/bulk", response_model=dict)
+async def bulk_delete_tasks(task_filter: TaskFilter):
+    query = build_task_filter(task_filter)
+    await write_buffer.flush()
+    deleted_count = await delete_tasks(query)
+    return {"deleted_count": deleted_count}
+
+# Izvoz svih zadataka kao NDJSON ili CSV stream
+@app.get("/tasks/export")
+async def export_tasks(
+    export_format: str = Query("ndjson", alias="format"),
+    status: Optional[str] = None,
+    user_id: Optional[str] = None,
+    fields: Optional[str] = None,
+    gzip: bool = False
+):
+    projection = build_projection(fields, Task.__fields__)
+    if projection is None:
+        projection = {field: 0 for field in INTERNAL_TASK_FIELDS}
+    query = {}
+    if status is not None:
+        query["status"] = status
+    if user_id is not None:
+        query["user_id"] = user_id
+    cursor = tasks_collection.find(query, projection).batch_size(export_batch_size)
+    return export_response(cursor, export_format, export_columns(fields, Task.__fields__), gzip, "tasks")
+
+# Pretraga zadataka po naslovu i opisu (tekstualni indeks, bez dijakritika)
+@app.get("/tasks/search", response_model=List[TaskSearchResult])
+async def search_tasks(q: str, user_id: Optional[str] = None, limit: int = Query(20, ge=1, le=100)):
+    query = {"$text": {"$search": fold_text(q)}}
+    if user_id is not None:
+        query["user_id"] = user_id
+    projection = {"score": {"$meta": "textScore"}}
+    projection.update({field: 0 for field in INTERNAL_TASK_FIELDS})
+    cursor = tasks_collection.find(query, projection).sort([("score", {"$meta": "textScore"})]).limit(limit)
+    return [serialize_document(task) async for task in cursor]
+
+# Brojači zadataka po statusu (globalno, za jednog korisnika ili za sve korisnike)
+def stats_counts(document: Optional[dict]) -> dict:
+    counts = {status.value: 0 for status in TaskStatus}
+    if document is not None:
+        counts.update(document.get("counts", {}))
+    return counts
+
+@app.get("/tasks/stats", response_model=dict)
+async def get_task_stats(user_id: Optional[str] = None, per_user: bool = False):
+    if user_id is not None:
+        document = await task_stats_collection.find_one({"_id": user_stats_id(user_id)})
+        counts = stats_counts(document)
+        return {"user_id": user_id, "total": sum(counts.values()), "by_status": counts}
+    document = await task_stats_collection.find_one({"_id": GLOBAL_STATS_ID})
+    counts = stats_counts(document)
+    stats = {"total": sum(counts.values()), "by_status": counts}
+    if per_user:
+        stats["by_user"] = {
+            user_stats["user_id"]: stats_counts(user_stats)
+            async for user_stats in task_stats_collection.find({"_id": {"$ne": GLOBAL_STATS_ID}})
+        }
+    return stats
+
+# Ponovni izračun brojača jednim agregacijskim upitom (upisi zadataka za to vrijeme čekaju)
+@app.post("/tasks/stats/rebuild", response_model=dict)
+async def rebuild_stats():
+    try:
+        await rebuild_task_stats()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"message": "Task statistics rebuilt"}
+
+def change_position(cursor: str):
+    try:
+        return parse_change_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Promjene zadataka nakon danog položaja (delta sinkronizacija klijenata); since je next_since
+# prethodnog odgovora, a 410 znači da klijent mora ponovno sinkronizirati sve od since=0
+@app.get("/tasks/changes", response_model=dict)
+async def get_task_changes(since: str = "0", user_id: Optional[str] = None, limit: int = Query(500, ge=1, le=1000)):
+    since_seq, since_id = change_position(since)
+    try:
+        changes = await fetch_task_changes(since_seq, since_id, user_id, limit)
+    except ChangeFeedExpired as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    changes["changes"] = [serialize_document(event) for event in changes["changes"]]
+    return changes
+
+# Iste promjene kao Server-Sent Events stream; nastavak je moguć preko Last-Event-ID. Ako položaj
+# tijekom streama istekne, šalje se događaj resync i stream se zatvara.
+@app.get("/tasks/changes/stream")
+async def stream_task_changes(
+    request: Request,
+    since: str = "0",
+    user_id: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None)
+):
+    since_seq, since_id = change_position(last_event_id if last_event_id is not None else since)
+    try:
+        await check_change_position(since_seq, since_id)
+    except ChangeFeedExpired as e:
+        raise HTTPException(status_code=410, detail=str(e))
+
+    async def events():
+        position = (since_seq, since_id)
+        while not await request.is_disconnected():
+            try:
+                changes = await fetch_task_changes(*position, user_id, 500)
+            except ChangeFeedExpired:
+                yield "event: resync\ndata: {}\n\n"
+                return
+            for event in changes["changes"]:
+                data = json.dumps(serialize_document(event), ensure_ascii=False)
+                yield f"id: {event_cursor(event)}\nevent: {'delete' if event['deleted'] else 'upsert'}\ndata: {data}\n\n"
+            position = parse_change_cursor(changes["next_since"])
+            if not changes["has_more"]:
+                yield ": keep-alive\n\n"
+                await asyncio.sleep(change_feed_poll_interval)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+# Zadaci koji su iscrpili sve pokušaje izvršavanja
+@app.get("/tasks/dead-letter", response_model=List[dict])
+async def get_dead_letter_tasks(
+    user_id: Optional[str] = None,
+    handler: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    query = build_dead_letter_filter(DeadLetterFilter(user_id=user_id, handler=handler))
+    cursor = dead_letter_tasks_collection.find(query, {field: 0 for field in INTERNAL_TASK_FIELDS})
+    return [serialize_document(task) async for task in cursor.sort("dead_at", -1).limit(limit)]
+
+# Skupno vraćanje zadataka iz dead-letter kolekcije u red (brojač pokušaja kreće ispočetka)
+@app.post("/tasks/dead-letter/requeue", response_model=dict)
+async def requeue_dead_letter_tasks(dead_letter_filter: DeadLetterFilter):
+    query = build_dead_letter_filter(dead_letter_filter)
+    requeued_count = 0
+    while True:
+        entries = await dead_letter_tasks_collection.find(query, {"_id": 1}).limit(BACKFILL_BATCH_SIZE).to_list(BACKFILL_BATCH_SIZE)
+        if not entries:
+            return {"requeued_count": requeued_count}
+        task_ids = [entry["_id"] for entry in entries]
+        moved = await transition_tasks(task_ids, "failed", "pending", {"attempts": 0, "error": None})
+        await dead_letter_tasks_collection.delete_many({"_id": {"$in": task_ids}})
+        requeued_count += len(moved)
+
 # Dohvaćanje zadatka prema ID-u
 @app.get("/tasks/{task_id}", response_model=Task)
-async def get_task(task_id: str):
-    task = await tasks_collection.find_one({"_id": ObjectId(task_id)})
+async def get_task(task_id: str, fields: Optional[str] = None):
+    projection = build_projection(fields, Task.__fields__)
+    task = await tasks_collection.find_one({"_id": ObjectId(task_id)}, projection)
     if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
+    task = write_buffer.overlay(ObjectId(task_id), task, projected=projection is not None)
+    if projection is not None:
+        return JSONResponse(content=serialize_document(task))
     return task
 
 # Dohvaćanje zadataka prema korisniku
 @app.get("/tasks/user/{user_id}", response_model=List[Task])
-async def get_tasks_by_user(user_id: str):
-    tasks = await tasks_collection.find({"user_id": user_id}).to_list(100)
+async def get_tasks_by_user(user_id: str, fields: Optional[str] = None):
+    projection = build_projection(fields, Task.__fields__)
+    tasks = await tasks_collection.find({"user_id": user_id}, projection).to_list(100)
+    if projection is not None:
+        return projected_response(tasks)
     return tasks
 
 # Ažuriranje zadatka prema ID-u
 @app.put("/tasks/{task_id}", response_model=Task)
 async def update_task(task_id: str, task: UpdateTaskModel):
     update_data = {k: v for k, v in task.dict().items() if v is not None}
-    result = await tasks_collection.update_one({"_id": ObjectId(task_id)}, {"$set": update_data})
-    if result.modified_count == 0:
-        raise HTTPException(status_code=404, detail="Task not found or no change detected")
-    return await get_task(task_id)
+    if not update_data:
+        return await get_task(task_id)
+    check_update_status(update_data)
+    # Česte promjene statusa/napretka spajaju se u spremniku i upisuju skupno
+    if set(update_data) <= BUFFERED_FIELDS:
+        updated_task = await write_buffer.update(ObjectId(task_id), update_data)
+        if updated_task is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        return updated_task
+    update_data = dict(write_buffer.take(ObjectId(task_id)), **update_data)
+    if "depends_on" in update_data:
+        try:
+            dependency_fields = await dependency_update(ObjectId(task_id), update_data["depends_on"])
+        except DependencyError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if dependency_fields is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        update_data.update(dependency_fields)
+    updated_task = await update_task_document(ObjectId(task_id), update_data)
+    if updated_task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return updated_task
 
 # Brisanje zadatka prema ID-u
 @app.delete("/tasks/{task_id}", response_model=dict)
 async def delete_task(task_id: str):
-    result = await tasks_collection.delete_one({"_id": ObjectId(task_id)})
-    if result.deleted_count == 0:
+    write_buffer.take(ObjectId(task_id))
+    deleted_task = await delete_task_document(ObjectId(task_id))
+    if deleted_task is None:
         raise HTTPException(status_code=404, detail="Task not found")
     return {"message": "Task deleted successfully"}
 
+# Poništavanje cache unosa za korisnika (poziva ga user_service nakon brisanja korisnika)
+@app.delete("/cache/users/{user_id}", response_model=dict)
+async def invalidate_user_cache(user_id: str):
+    known_users.invalidate(user_id)
+    return {"message": "User cache entry invalidated"}
+
+# Periodično brisanje tombstone zapisa starijih od roka čuvanja
+async def purge_tombstones_periodically():
+    while True:
+        try:
+            purged_count = await purge_tombstones(tombstone_retention_seconds)
+            if purged_count:
+                logger.info("Purged %d task tombstones", purged_count)
+        except Exception as e:
+            logger.error("Failed to purge task tombstones: %s", e)
+        await asyncio.sleep(tombstone_purge_interval)
+
+@app.on_event("startup")
+async def startup_task_store():
+    await ensure_indexes()
+    await backfill_task_fields()
+    background_jobs.add(asyncio.create_task(purge_tombstones_periodically()))
+
+@app.on_event("startup")
+async def startup_executor():
+    global executor
+    if task_executor_enabled:
+        load_handler_modules()
+        executor = create_executor()
+        background_jobs.add(asyncio.create_task(executor.run()))
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    if executor is not None:
+        await executor.stop()
+    await write_buffer.close()
+    await change_seq_writer.close()
+
 # Health Check ruta
 @app.get("/health")
 async def health_check():
@@ -112,4 +437,5 @@ async def read_root():
 # Pokretanje aplikacije
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host=task_worker_host, port=task_worker_port)
\ No newline at end of file
+    # log_config=None: uvicorn ne postavlja vlastite handlere, zapisi idu kroz setup_logging
+    uvicorn.run(app, host=task_worker_host, port=task_worker_port, log_config=None)
\ No newline at end of file
@@ -0,0 +1,25 @@
+import asyncio
+import os
+import sys
+import motor.motor_asyncio
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Moduli čitaju config.json iz radnog direktorija, a database.py se spaja na MongoDB kod importa;
+# testovi umjesto toga koriste mongomock bazu u memoriji
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+motor.motor_asyncio.AsyncIOMotorClient = lambda *args, **kwargs: AsyncMongoMockClient()
+
+import database  # noqa: E402
+
+@pytest.fixture(autouse=True)
+def clean_database():
+    yield
+    asyncio.run(database.client.drop_database(database.db.name))
+
+@pytest.fixture
+def run():
+    return asyncio.run
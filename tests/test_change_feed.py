@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from database import tasks_collection, task_tombstones_collection, task_change_writers_collection
+from task_store import (
+    ChangeFeedExpired, allocate_change_seq, change_seq_writer, delete_task_document, fetch_task_changes, insert_task,
+    insert_tasks, parse_change_cursor, purge_tombstones, stable_change_seq, update_tasks
+)
+
+async def fetch_all(user_id=None, limit=5) -> list:
+    events = []
+    since, since_id = 0, None
+    while True:
+        page = await fetch_task_changes(since, since_id, user_id, limit)
+        assert len(page["changes"]) <= limit
+        events += page["changes"]
+        since, since_id = parse_change_cursor(page["next_since"])
+        if not page["has_more"]:
+            return events
+
+def test_same_seq_group_is_split_across_pages(run):
+    async def scenario():
+        await insert_tasks([{"title": f"t{index}", "description": "", "user_id": "u"} for index in range(50)])
+        await update_tasks({"user_id": "u"}, {"description": "changed"})
+        first = await fetch_task_changes(0, None, None, 5)
+        assert len(first["changes"]) == 5 and first["has_more"]
+        events = await fetch_all()
+        assert len(events) == 50
+        assert len({event["_id"] for event in events}) == 50
+        assert {event["description"] for event in events} == {"changed"}
+
+    run(scenario())
+
+def test_tombstones_are_paged_with_tasks(run):
+    async def scenario():
+        for index in range(7):
+            await insert_task({"title": f"t{index}", "description": "", "user_id": "u"})
+        task = await tasks_collection.find_one({"title": "t3"})
+        await delete_task_document(task["_id"])
+        events = await fetch_all(user_id="u", limit=2)
+        assert [event["deleted"] for event in events] == [False] * 6 + [True]
+        assert events[-1]["id"] == str(task["_id"])
+
+    run(scenario())
+
+def test_readers_stop_below_write_in_flight(run):
+    async def scenario():
+        await insert_task({"title": "before", "description": "", "user_id": "u"})
+        async with allocate_change_seq():
+            # Kasniji upis završava dok je raniji slijed još u tijeku
+            await insert_task({"title": "after", "description": "", "user_id": "u"})
+            page = await fetch_task_changes(0, None, None, 10)
+            assert [event["title"] for event in page["changes"]] == ["before"]
+        page = await fetch_task_changes(*parse_change_cursor(page["next_since"]), None, 10)
+        assert [event["title"] for event in page["changes"]] == ["after"]
+
+    run(scenario())
+
+def test_other_writer_floor_holds_readers_until_it_expires(run):
+    async def scenario():
+        await insert_task({"title": "t", "description": "", "user_id": "u"})
+        task = await tasks_collection.find_one({})
+        # Drugi proces je dodijelio niži slijed koji još nije upisao
+        writer = {"_id": 1023 - change_seq_writer.node, "owner": "other", "floor": task["change_seq"] - 1}
+        await task_change_writers_collection.insert_one(dict(writer, expires_at=datetime.now(timezone.utc) + timedelta(seconds=10)))
+        assert (await fetch_task_changes(0, None, None, 10))["changes"] == []
+        # Proces koji se ne javlja do isteka više ne zadržava čitače
+        await task_change_writers_collection.update_one({"_id": writer["_id"]}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}})
+        page = await fetch_task_changes(0, None, None, 10)
+        assert [event["title"] for event in page["changes"]] == ["t"]
+
+    run(scenario())
+
+def test_writes_need_no_shared_document(run):
+    async def scenario():
+        await insert_task({"title": "first", "description": "", "user_id": "u"})
+        writers = await task_change_writers_collection.count_documents({})
+        sequences = []
+        for index in range(20):
+            async with allocate_change_seq() as change_seq:
+                sequences.append(change_seq)
+        assert sequences == sorted(set(sequences))
+        assert await task_change_writers_collection.count_documents({}) == writers == 1
+        await change_seq_writer.close()
+        assert await task_change_writers_collection.count_documents({}) == 0
+        # Nakon gašenja novi upis ponovno prijavljuje pisača, a slijed i dalje raste
+        async with allocate_change_seq() as change_seq:
+            assert change_seq > sequences[-1]
+        assert await stable_change_seq() >= change_seq
+
+    run(scenario())
+
+def test_position_older_than_purged_tombstones_requires_resync(run):
+    async def scenario():
+        await insert_task({"title": "t", "description": "", "user_id": "u"})
+        task = await tasks_collection.find_one({})
+        page = await fetch_task_changes(0, None, None, 10)
+        await delete_task_document(task["_id"])
+        await task_tombstones_collection.update_many({}, {"$set": {"deleted_at": datetime.now(timezone.utc) - timedelta(days=30)}})
+        assert await purge_tombstones(3600) == 1
+        with pytest.raises(ChangeFeedExpired):
+            await fetch_task_changes(*parse_change_cursor(page["next_since"]), None, 10)
+        assert (await fetch_task_changes(0, None, None, 10))["changes"] == []
+
+    run(scenario())
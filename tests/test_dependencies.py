@@ -0,0 +1,91 @@
+import pytest
+from database import tasks_collection
+from task_store import (
+    DependencyError, backfill_remaining_dependencies, delete_task_document, insert_task, release_dependents, update_task_document
+)
+
+async def new_task(title: str, depends_on=None) -> dict:
+    task = {"title": title, "description": "", "status": "pending", "user_id": "u"}
+    if depends_on:
+        task["depends_on"] = [str(dependency["_id"]) for dependency in depends_on]
+    await insert_task(task)
+    return task
+
+async def reload(task: dict) -> dict:
+    return await tasks_collection.find_one({"_id": task["_id"]})
+
+def test_repeated_release_does_not_unblock_early(run):
+    async def scenario():
+        first = await new_task("first")
+        second = await new_task("second")
+        dependent = await new_task("dependent", [first, second])
+        assert (await reload(dependent))["status"] == "blocked"
+        await update_task_document(first["_id"], {"status": "completed"})
+        # Ponovljena obrada istog završetka (npr. nakon ponovljenog upisa) ne smije otpustiti zadatak
+        await release_dependents([str(first["_id"])])
+        await release_dependents([str(first["_id"])])
+        task = await reload(dependent)
+        assert task["status"] == "blocked" and task["remaining_dependencies"] == [str(second["_id"])]
+        await update_task_document(second["_id"], {"status": "completed"})
+        task = await reload(dependent)
+        assert task["status"] == "pending" and task["remaining_dependencies"] == []
+
+    run(scenario())
+
+def test_failed_dependency_fails_dependents_transitively(run):
+    async def scenario():
+        first = await new_task("first")
+        second = await new_task("second", [first])
+        third = await new_task("third", [second])
+        await update_task_document(first["_id"], {"status": "failed"})
+        second, third = await reload(second), await reload(third)
+        assert second["status"] == "failed" and second["error"] == f"Dependency {first['_id']} failed"
+        assert third["status"] == "failed" and third["error"] == f"Dependency {second['_id']} failed"
+        with pytest.raises(DependencyError):
+            await new_task("late", [first])
+
+    run(scenario())
+
+def test_deleted_dependency_fails_dependents(run):
+    async def scenario():
+        first = await new_task("first")
+        dependent = await new_task("dependent", [first])
+        await delete_task_document(first["_id"])
+        task = await reload(dependent)
+        assert task["status"] == "failed" and task["error"] == f"Dependency {first['_id']} was deleted"
+
+    run(scenario())
+
+def test_client_cannot_set_derived_status(run):
+    async def scenario():
+        # Bez ovisnosti i budućeg run_at zadatak se odmah može izvršiti
+        blocked = {"title": "b", "description": "", "status": "blocked", "user_id": "u"}
+        scheduled = {"title": "s", "description": "", "status": "scheduled", "user_id": "u"}
+        await insert_task(blocked)
+        await insert_task(scheduled)
+        assert (await reload(blocked))["status"] == "pending"
+        assert (await reload(scheduled))["status"] == "pending"
+        with pytest.raises(ValueError):
+            await insert_task({"title": "x", "description": "", "status": "bogus", "user_id": "u"})
+        assert await tasks_collection.count_documents({}) == 2
+
+    run(scenario())
+
+def test_legacy_blocked_tasks_are_backfilled(run):
+    async def scenario():
+        first = await new_task("first")
+        second = await new_task("second")
+        await update_task_document(first["_id"], {"status": "completed"})
+        legacy = {
+            "title": "legacy", "description": "", "status": "blocked", "user_id": "u",
+            "depends_on": [str(first["_id"]), str(second["_id"])], "pending_dependencies": 2
+        }
+        await tasks_collection.insert_one(legacy)
+        await backfill_remaining_dependencies()
+        task = await reload(legacy)
+        assert task["status"] == "blocked" and task["remaining_dependencies"] == [str(second["_id"])]
+        assert "pending_dependencies" not in task
+        await update_task_document(second["_id"], {"status": "completed"})
+        assert (await reload(legacy))["status"] == "pending"
+
+    run(scenario())
@@ -0,0 +1,64 @@
+import io
+import pytest
+from bson import ObjectId
+import import_data
+from database import tasks_collection, users_collection
+from import_data import import_records, iter_json_array
+
+def test_malformed_element_stops_reading_within_bound(monkeypatch):
+    monkeypatch.setattr(import_data, "READ_CHUNK_SIZE", 16)
+    monkeypatch.setattr(import_data, "MAX_ELEMENT_SIZE", 64)
+    stream = io.StringIO('[{"a": 1}, {"a": 2,, "b": 3}, ' + ", ".join(['{"a": 4}'] * 1000) + "]")
+    items = iter_json_array(stream)
+    assert next(items) == {"a": 1}
+    with pytest.raises(ValueError, match="offset 11"):
+        next(items)
+    assert stream.tell() < 200
+
+def test_truncated_array_reports_offset():
+    with pytest.raises(ValueError, match="offset 11"):
+        list(iter_json_array(io.StringIO('[{"a": 1}, {"a": ')))
+
+def test_unknown_username_counts_as_invalid(run):
+    async def scenario():
+        await users_collection.insert_one({"username": "ana", "email": "ana@example.com", "username_key": "ana"})
+        records = [
+            {"title": "known", "description": "", "username": "Ana"},
+            {"title": "unknown", "description": "", "username": "nobody"}
+        ]
+        stats = await import_records("tasks", records, batch_size=10, concurrency=1)
+        assert (stats.inserted, stats.invalid) == (1, 1)
+        assert [task["title"] async for task in tasks_collection.find({})] == ["known"]
+
+    run(scenario())
+
+def test_imported_statuses_are_normalized(run):
+    async def scenario():
+        await users_collection.insert_one({"username": "ana", "email": "ana@example.com", "username_key": "ana"})
+        records = [
+            {"title": "blocked", "description": "", "status": "blocked"},
+            {"title": "scheduled", "description": "", "status": "scheduled"},
+            {"title": "done", "description": "", "status": "completed"},
+            {"title": "bogus", "description": "", "status": "bogus"}
+        ]
+        stats = await import_records("tasks", records, batch_size=10, concurrency=1, assign_users=True)
+        assert (stats.inserted, stats.invalid) == (3, 1)
+        statuses = {task["title"]: task["status"] async for task in tasks_collection.find({})}
+        assert statuses == {"blocked": "pending", "scheduled": "pending", "done": "completed"}
+
+    run(scenario())
+
+def test_missing_or_unknown_user_id_counts_as_invalid(run):
+    async def scenario():
+        user = await users_collection.insert_one({"username": "ana", "email": "ana@example.com", "username_key": "ana"})
+        records = [
+            {"title": "known", "description": "", "user_id": str(user.inserted_id)},
+            {"title": "missing", "description": ""},
+            {"title": "malformed", "description": "", "user_id": "not-an-id"},
+            {"title": "unknown", "description": "", "user_id": str(ObjectId())}
+        ]
+        stats = await import_records("tasks", records, batch_size=10, concurrency=1)
+        assert (stats.inserted, stats.invalid) == (1, 3)
+        assert [task["title"] async for task in tasks_collection.find({})] == ["known"]
+
+    run(scenario())
@@ -0,0 +1,31 @@
+from prefix_index import PrefixIndex
+
+def make_index() -> PrefixIndex:
+    index = PrefixIndex()
+    index.load([
+        {"_id": "1", "username": "Ana", "email": "ana@example.com"},
+        {"_id": "2", "username": "anita", "email": "zz@example.com"},
+        {"_id": "3", "username": "marko", "email": "anamarija@example.com"}
+    ])
+    return index
+
+def test_search_matches_username_and_email_prefix_case_insensitively():
+    index = make_index()
+    results = index.search(" AN", 10)
+    # Redoslijed po ključu: "ana" (username), "ana@..." (email istog korisnika se preskače), "anamarija@...", "anita"
+    assert [(user["id"], user["match"]) for user in results] == [("1", "username"), ("3", "email"), ("2", "username")]
+    assert results[0]["username"] == "Ana"
+    assert [user["id"] for user in index.search("an", 2)] == ["1", "3"]
+    assert index.search("b", 10) == []
+
+def test_add_and_remove_keep_index_sorted():
+    index = make_index()
+    index.add("4", {"username": "anja", "email": "anja@example.com"})
+    assert [user["id"] for user in index.search("an", 10)] == ["1", "3", "2", "4"]
+    # Promjena korisnika uklanja stare ključeve
+    index.add("1", {"username": "zora", "email": "zora@example.com"})
+    assert [user["id"] for user in index.search("an", 10)] == ["3", "2", "4"]
+    index.remove("3")
+    index.remove("missing")
+    assert [user["id"] for user in index.search("an", 10)] == ["2", "4"]
+    assert len(index) == 3
@@ -0,0 +1,61 @@
+import asyncio
+import csv
+import gzip
+import io
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+import query_utils
+from query_utils import build_projection, export_response, project_document
+
+async def documents(count: int):
+    for index in range(count):
+        yield {"_id": ObjectId(), "title": f"task {index}", "status": "pending", "progress": None}
+
+async def read_body(response) -> list:
+    return [chunk async for chunk in response.body_iterator]
+
+def test_projection_maps_id_and_rejects_unknown_fields():
+    assert build_projection(None, ["title"]) is None
+    assert build_projection("title, status", ["title", "status"]) == {"title": 1, "status": 1, "_id": 0}
+    assert build_projection("id,title", ["title"]) == {"_id": 1, "title": 1}
+    for fields in ["", " , ", "title,secret"]:
+        with pytest.raises(HTTPException) as error:
+            build_projection(fields, ["title"])
+        assert error.value.status_code == 400
+
+def test_project_document_matches_mongo_projection():
+    document = {"_id": 1, "title": "t", "status": "pending"}
+    assert project_document(document, None) is document
+    assert project_document(document, {"title": 1, "_id": 0}) == {"title": "t"}
+    assert project_document(document, {"title": 1}) == {"title": "t", "_id": 1}
+    # Polje kojeg nema u dokumentu ne pojavljuje se ni u rezultatu
+    assert project_document({"_id": 1}, {"title": 1, "_id": 1}) == {"_id": 1}
+
+def test_csv_export_is_sent_in_bounded_chunks(monkeypatch):
+    monkeypatch.setattr(query_utils, "EXPORT_CHUNK_SIZE", 256)
+    response = export_response(documents(100), "csv", ["id", "title", "progress"], compress=False, name="tasks")
+    assert response.media_type == "text/csv"
+    assert response.headers["content-disposition"] == 'attachment; filename="tasks.csv"'
+    chunks = asyncio.run(read_body(response))
+    assert len(chunks) > 1
+    # Svaki blok osim zadnjeg skuplja retke dok ne dosegne EXPORT_CHUNK_SIZE
+    assert all(len(chunk) >= 256 for chunk in chunks[:-1])
+    rows = list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+    assert rows[0] == ["id", "title", "progress"]
+    assert len(rows) == 101 and rows[1][1:] == ["task 0", ""]
+
+def test_gzip_export_decompresses_to_plain_export(monkeypatch):
+    monkeypatch.setattr(query_utils, "EXPORT_CHUNK_SIZE", 256)
+    plain = b"".join(asyncio.run(read_body(export_response(documents(0), "ndjson", [], compress=False, name="tasks"))))
+    assert plain == b""
+    response = export_response(documents(50), "ndjson", [], compress=True, name="tasks")
+    assert response.media_type == "application/gzip"
+    assert response.headers["content-disposition"] == 'attachment; filename="tasks.ndjson.gz"'
+    lines = gzip.decompress(b"".join(asyncio.run(read_body(response)))).decode("utf-8").splitlines()
+    assert len(lines) == 50 and '"title": "task 49"' in lines[-1]
+
+def test_unsupported_export_format_is_rejected():
+    with pytest.raises(HTTPException) as error:
+        export_response(documents(0), "xml", [], compress=False, name="tasks")
+    assert error.value.status_code == 400
@@ -0,0 +1,10 @@
+from task_store import fold_text, search_fields
+
+def test_fold_text_removes_croatian_diacritics():
+    assert fold_text("Čačak ćevapi Šišmiš Žaba Đurđa") == "cacak cevapi sismis zaba djurdja"
+    assert fold_text("ĐAK") == "djak"
+
+def test_search_fields_only_for_given_text():
+    assert search_fields("Šuma", None) == {"search_title": "suma"}
+    assert search_fields(None, "Žuto") == {"search_description": "zuto"}
+    assert search_fields() == {}
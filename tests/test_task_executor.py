@@ -0,0 +1,319 @@
+import asyncio
+import importlib
+import runpy
+import sys
+from datetime import datetime, timedelta, timezone
+import logging_config
+import task_executor
+from database import tasks_collection, task_slots_collection, task_stats_collection, dead_letter_tasks_collection
+from task_store import CLAIMABLE, backfill_claim_fields, insert_task, insert_tasks, transition_tasks, user_stats_id
+
+HANDLER_MODULE = """
+from task_executor import register_handler
+
+@register_handler("echo")
+async def echo(task):
+    return task["payload"]
+"""
+
+# CPU handler se izvršava u zasebnom procesu pa mora biti funkcija na razini modula
+def measure_payload(payload):
+    return {"size": len(payload["data"]), "shared": isinstance(payload["data"], memoryview)}
+
+async def always_fail(task):
+    raise RuntimeError("boom")
+
+# Neuspjeli pokušaj: preuzimanje i izvršavanje handlera, zatim povratak zakazanog ponovnog pokušaja u red
+async def failed_attempt(executor) -> dict:
+    [task] = await executor.claim(1)
+    await executor.execute(task)
+    task = await tasks_collection.find_one({"_id": task["_id"]})
+    if task["status"] == "scheduled":
+        await transition_tasks([task["_id"]], "scheduled", "pending")
+    return task
+
+async def wait_for_status(task_id, status: str, timeout: float = 5.0) -> dict:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        task = await tasks_collection.find_one({"_id": task_id})
+        if task["status"] == status or asyncio.get_running_loop().time() > deadline:
+            return task
+        await asyncio.sleep(0.02)
+
+# Baza kojoj prvih failures poziva update_one baca grešku
+class FlakyCollection:
+    def __init__(self, collection, failures: int):
+        self.collection = collection
+        self.failures = failures
+
+    async def update_one(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("MongoDB unavailable")
+        return await self.collection.update_one(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+def test_standalone_worker_runs_handlers_from_handler_modules(run, tmp_path, monkeypatch):
+    (tmp_path / "executor_test_handlers.py").write_text(HANDLER_MODULE)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(task_executor, "handlers", {})
+    monkeypatch.setitem(task_executor.config, "task_handler_modules", ["executor_test_handlers"])
+    monkeypatch.setitem(task_executor.config, "task_executor_poll_interval", 0.05)
+    monkeypatch.setattr(logging_config, "setup_logging", lambda *args, **kwargs: None)
+    task_dict = {"title": "t", "description": "", "status": "pending", "user_id": "u", "handler": "echo", "payload": {"value": 1}}
+    finished = {}
+
+    # run_task_executor pokreće worker kroz asyncio.run; ovdje se worker zaustavlja kad zadatak završi
+    def run_until_task_finishes(main):
+        async def scenario():
+            await insert_task(task_dict)
+            worker = asyncio.create_task(main)
+            finished["task"] = await wait_for_status(task_dict["_id"], "completed")
+            worker.cancel()
+            await asyncio.gather(worker, return_exceptions=True)
+
+        run(scenario())
+
+    monkeypatch.setattr(asyncio, "run", run_until_task_finishes)
+    try:
+        runpy.run_path("run_task_executor.py", run_name="__main__")
+    finally:
+        sys.modules.pop("executor_test_handlers", None)
+    assert "echo" in task_executor.handlers
+    assert finished["task"]["status"] == "completed"
+    assert finished["task"]["result"] == {"value": 1}
+    assert "lease_id" not in finished["task"]
+
+def test_outcome_is_retried_after_database_error(run, monkeypatch):
+    monkeypatch.setattr(task_executor, "handlers", {"echo": None})
+
+    async def scenario():
+        executor = task_executor.create_executor()
+        executor.lease_seconds = 0.3
+        executor.partitions = list(range(task_executor.PARTITION_COUNT))
+        await insert_task({"title": "t", "description": "", "status": "pending", "user_id": "u", "handler": "echo"})
+        [task] = await executor.claim(1)
+        monkeypatch.setattr(task_executor, "tasks_collection", FlakyCollection(tasks_collection, failures=1))
+        assert await executor.finish(task, "completed", {"result": 1})
+        task = await tasks_collection.find_one({"_id": task["_id"]})
+        assert task["status"] == "completed" and "lease_id" not in task
+
+    run(scenario())
+
+def test_cpu_bound_handler_receives_large_payload_through_shared_memory(run, monkeypatch):
+    monkeypatch.setattr(task_executor, "handlers", {"measure": measure_payload})
+    monkeypatch.setattr(task_executor, "cpu_bound_handlers", {"measure"})
+
+    async def scenario():
+        executor = task_executor.create_executor()
+        executor.partitions = list(range(task_executor.PARTITION_COUNT))
+        executor.process_pool_size = 1
+        executor.shared_memory_threshold = 1024
+        await insert_task({
+            "title": "t", "description": "", "status": "pending", "user_id": "u", "handler": "measure",
+            "payload": {"data": b"x" * 4096}
+        })
+        [task] = await executor.claim(1)
+        try:
+            await executor.execute(task)
+        finally:
+            executor.process_pool.shutdown()
+        task = await tasks_collection.find_one({"_id": task["_id"]})
+        assert task["status"] == "completed"
+        assert task["result"] == {"size": 4096, "shared": True}
+
+    run(scenario())
+
+def test_retry_delay_stays_within_backoff_bounds():
+    executor = task_executor.create_executor()
+    executor.retry_base = 2.0
+    executor.retry_max = 600.0
+    for attempts in range(1, 15):
+        delay = min(600.0, 2.0 * 2 ** (attempts - 1))
+        for sample in range(50):
+            assert delay / 2 <= executor.retry_delay(attempts) <= delay
+
+def test_task_is_dead_lettered_after_max_attempts(run, monkeypatch):
+    monkeypatch.setattr(task_executor, "handlers", {"boom": always_fail})
+
+    async def scenario():
+        executor = task_executor.create_executor()
+        executor.partitions = list(range(task_executor.PARTITION_COUNT))
+        await insert_task({"title": "t", "description": "", "status": "pending", "user_id": "u", "handler": "boom", "max_attempts": 3})
+        for attempt in range(1, 3):
+            task = await failed_attempt(executor)
+            assert task["status"] == "scheduled" and task["attempts"] == attempt
+            assert await dead_letter_tasks_collection.count_documents({}) == 0
+        task = await failed_attempt(executor)
+        assert task["status"] == "failed" and task["attempts"] == 3 and task["error"] == "boom"
+        dead_letter = await dead_letter_tasks_collection.find_one({"_id": task["_id"]})
+        assert dead_letter["attempts"] == 3 and "lease_id" not in dead_letter
+
+    run(scenario())
+
+def test_requeue_resets_attempts_of_dead_lettered_tasks(run, monkeypatch):
+    monkeypatch.setattr(logging_config, "setup_logging", lambda *args, **kwargs: None)
+    task_worker = importlib.import_module("task_worker")
+    monkeypatch.setattr(task_executor, "handlers", {"boom": always_fail})
+
+    async def scenario():
+        executor = task_executor.create_executor()
+        executor.partitions = list(range(task_executor.PARTITION_COUNT))
+        await insert_task({"title": "t", "description": "", "status": "pending", "user_id": "u", "handler": "boom", "max_attempts": 1})
+        task = await failed_attempt(executor)
+        assert task["status"] == "failed"
+        response = await task_worker.requeue_dead_letter_tasks(task_worker.DeadLetterFilter(ids=[str(task["_id"])]))
+        assert response == {"requeued_count": 1}
+        task = await tasks_collection.find_one({"_id": task["_id"]})
+        assert task["status"] == "pending" and task["attempts"] == 0 and task["error"] is None
+        assert await dead_letter_tasks_collection.count_documents({}) == 0
+        assert (await task_stats_collection.find_one({"_id": user_stats_id("u")}))[CLAIMABLE] == 1
+        # Brojač pokušaja kreće ispočetka, pa zadatak dobiva novi puni niz pokušaja
+        task = await failed_attempt(executor)
+        assert task["status"] == "failed" and task["attempts"] == 1
+        assert await dead_letter_tasks_collection.count_documents({}) == 1
+
+    run(scenario())
+
+def test_heartbeat_keeps_running_after_database_error(run, monkeypatch):
+    async def scenario():
+        executor = task_executor.create_executor()
+        executor.lease_seconds = 0.3
+        await insert_task({"title": "t", "description": "", "status": "pending", "user_id": "u", "lease_id": "lease"})
+        task = await tasks_collection.find_one({})
+        job = asyncio.create_task(asyncio.sleep(1))
+        monkeypatch.setattr(task_executor, "tasks_collection", FlakyCollection(tasks_collection, failures=1))
+        heartbeat = asyncio.create_task(executor.keep_lease(task, job))
+        await asyncio.sleep(0.5)
+        assert not heartbeat.done() and not job.done()
+        # Bez uspješnog produljenja do isteka najma izvršavanje se prekida
+        monkeypatch.setattr(task_executor, "tasks_collection", FlakyCollection(tasks_collection, failures=100))
+        await asyncio.sleep(0.6)
+        assert heartbeat.done() and job.cancelled()
+
+    run(scenario())
+
+def test_large_backlog_of_one_user_does_not_starve_others(run, monkeypatch):
+    monkeypatch.setattr(task_executor, "handlers", {"echo": None})
+
+    async def scenario():
+        executor = task_executor.create_executor()
+        executor.fair_share = 2
+        executor.partitions = list(range(task_executor.PARTITION_COUNT))
+        for index in range(30):
+            await insert_task({"title": f"big{index}", "description": "", "status": "pending", "user_id": "big", "handler": "echo"})
+        for user_id in ["u1", "u2"]:
+            await insert_task({"title": user_id, "description": "", "status": "pending", "user_id": user_id, "handler": "echo"})
+        selected = await executor.select_candidates(6)
+        users = [task["user_id"] for task in selected]
+        assert len(selected) == 6
+        assert users.count("u1") == 1 and users.count("u2") == 1
+        # Viši prioritet i dalje ima prednost pred pravednošću
+        await insert_task({"title": "urgent", "description": "", "status": "pending", "user_id": "u3", "handler": "echo", "priority": 5})
+        selected = await executor.select_candidates(1)
+        assert selected[0]["user_id"] == "u3"
+
+    run(scenario())
+
+def test_fairness_skips_users_without_claimable_tasks(run, monkeypatch):
+    monkeypatch.setattr(task_executor, "handlers", {"echo": None})
+
+    async def scenario():
+        executor = task_executor.create_executor()
+        executor.fair_share = 2
+        executor.partitions = list(range(task_executor.PARTITION_COUNT))
+        # Obični pending zadaci bez handlera ne smiju trošiti krugove pravednosti
+        await insert_tasks([
+            {"title": f"plain{index}", "description": "", "status": "pending", "user_id": f"a{index:03}"} for index in range(200)
+        ])
+        await insert_tasks([
+            {"title": f"heavy{index}", "description": "", "status": "pending", "user_id": "heavy", "handler": "echo"}
+            for index in range(200)
+        ])
+        await insert_task({"title": "light", "description": "", "status": "pending", "user_id": "light", "handler": "echo"})
+        claimed = []
+        for batch in range(5):
+            claimed += await executor.claim(10)
+        users = [task["user_id"] for task in claimed]
+        assert len(claimed) == 50 and users.count("light") == 1
+        assert (await task_stats_collection.find_one({"_id": user_stats_id("light")}))[CLAIMABLE] == 0
+        assert (await task_stats_collection.find_one({"_id": user_stats_id("heavy")}))[CLAIMABLE] == 151
+        assert (await task_stats_collection.find_one({"_id": user_stats_id("a000")})).get(CLAIMABLE, 0) == 0
+
+    run(scenario())
+
+def test_backfill_sets_claim_order_fields(run):
+    async def scenario():
+        await tasks_collection.insert_one({"title": "old", "description": "", "status": "pending", "user_id": "u"})
+        await backfill_claim_fields()
+        task = await tasks_collection.find_one({})
+        assert task["priority"] == 0
+        assert task["enqueued_at"] == task["_id"].generation_time.replace(tzinfo=None)
+
+    run(scenario())
+
+def test_timer_pages_do_not_skip_tasks_scheduled_for_the_same_moment(run):
+    async def scenario():
+        executor = task_executor.create_executor()
+        executor.timer_load_limit = 2
+        executor.partitions = list(range(task_executor.PARTITION_COUNT))
+        scheduled_for = datetime.now(timezone.utc) + timedelta(seconds=10)
+        for index in range(5):
+            await insert_task({"title": f"t{index}", "description": "", "user_id": "u", "run_at": scheduled_for})
+        for load in range(3):
+            await executor.load_timers()
+        assert len(executor.timer_entries) == 5
+
+    run(scenario())
+
+def test_timer_rescan_finds_tasks_missed_by_change_seq(run):
+    async def scenario():
+        executor = task_executor.create_executor()
+        executor.partitions = list(range(task_executor.PARTITION_COUNT))
+        await executor.load_timers()
+        # Zadatak s change_seq koji je već prošao zadnje učitavanje
+        await tasks_collection.insert_one({
+            "title": "t", "description": "", "status": "scheduled", "user_id": "u", "change_seq": 0,
+            "partition": 0, "scheduled_for": datetime.now(timezone.utc) + timedelta(seconds=10)
+        })
+        await executor.load_timers()
+        assert not executor.timer_entries
+        executor.next_timer_rescan = 0.0
+        await executor.load_timers()
+        assert len(executor.timer_entries) == 1
+
+    run(scenario())
+
+def test_reconcile_corrects_only_persistent_drift_with_compare_and_set(run):
+    async def scenario():
+        executor = task_executor.create_executor()
+        executor.user_limit = 5
+        await task_slots_collection.insert_many([{"_id": "user:a", "running": 3}, {"_id": "user:b", "running": 2}])
+        await executor.reconcile_slots()
+        # Prvi prolaz samo bilježi razliku (mjesta su možda zauzeta za zadatke koji se tek preuzimaju)
+        assert (await task_slots_collection.find_one({"_id": "user:a"}))["running"] == 3
+        # Istodobno zauzimanje mijenja brojač pa se ispravak za taj ključ preskače
+        await task_slots_collection.update_one({"_id": "user:b"}, {"$inc": {"running": 1}})
+        await executor.reconcile_slots()
+        assert (await task_slots_collection.find_one({"_id": "user:a"}))["running"] == 0
+        assert (await task_slots_collection.find_one({"_id": "user:b"}))["running"] == 3
+
+    run(scenario())
+
+def test_stealing_claims_from_other_partitions_only(run, monkeypatch):
+    monkeypatch.setattr(task_executor, "handlers", {"echo": None})
+
+    async def scenario():
+        executor = task_executor.create_executor()
+        await insert_task({"title": "t", "description": "", "status": "pending", "user_id": "u", "handler": "echo"})
+        task = await tasks_collection.find_one({})
+        executor.partitions = [task["partition"]]
+        assert executor.claim_query(steal=True)["partition"]["$in"] == [
+            partition for partition in range(task_executor.PARTITION_COUNT) if partition != task["partition"]
+        ]
+        assert await executor.claim(1, steal=True) == []
+        assert len(await executor.claim(1)) == 1
+
+    run(scenario())
@@ -0,0 +1,67 @@
+import asyncio
+import task_store
+from database import tasks_collection, task_stats_collection
+from task_store import CLAIMABLE, GLOBAL_STATS_ID, insert_task, update_tasks, rebuild_task_stats, user_stats_id
+
+async def global_counts() -> dict:
+    document = await task_stats_collection.find_one({"_id": GLOBAL_STATS_ID})
+    return {status: count for status, count in document["counts"].items() if count}
+
+def test_bulk_status_update_moves_counters_per_group(run):
+    async def scenario():
+        for index in range(6):
+            await insert_task({"title": f"t{index}", "description": "", "status": "pending", "user_id": f"u{index % 2}"})
+        await tasks_collection.update_many({"user_id": "u1"}, {"$set": {"status": "failed"}})
+        await rebuild_task_stats()
+        result = await update_tasks({"title": {"$in": ["t0", "t1", "t2"]}}, {"status": "completed"})
+        assert result.modified_count == 3
+        assert await global_counts() == {"pending": 1, "failed": 2, "completed": 3}
+        user_stats = await task_stats_collection.find_one({"_id": user_stats_id("u1")})
+        assert user_stats["counts"] == {"failed": 2, "completed": 1}
+
+    run(scenario())
+
+def test_bulk_update_skips_tasks_changed_after_it_started(run):
+    async def scenario():
+        await insert_task({"title": "t", "description": "", "status": "pending", "user_id": "u"})
+        task = await tasks_collection.find_one({})
+        # Zadatak s novijim change_seq je izmijenjen nakon početka skupnog ažuriranja
+        await tasks_collection.update_one({"_id": task["_id"]}, {"$set": {"change_seq": 1 << 62}})
+        result = await update_tasks({"user_id": "u"}, {"status": "completed"})
+        assert result.modified_count == 0
+        assert await global_counts() == {"pending": 1}
+
+    run(scenario())
+
+def test_rebuild_replaces_counters(run):
+    async def scenario():
+        await insert_task({"title": "t", "description": "", "status": "pending", "user_id": "u"})
+        await insert_task({"title": "h", "description": "", "status": "pending", "user_id": "u", "handler": "echo"})
+        await task_stats_collection.update_one({"_id": GLOBAL_STATS_ID}, {"$set": {"counts.pending": 7}})
+        await task_stats_collection.insert_one({"_id": user_stats_id("gone"), "user_id": "gone", "counts": {"pending": 1}})
+        await rebuild_task_stats()
+        assert await global_counts() == {"pending": 2}
+        assert (await task_stats_collection.find_one({"_id": user_stats_id("u")}))[CLAIMABLE] == 1
+        assert await task_stats_collection.find_one({"_id": user_stats_id("gone")}) is None
+
+    run(scenario())
+
+def test_rebuild_holds_writes_until_counters_are_replaced(run, monkeypatch):
+    async def scenario():
+        await insert_task({"title": "t", "description": "", "status": "pending", "user_id": "u"})
+        writers = []
+        aggregate = task_store.grouped_status_counts
+
+        # Upis započet usred ponovnog izračuna čeka da nova kolekcija brojača zamijeni staru
+        async def aggregate_during_write(query):
+            writers.append(asyncio.create_task(insert_task({"title": "w", "description": "", "status": "pending", "user_id": "u"})))
+            await asyncio.sleep(0.2)
+            assert not writers[0].done()
+            return await aggregate(query)
+
+        monkeypatch.setattr(task_store, "grouped_status_counts", aggregate_during_write)
+        await rebuild_task_stats()
+        await writers[0]
+        assert await global_counts() == {"pending": 2}
+
+    run(scenario())
@@ -0,0 +1,100 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+import user_service
+import user_store
+from database import tasks_collection, users_collection, user_jobs_collection
+from dedupe_users import dedupe_users
+from task_store import insert_task
+from models import User
+from user_service import create_user, fetch_users_batch, resume_user_jobs, run_user_job
+from user_store import ensure_user_indexes, user_deletion_job
+
+@pytest.fixture(autouse=True)
+def reset_missing_unique_keys():
+    yield
+    user_store.missing_unique_keys.clear()
+
+def test_duplicates_block_index_until_deduplicated(run):
+    async def scenario():
+        first = await users_collection.insert_one({"username": "ana", "email": "ana@example.com"})
+        second = await users_collection.insert_one({"username": "ana2", "email": " ANA@example.com"})
+        assert await ensure_user_indexes() == ["email_key"]
+        # Bez indeksa duplikat se odbija provjerom prije upisa
+        with pytest.raises(HTTPException) as error:
+            await create_user(User(username="ana3", email="Ana@example.com"))
+        assert error.value.detail == "Email already in use"
+        assert await dedupe_users(apply=False) == 1
+        assert await users_collection.count_documents({}) == 2
+        assert await dedupe_users(apply=True) == 1
+        assert await ensure_user_indexes() == []
+        assert [user["_id"] async for user in users_collection.find({})] == [first.inserted_id]
+        job = await user_jobs_collection.find_one({})
+        assert job["user_id"] == str(second.inserted_id) and job["reassign_to"] == str(first.inserted_id)
+
+    run(scenario())
+
+def test_stale_job_of_crashed_replica_is_resumed(run):
+    async def scenario():
+        gone = str(ObjectId())
+        for index in range(3):
+            await insert_task({"title": f"t{index}", "description": "", "status": "pending", "user_id": gone})
+        stale = dict(user_deletion_job(gone, None, None), owner="crashed", updated_at=datetime.now(timezone.utc) - timedelta(days=1))
+        fresh = dict(user_deletion_job(str(ObjectId()), None, None), owner="alive")
+        await user_jobs_collection.insert_many([stale, fresh])
+        await resume_user_jobs()
+        await asyncio.gather(*user_service.background_jobs)
+        job = await user_jobs_collection.find_one({"_id": stale["_id"]})
+        assert job["status"] == "completed" and job["owner"] == user_service.replica_id and job["tasks_deleted"] == 3
+        assert await tasks_collection.count_documents({}) == 0
+        assert (await user_jobs_collection.find_one({"_id": fresh["_id"]}))["owner"] == "alive"
+
+    run(scenario())
+
+def test_job_taken_over_by_another_replica_stops_without_failing(run):
+    async def scenario():
+        gone = str(ObjectId())
+        await insert_task({"title": "t", "description": "", "status": "pending", "user_id": gone})
+        job = dict(user_deletion_job(gone, None, None), owner="other")
+        await user_jobs_collection.insert_one(job)
+        await run_user_job(job)
+        stored = await user_jobs_collection.find_one({"_id": job["_id"]})
+        assert stored["status"] == "running" and stored["owner"] == "other"
+
+    run(scenario())
+
+def test_job_inserted_before_crash_finishes_deleting_the_user(run):
+    async def scenario():
+        user = await users_collection.insert_one({"username": "ana", "email": "ana@example.com"})
+        user_id = str(user.inserted_id)
+        await insert_task({"title": "t", "description": "", "status": "pending", "user_id": user_id})
+        # Replika je pala nakon upisa posla, prije brisanja korisnika
+        job = dict(user_deletion_job(user_id, None, "crashed"), updated_at=datetime.now(timezone.utc) - timedelta(days=1))
+        await user_jobs_collection.insert_one(job)
+        await resume_user_jobs()
+        await asyncio.gather(*user_service.background_jobs)
+        assert await users_collection.count_documents({}) == 0
+        assert await tasks_collection.count_documents({}) == 0
+        assert (await user_jobs_collection.find_one({"_id": job["_id"]}))["status"] == "completed"
+
+    run(scenario())
+
+def test_batch_keeps_requested_order_and_reports_missing(run):
+    async def scenario():
+        first = await users_collection.insert_one({"username": "ana", "email": "ana@example.com", "email_key": "ana@example.com"})
+        second = await users_collection.insert_one({"username": "ivo", "email": "ivo@example.com", "email_key": "ivo@example.com"})
+        first_id, second_id, unknown_id = str(first.inserted_id), str(second.inserted_id), str(ObjectId())
+        # Drugi dohvat čita korisnika iz cachea, a redoslijed i dalje prati zahtjev
+        for attempt in range(2):
+            response = await fetch_users_batch([second_id, "not-an-id", first_id, unknown_id, second_id, ""], None)
+            body = json.loads(response.body)
+            assert [user["id"] for user in body["users"]] == [second_id, first_id]
+            assert body["missing"] == ["not-an-id", unknown_id]
+            assert "email_key" not in body["users"][0]
+        response = await fetch_users_batch([first_id], "username")
+        assert json.loads(response.body)["users"] == [{"username": "ana", "id": first_id}]
+
+    run(scenario())
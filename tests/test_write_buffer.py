@@ -0,0 +1,38 @@
+import task_store
+from database import tasks_collection
+from task_store import TaskWriteBuffer, insert_task
+
+# Kolekcija čiji prvih failures poziva bulk_write baca grešku
+class FailingBulkWrites:
+    def __init__(self, collection, failures: int):
+        self.collection = collection
+        self.failures = failures
+
+    async def bulk_write(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("MongoDB unavailable")
+        return await self.collection.bulk_write(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+def test_failed_flush_keeps_updates_and_retries(run, monkeypatch):
+    async def scenario():
+        task = {"title": "t", "description": "", "status": "pending", "user_id": "u"}
+        await insert_task(task)
+        buffer = TaskWriteBuffer(window=60)
+        await buffer.update(task["_id"], {"status": "in-progress", "progress": 0.1})
+        monkeypatch.setattr(task_store, "tasks_collection", FailingBulkWrites(tasks_collection, failures=1))
+        await buffer.flush()
+        assert buffer.overlay(task["_id"], {})["progress"] == 0.1
+        assert buffer.flusher is not None and not buffer.flusher.done()
+        # Novija promjena tijekom neuspjelog upisa ima prednost pred vraćenom
+        await buffer.update(task["_id"], {"progress": 0.5})
+        await buffer.flush()
+        assert buffer.pending == {}
+        stored = await tasks_collection.find_one({"_id": task["_id"]})
+        assert stored["status"] == "in-progress" and stored["progress"] == 0.5
+        buffer.flusher.cancel()
+
+    run(scenario())
@@ -1,72 +1,370 @@
 import json
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, EmailStr
-from typing import List
+import asyncio
+import logging
+import os
+import re
+import socket
+from fastapi import FastAPI, HTTPException, Query
+import httpx
+from pydantic import BaseModel
+from typing import Coroutine, List, Optional
+from uuid import uuid4
 from bson import ObjectId
-from database import users_collection
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timedelta, timezone
+from database import users_collection, notifications_collection, user_jobs_collection
+from task_store import delete_tasks, update_tasks, change_seq_writer
+from models import User, user_keys
+from user_store import INTERNAL_USER_FIELDS, missing_unique_keys, ensure_user_indexes, user_deletion_job
+from cache import TTLCache
+from prefix_index import PrefixIndex
+from logging_config import setup_logging
+from query_utils import (
+    build_projection, projected_response, serialize_document, export_response, export_columns, project_document
+)
+from fastapi.responses import JSONResponse
 
 
 with open("config.json") as config_file:
     config = json.load(config_file)
 
+setup_logging("user_service", config["log_level"], config["log_sampling"])
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
 #Configurable parameters from config.jso
 user_service_host = config["user_service_host"]
 user_service_port = config["user_service_port"]
+task_worker_host = config["task_worker_host"]
+task_worker_port = config["task_worker_port"]
+cache_invalidation_timeout = config["cache_invalidation_timeout"]
+export_batch_size = config["export_batch_size"]
+user_service_peers = config["user_service_peers"]
+
+# Read-through cache korisničkih dokumenata (bez internih polja) prema ID-u
+user_cache = TTLCache(config["user_profile_cache_size"], config["user_profile_cache_ttl"])
+
+# Indeks za prijedloge po prefiksu; puni se kod pokretanja i održava kroz create/update/delete
+suggest_index = PrefixIndex()
+user_suggest_limit = config["user_suggest_limit"]
+user_suggest_reload_interval = config["user_suggest_reload_interval"]
+user_job_chunk_size = config["user_job_chunk_size"]
+user_job_stale_seconds = config["user_job_stale_seconds"]
+
+# Oznaka ove replike kao vlasnika poslova koje izvodi
+replica_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+
+# Pozadinski poslovi (referenca sprječava da ih skupi garbage collector prije završetka)
+background_jobs = set()
+
+def run_in_background(coroutine: Coroutine) -> asyncio.Task:
+    job = asyncio.create_task(coroutine)
+    background_jobs.add(job)
+    job.add_done_callback(background_jobs.discard)
+    return job
+
+def duplicate_key_error(field: str) -> HTTPException:
+    if field == "username_key":
+        return HTTPException(status_code=400, detail="Username already in use")
+    return HTTPException(status_code=400, detail="Email already in use")
 
-# Osnovni model za korisnika
-class User(BaseModel):
-    username: str
-    email: EmailStr
+# Povreda jedinstvenog indeksa u poruku koju klijent već očekuje
+def duplicate_user_error(error: DuplicateKeyError) -> HTTPException:
+    key_pattern = (error.details or {}).get("keyPattern", {})
+    if "username_key" in key_pattern or "username_key" in str(error):
+        return duplicate_key_error("username_key")
+    return duplicate_key_error("email_key")
 
+# Provjera duplikata upitom dok jedinstveni indeks ne postoji (nije zaštićena od istodobnih upisa)
+async def check_unique_keys(keys: dict, user_id: Optional[ObjectId] = None):
+    for field in INTERNAL_USER_FIELDS:
+        if field in missing_unique_keys:
+            query = {field: keys[field]}
+            if user_id is not None:
+                query["_id"] = {"$ne": user_id}
+            if await users_collection.find_one(query, {"_id": 1}) is not None:
+                raise duplicate_key_error(field)
+
+# Jedinstveni indeksi čine provjeru duplikata dijelom upisa (jedan upit, ispravno i kod istodobnih registracija)
 @app.post("/users/", response_model=dict)
 async def create_user(user: User):
-    existing_user = await users_collection.find_one({"email": user.email})
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Email already in use")
-    
     user_dict = user.dict()
-    print(f"Trying to insert user: {user_dict}")
-    
-    result = await users_collection.insert_one(user_dict)
-    if result.inserted_id:
-        print(f"User successfully inserted with ID: {result.inserted_id}")
-    else:
-        print("User insert failed!")
-    
+    user_dict.update(user_keys(user.username, user.email))
+    await check_unique_keys(user_dict)
+    try:
+        result = await users_collection.insert_one(user_dict)
+    except DuplicateKeyError as e:
+        raise duplicate_user_error(e)
+    suggest_index.add(str(result.inserted_id), user_dict)
+    await invalidate_cached_user(str(result.inserted_id))
     return {"id": str(result.inserted_id)}
 
 # Dohvaćanje svih korisnika
 @app.get("/users/", response_model=List[User])
-async def get_users():
-    users = await users_collection.find().to_list(100)
+async def get_users(fields: Optional[str] = None):
+    projection = build_projection(fields, User.__fields__)
+    users = await users_collection.find({}, projection).to_list(100)
+    if projection is not None:
+        return projected_response(users)
     return users
 
-# Dohvaćanje korisnika prema ID-u
+# Izvoz svih korisnika kao NDJSON ili CSV stream
+@app.get("/users/export")
+async def export_users(
+    export_format: str = Query("ndjson", alias="format"),
+    fields: Optional[str] = None,
+    gzip: bool = False
+):
+    projection = build_projection(fields, User.__fields__)
+    if projection is None:
+        projection = {field: 0 for field in INTERNAL_USER_FIELDS}
+    cursor = users_collection.find({}, projection).batch_size(export_batch_size)
+    return export_response(cursor, export_format, export_columns(fields, User.__fields__), gzip, "users")
+
+# Najveći broj ID-eva u jednom skupnom dohvatu
+MAX_BATCH_IDS = 1000
+
+# Skupni dohvat korisnika tijelom zahtjeva (za liste predugačke za query string)
+class UserBatchRequest(BaseModel):
+    ids: List[str]
+    fields: Optional[str] = None
+
+# Korisnici redoslijedom traženih ID-eva: najprije iz cachea, ostatak jednim $in upitom.
+# Dokumenti se dohvaćaju cijeli kako bi se mogli cacheirati, a projekcija se primjenjuje u memoriji.
+async def fetch_users_batch(ids: List[str], fields: Optional[str]) -> JSONResponse:
+    projection = build_projection(fields, User.__fields__)
+    if projection is not None:
+        projection["_id"] = 1
+    requested = list(dict.fromkeys(user_id for user_id in ids if user_id))
+    if len(requested) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} ids per request")
+    found = {}
+    for user_id in requested:
+        user = user_cache.get(user_id)
+        if user is not None:
+            found[user_id] = user
+    to_fetch = [ObjectId(user_id) for user_id in requested if user_id not in found and ObjectId.is_valid(user_id)]
+    if to_fetch:
+        cursor = users_collection.find({"_id": {"$in": to_fetch}}, {field: 0 for field in INTERNAL_USER_FIELDS})
+        async for user in cursor:
+            found[str(user["_id"])] = user
+            user_cache.set(str(user["_id"]), user)
+    return JSONResponse(content={
+        "users": [serialize_document(project_document(found[user_id], projection)) for user_id in requested if user_id in found],
+        "missing": [user_id for user_id in requested if user_id not in found]
+    })
+
+# Skupni dohvat korisnika: GET /users/batch?ids=a,b,c
+@app.get("/users/batch")
+async def get_users_batch(ids: str, fields: Optional[str] = None):
+    return await fetch_users_batch([user_id.strip() for user_id in ids.split(",")], fields)
+
+@app.post("/users/batch")
+async def post_users_batch(request: UserBatchRequest):
+    return await fetch_users_batch(request.ids, request.fields)
+
+# Rezervni put dok indeks nije učitan: usidreni regex nad normaliziranim ključevima koristi njihov indeks
+async def suggest_users_from_db(prefix: str, limit: int) -> List[dict]:
+    pattern = "^" + re.escape(prefix.strip().lower())
+    results = []
+    seen = set()
+    for field in PrefixIndex.FIELDS:
+        key = f"{field}_key"
+        cursor = users_collection.find({key: {"$regex": pattern}}, {"username": 1, "email": 1})
+        async for user in cursor.sort(key, ASCENDING).limit(limit):
+            user_id = str(user["_id"])
+            if user_id not in seen and len(results) < limit:
+                seen.add(user_id)
+                results.append({"username": user.get("username"), "email": user.get("email"), "id": user_id, "match": field})
+    return results
+
+# Prijedlozi korisnika čije korisničko ime ili email počinje prefiksom (autocomplete)
+@app.get("/users/suggest", response_model=List[dict])
+async def suggest_users(prefix: str = Query(..., min_length=1), limit: int = Query(user_suggest_limit, ge=1, le=100)):
+    if suggest_index.loaded:
+        return suggest_index.search(prefix, limit)
+    return await suggest_users_from_db(prefix, limit)
+
+# Brojači pogodaka i promašaja cachea korisnika
+@app.get("/users/cache/stats", response_model=dict)
+async def get_user_cache_stats():
+    return user_cache.stats()
+
+# Poništavanje cache unosa (pozivaju ga ostale replike nakon upisa, izmjene ili brisanja korisnika);
+# unos u indeksu prijedloga osvježava se iz baze
+@app.delete("/users/cache/{user_id}", response_model=dict)
+async def invalidate_user_cache(user_id: str):
+    user_cache.invalidate(user_id)
+    user = await users_collection.find_one({"_id": ObjectId(user_id)}, {"username": 1, "email": 1})
+    if user is None:
+        suggest_index.remove(user_id)
+    else:
+        suggest_index.add(user_id, user)
+    return {"message": "User cache entry invalidated"}
+
+# Dohvaćanje korisnika prema ID-u; cijeli dokument se cacheira, a projekcija primjenjuje u memoriji
 @app.get("/users/{user_id}", response_model=User)
-async def get_user(user_id: str):
-    user = await users_collection.find_one({"_id": ObjectId(user_id)})
+async def get_user(user_id: str, fields: Optional[str] = None):
+    projection = build_projection(fields, User.__fields__)
+    user = user_cache.get(user_id)
     if user is None:
-        raise HTTPException(status_code=404, detail="User not found")
+        user = await users_collection.find_one(
+            {"_id": ObjectId(user_id)}, {field: 0 for field in INTERNAL_USER_FIELDS}
+        )
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        user_cache.set(user_id, user)
+    if projection is not None:
+        return JSONResponse(content=serialize_document(project_document(user, projection)))
     return user
 
 # Ažuriranje korisnika prema ID-u
 @app.put("/users/{user_id}", response_model=User)
 async def update_user(user_id: str, user: User):
     update_data = user.dict()
-    result = await users_collection.update_one({"_id": ObjectId(user_id)}, {"$set": update_data})
-    if result.modified_count == 0:
-        raise HTTPException(status_code=404, detail="User not found or no change detected")
-    return await get_user(user_id)
+    update_data.update(user_keys(user.username, user.email))
+    await check_unique_keys(update_data, ObjectId(user_id))
+    try:
+        updated_user = await users_collection.find_one_and_update(
+            {"_id": ObjectId(user_id)},
+            {"$set": update_data},
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError as e:
+        raise duplicate_user_error(e)
+    if updated_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    suggest_index.add(user_id, updated_user)
+    await invalidate_cached_user(user_id)
+    return updated_user
+
+# Obavještavanje task_worker-a da korisnik više ne postoji (TTL pokriva slučaj neuspjeha)
+async def invalidate_task_worker_cache(user_id: str):
+    try:
+        async with httpx.AsyncClient(timeout=cache_invalidation_timeout) as client:
+            response = await client.delete(f"http://{task_worker_host}:{task_worker_port}/cache/users/{user_id}")
+            response.raise_for_status()
+    except httpx.HTTPError as e:
+        logger.warning("Failed to invalidate task_worker user cache: %s", e)
+
+async def invalidate_peer_cache(client: httpx.AsyncClient, peer: str, user_id: str):
+    try:
+        response = await client.delete(f"http://{peer}/users/cache/{user_id}")
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        logger.warning("Failed to invalidate user cache on %s: %s", peer, e)
+
+# Lokalno poništavanje i obavještavanje ostalih replika (user_service_peers); TTL pokriva neuspjeh
+async def invalidate_cached_user(user_id: str):
+    user_cache.invalidate(user_id)
+    if not user_service_peers:
+        return
+    async with httpx.AsyncClient(timeout=cache_invalidation_timeout) as client:
+        await asyncio.gather(*(invalidate_peer_cache(client, peer, user_id) for peer in user_service_peers))
+
+# Posao je preuzela druga replika (ova se smatrala srušenom jer dulje nije javila napredak)
+class UserJobLost(Exception):
+    pass
+
+# Jedan blok kaskadnog brisanja: zadaci se brišu ili prebacuju na drugog korisnika (preko task_store
+# radi brojača i change_seq), zatim se brišu obavijesti. Vraća False kad više nema posla.
+async def run_user_job_step(job: dict) -> bool:
+    query = {"user_id": job["user_id"]}
+    if job.get("reassign_to"):
+        result = await update_tasks(query, {"user_id": job["reassign_to"]}, limit=user_job_chunk_size)
+        progress = {"tasks_reassigned": result.modified_count}
+    else:
+        progress = {"tasks_deleted": await delete_tasks(query, limit=user_job_chunk_size)}
+    if not any(progress.values()):
+        notification_ids = [
+            notification["_id"] async for notification in
+            notifications_collection.find(query, {"_id": 1}).limit(user_job_chunk_size)
+        ]
+        if not notification_ids:
+            return False
+        result = await notifications_collection.delete_many({"_id": {"$in": notification_ids}})
+        progress = {"notifications_deleted": result.deleted_count}
+    result = await user_jobs_collection.update_one(
+        {"_id": job["_id"], "owner": replica_id},
+        {"$inc": progress, "$set": {"updated_at": datetime.now(timezone.utc)}}
+    )
+    if result.matched_count == 0:
+        raise UserJobLost()
+    return True
+
+# Heartbeat vlasnika: updated_at se obnavlja i dok traje dugi blok, pa posao ne preuzima druga replika
+async def keep_user_job(job: dict):
+    while True:
+        await asyncio.sleep(user_job_stale_seconds / 3)
+        try:
+            await user_jobs_collection.update_one(
+                {"_id": job["_id"], "owner": replica_id, "status": "running"},
+                {"$set": {"updated_at": datetime.now(timezone.utc)}}
+            )
+        except Exception as e:
+            logger.warning("Failed to renew user job %s: %s", job["_id"], e)
+
+async def finish_user_job(job: dict, fields: dict):
+    await user_jobs_collection.update_one(
+        {"_id": job["_id"], "owner": replica_id},
+        {"$set": dict(fields, updated_at=datetime.now(timezone.utc))}
+    )
+
+# Posao se izvodi u blokovima i svaki blok bilježi napredak; upiti su prema user_id pa se
+# prekinuti posao može nastaviti od početka bez dvostruke obrade
+async def run_user_job(job: dict):
+    heartbeat = asyncio.create_task(keep_user_job(job))
+    try:
+        # Korisnik se briše nakon upisa posla; ako je replika pala između, brisanje se dovršava ovdje
+        await users_collection.delete_one({"_id": ObjectId(job["user_id"])})
+        while await run_user_job_step(job):
+            pass
+    except UserJobLost:
+        logger.warning("User job %s was taken over by another replica", job["_id"])
+        return
+    except Exception as e:
+        logger.error("User job %s failed: %s", job["_id"], e)
+        await finish_user_job(job, {"status": "failed", "error": str(e)})
+        return
+    finally:
+        heartbeat.cancel()
+    await finish_user_job(job, {"status": "completed"})
+    logger.info("User job %s completed", job["_id"])
+
+# Stanje posla kaskadnog brisanja korisnika
+@app.get("/users/jobs/{job_id}", response_model=dict)
+async def get_user_job(job_id: str):
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job id format")
+    job = await user_jobs_collection.find_one({"_id": ObjectId(job_id)})
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(content=serialize_document(job))
 
-# Brisanje korisnika prema ID-u
+# Brisanje korisnika prema ID-u; zadaci (brisanje ili reassign_to) i obavijesti uklanjaju se u pozadinskom poslu
 @app.delete("/users/{user_id}", response_model=dict)
-async def delete_user(user_id: str):
+async def delete_user(user_id: str, reassign_to: Optional[str] = None):
+    if reassign_to is not None:
+        if reassign_to == user_id or not ObjectId.is_valid(reassign_to):
+            raise HTTPException(status_code=400, detail="Invalid reassign_to user")
+        if await users_collection.find_one({"_id": ObjectId(reassign_to)}, {"_id": 1}) is None:
+            raise HTTPException(status_code=400, detail="Invalid reassign_to user")
+    if not ObjectId.is_valid(user_id) or await users_collection.find_one({"_id": ObjectId(user_id)}, {"_id": 1}) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    # Posao se upisuje prije brisanja korisnika, pa pad replike između ta dva koraka ne ostavlja
+    # obrisanog korisnika bez posla koji uklanja njegove zadatke (posao sam dovršava brisanje)
+    job = user_deletion_job(user_id, reassign_to, replica_id)
+    await user_jobs_collection.insert_one(job)
     result = await users_collection.delete_one({"_id": ObjectId(user_id)})
     if result.deleted_count == 0:
+        await user_jobs_collection.delete_one({"_id": job["_id"]})
         raise HTTPException(status_code=404, detail="User not found")
-    return {"message": "User deleted successfully"}
+    suggest_index.remove(user_id)
+    run_in_background(run_user_job(job))
+    await asyncio.gather(invalidate_cached_user(user_id), invalidate_task_worker_cache(user_id))
+    return {"message": "User deleted successfully", "job_id": str(job["_id"])}
 
 # Health check ruta
 @app.get("/health")
@@ -82,12 +380,69 @@ async def startup_db_client():
     try:
         # Test the connection
         await users_collection.find_one()
-        print("Connected to MongoDB successfully!")
+        logger.info("Connected to MongoDB successfully")
+    except Exception as e:
+        logger.error("Failed to connect to MongoDB: %s", e)
+
+async def load_suggest_index():
+    users = await users_collection.find({}, {"username": 1, "email": 1}).to_list(None)
+    suggest_index.load(users)
+
+# Periodično punjenje ispravlja propuštena obavještavanja između replika
+async def reload_suggest_index():
+    while True:
+        await asyncio.sleep(user_suggest_reload_interval)
+        try:
+            await load_suggest_index()
+        except Exception as e:
+            logger.error("Failed to reload user suggest index: %s", e)
+
+@app.on_event("startup")
+async def startup_suggest_index():
+    try:
+        await load_suggest_index()
     except Exception as e:
-        print(f"Failed to connect to MongoDB: {e}")
+        logger.error("Failed to load user suggest index: %s", e)
+    run_in_background(reload_suggest_index())
+
+# Nastavak poslova prekinutih gašenjem ili padom replike: posao čiji vlasnik dulje od
+# user_job_stale_seconds nije obnovio updated_at preuzima ova replika; preuzimanje uvjetovano
+# s updated_at sprječava da ga istodobno preuzme više replika
+async def resume_user_jobs():
+    stale_before = datetime.now(timezone.utc) - timedelta(seconds=user_job_stale_seconds)
+    async for job in user_jobs_collection.find({"status": "running", "updated_at": {"$lt": stale_before}}):
+        claimed = await user_jobs_collection.find_one_and_update(
+            {"_id": job["_id"], "status": "running", "updated_at": job["updated_at"]},
+            {"$set": {"owner": replica_id, "updated_at": datetime.now(timezone.utc)}},
+            return_document=ReturnDocument.AFTER
+        )
+        if claimed is not None:
+            logger.info("Resuming user job %s", claimed["_id"])
+            run_in_background(run_user_job(claimed))
+
+# Provjera se ponavlja jer replika može pasti i dok ostale rade, ne samo prije pokretanja
+async def resume_user_jobs_periodically():
+    while True:
+        try:
+            await resume_user_jobs()
+        except Exception as e:
+            logger.error("Failed to resume user jobs: %s", e)
+        await asyncio.sleep(user_job_stale_seconds / 2)
+
+@app.on_event("startup")
+async def startup_user_jobs():
+    run_in_background(resume_user_jobs_periodically())
+
+@app.on_event("startup")
+async def startup_user_indexes():
+    await ensure_user_indexes()
 
+@app.on_event("shutdown")
+async def shutdown_change_seq_writer():
+    await change_seq_writer.close()
 
 # Pokretanje aplikacije
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host=user_service_host, port=user_service_port)
\ No newline at end of file
+    # log_config=None: uvicorn ne postavlja vlastite handlere, zapisi idu kroz setup_logging
+    uvicorn.run(app, host=user_service_host, port=user_service_port, log_config=None)
\ No newline at end of file
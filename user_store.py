@@ -0,0 +1,68 @@
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import OperationFailure
+from database import users_collection
+from models import user_keys
+
+logger = logging.getLogger(__name__)
+
+# Normalizirani ključevi nad kojima su jedinstveni indeksi (ne vraćaju se klijentima)
+INTERNAL_USER_FIELDS = ["email_key", "username_key"]
+
+# Broj dokumenata po bulk_write pozivu kod naknadnog popunjavanja ključeva
+BACKFILL_BATCH_SIZE = 1000
+
+# Ključevi čiji jedinstveni indeks nije izgrađen (postojeći duplikati, vidi dedupe_users.py);
+# za njih se duplikati provjeravaju upitom prije upisa
+missing_unique_keys = set()
+
+# Popunjavanje ključeva za korisnike spremljene prije uvođenja jedinstvenih indeksa
+async def backfill_user_keys():
+    cursor = users_collection.find(
+        {"$or": [{"email_key": {"$exists": False}}, {"username_key": {"$exists": False}}]},
+        {"username": 1, "email": 1}
+    ).batch_size(BACKFILL_BATCH_SIZE)
+    operations = []
+    async for user in cursor:
+        keys = user_keys(user.get("username", ""), user.get("email", ""))
+        operations.append(UpdateOne({"_id": user["_id"]}, {"$set": keys}))
+        if len(operations) >= BACKFILL_BATCH_SIZE:
+            await users_collection.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        await users_collection.bulk_write(operations, ordered=False)
+
+# Vraća ključeve čiji indeks nije izgrađen; za njih create_user/update_user provjeravaju duplikate
+# upitom sve dok se duplikati ne razriješe (python dedupe_users.py) i servis ponovno pokrene
+async def ensure_user_indexes() -> List[str]:
+    await backfill_user_keys()
+    for field in INTERNAL_USER_FIELDS:
+        try:
+            await users_collection.create_index([(field, ASCENDING)], unique=True)
+            missing_unique_keys.discard(field)
+        except OperationFailure as e:
+            missing_unique_keys.add(field)
+            logger.error(
+                "Failed to create unique index on %s, falling back to duplicate checks before writes "
+                "(run dedupe_users.py to resolve existing duplicates): %s", field, e
+            )
+    return sorted(missing_unique_keys)
+
+# Posao uklanjanja zadataka (ili prebacivanja na reassign_to) i obavijesti obrisanog korisnika;
+# owner je replika user_servicea koja posao izvodi
+def user_deletion_job(user_id: str, reassign_to: Optional[str], owner: Optional[str]) -> dict:
+    now = datetime.now(timezone.utc)
+    return {
+        "type": "delete_user",
+        "user_id": user_id,
+        "reassign_to": reassign_to,
+        "status": "running",
+        "owner": owner,
+        "tasks_deleted": 0,
+        "tasks_reassigned": 0,
+        "notifications_deleted": 0,
+        "created_at": now,
+        "updated_at": now
+    }